@@ -0,0 +1,97 @@
+# utils/accessibility.py
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.projection import to_wgs84
+
+# 4.8 km/h
+WALK_SPEED_M_PER_MIN = float(os.environ.get("WALK_SPEED_M_PER_MIN", 80.0))
+ISOCHRONE_MINUTES = (5, 10, 15)
+# reachable POIs at which the access component saturates at 1.0
+ACCESS_POI_SATURATION = 50
+# cap on the (sources x nodes) distance block held in memory per csgraph call
+CHUNK_BYTES = int(float(os.environ.get("WALK_ACCESS_CHUNK_MB", 64)) * 1024 * 1024)
+
+
+def _nearest_nodes(graph, lat, lon):
+    """Nearest graph node (position) for many points at once, via a KD-tree on an equirectangular plane."""
+    from scipy.spatial import cKDTree
+
+    lat0 = np.radians(np.mean(graph.lat))
+    node_xy = np.column_stack([graph.lon * np.cos(lat0), graph.lat])
+    _, idx = cKDTree(node_xy).query(np.column_stack([np.asarray(lon) * np.cos(lat0), np.asarray(lat)]))
+    return idx
+
+
+def block_accessibility(graph, blocks_gdf, pois_gdf=None, minutes=ISOCHRONE_MINUTES,
+                        speed_m_per_min=WALK_SPEED_M_PER_MIN, with_isochrones=False):
+    """
+    Walk-time reachability for every block in one batched pass.
+
+    Each block centroid snaps to its nearest node; multi-source Dijkstra
+    (scipy.sparse.csgraph, bounded at the largest threshold) runs from all of
+    them in memory-capped chunks. For every threshold the result holds the
+    number of reachable nodes and POIs per block, plus an `access_score` in
+    [0, 1] for compute_walkability. with_isochrones=True adds the convex hull
+    of the nodes reachable within the largest threshold as `isochrone`.
+    """
+    import shapely
+    from scipy.sparse.csgraph import dijkstra
+
+    minutes = tuple(sorted(minutes))
+    limits = np.array(minutes, dtype=float) * speed_m_per_min
+    n_blocks = len(blocks_gdf)
+    result = pd.DataFrame(index=blocks_gdf.index)
+    if n_blocks == 0 or graph.n_nodes == 0:
+        for m in minutes:
+            result[f"reach_nodes_{m}min"] = 0
+            result[f"reach_pois_{m}min"] = 0
+        result["access_score"] = 0.0
+        return result
+
+    centroids = to_wgs84(blocks_gdf.geometry.representative_point())
+    block_nodes = _nearest_nodes(graph, centroids.y.to_numpy(), centroids.x.to_numpy())
+
+    # POIs per node
+    poi_per_node = np.zeros(graph.n_nodes)
+    if pois_gdf is not None and len(pois_gdf) > 0:
+        poi_points = to_wgs84(pois_gdf.geometry.representative_point())
+        poi_nodes = _nearest_nodes(graph, poi_points.y.to_numpy(), poi_points.x.to_numpy())
+        poi_per_node = np.bincount(poi_nodes, minlength=graph.n_nodes).astype(float)
+
+    # one search per distinct source node, however many blocks share it
+    sources, block_source = np.unique(block_nodes, return_inverse=True)
+    reach_nodes = np.zeros((len(sources), len(minutes)), dtype=np.int64)
+    reach_pois = np.zeros((len(sources), len(minutes)))
+    hulls = np.empty(len(sources), dtype=object) if with_isochrones else None
+
+    csr = graph.to_csr("length")
+    chunk = max(1, CHUNK_BYTES // (8 * graph.n_nodes))
+    for start in range(0, len(sources), chunk):
+        rows = slice(start, start + chunk)
+        dist = dijkstra(csr, directed=False, indices=sources[rows], limit=limits[-1])
+        for j, limit in enumerate(limits):
+            reach = dist <= limit
+            reach_nodes[rows, j] = reach.sum(axis=1)
+            reach_pois[rows, j] = reach @ poi_per_node
+
+        if with_isochrones:
+            row_idx, node_idx = np.nonzero(dist <= limits[-1])
+            points = shapely.points(graph.lon[node_idx], graph.lat[node_idx])
+            # every source reaches itself, so each row gets a hull
+            hulls[rows] = shapely.convex_hull(shapely.multipoints(points, indices=row_idx))
+
+    for j, m in enumerate(minutes):
+        result[f"reach_nodes_{m}min"] = reach_nodes[block_source, j]
+        result[f"reach_pois_{m}min"] = reach_pois[block_source, j].astype(int)
+    result["access_score"] = access_score(result[f"reach_pois_{minutes[-1]}min"].to_numpy())
+    if with_isochrones:
+        result["isochrone"] = hulls[block_source]
+    return result
+
+
+def access_score(reachable_pois):
+    """Log-scaled 0–1 accessibility from reachable POI counts (saturates at ACCESS_POI_SATURATION)."""
+    return np.clip(np.log1p(np.asarray(reachable_pois, dtype=float)) / np.log1p(ACCESS_POI_SATURATION), 0, 1)
@@ -0,0 +1,366 @@
+# utils/area_store.py
+"""
+Memory-mapped store of analysed areas, shared by every server worker.
+
+Each entry is a directory of .npy files plus a meta.json. It holds the
+area's CompactGraph arrays (node ids and coordinates, CSR adjacency, edge
+attributes), its scored blocks (geometries as one WKB byte buffer with
+offsets, one array per numeric column), the layers' CRS and the analysis
+version. Entries are written once, atomically, by whichever worker scores
+the area first. Every other worker (and every worker started later) attaches
+them with np.load(mmap_mode="r"). The arrays are then pages of the same
+file in the OS page cache, not per-process copies, so the scored blocks and
+graph arrays stay flat as workers are added. Only the block geometries are
+decoded per process (GEOS objects cannot be shared). The extract itself is
+not shared: a worker still reads its nodes / edges / POIs from the OSM cache
+and projects them, since the later stages need them.
+
+Entries are keyed by the extract's OSM cache key (utils.data_fetch.extract_key)
+plus utils.result_cache.analysis_version(), so a worker can attach an area
+before fetching it and reuse the stored CompactGraph for the fetch. Each entry
+also records a fingerprint of the extract it was scored from (node ids, edge
+index and lengths, POI ids, tags and geometries, CRS); its blocks are only
+used for an extract with the same fingerprint, so a refreshed OSM extract is
+rescored and replaces the entry. The least recently attached entries are
+evicted once the store outgrows max_bytes.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import fields
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from utils.compact_graph import GEOMETRY_STORED, CompactGraph
+from utils.instrumentation import get_logger
+from utils.osm_cache import CACHE_DIR
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+AREA_STORE_DIR = os.environ.get("WALK_AREA_STORE_DIR", os.path.join(CACHE_DIR, "areas"))
+AREA_STORE_MAX_BYTES = int(float(os.environ.get("WALK_AREA_STORE_MAX_MB", 1024)) * 1024 * 1024)
+# attached entries kept open per process (their arrays are shared, their decoded geometries are not)
+AREA_MEMORY_SLOTS = int(os.environ.get("WALK_AREA_MEMORY_SLOTS", 16))
+
+# bump whenever the stored layout changes
+AREA_STORE_VERSION = 3
+
+GRAPH_FIELDS = tuple(f.name for f in fields(CompactGraph))
+
+# edge columns scoring reads: the raw walk tags and the attributes derived from them
+FINGERPRINT_EDGE_COLUMNS = ("highway", "sidewalk", "sidewalk:left", "sidewalk:right", "footway", "crossing",
+                            "lit", "surface", "has_sidewalk", "walk_class", "is_crossing", "is_lit",
+                            "surface_class", GEOMETRY_STORED)
+
+
+def area_fingerprint(nodes_gdf, edges_gdf, pois_gdf=None):
+    """
+    Stable hash of an extract: node ids, edge index, lengths and walk
+    attributes (tags, derived classes, geometry_stored), POI ids, tags and
+    geometries, CRS.
+    """
+    h = hashlib.sha1()
+    h.update(str(edges_gdf.crs).encode("utf-8"))
+    h.update(np.ascontiguousarray(nodes_gdf.index.to_numpy(dtype=np.int64)).tobytes())
+    for level in range(edges_gdf.index.nlevels):
+        h.update(np.ascontiguousarray(edges_gdf.index.get_level_values(level).to_numpy(dtype=np.int64)).tobytes())
+    if "length" in edges_gdf.columns:
+        h.update(np.ascontiguousarray(edges_gdf["length"].to_numpy(dtype=np.float64)).tobytes())
+    columns = [c for c in FINGERPRINT_EDGE_COLUMNS if c in edges_gdf.columns]
+    if columns:
+        # tag values may be lists (or NaN); their text form hashes the same in every process
+        h.update(",".join(columns).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(edges_gdf[columns].astype(str), index=False).to_numpy().tobytes())
+    if pois_gdf is not None and len(pois_gdf):
+        tags = pois_gdf.drop(columns=pois_gdf.geometry.name).astype(str)
+        h.update(",".join(map(str, tags.columns)).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(tags, index=True).to_numpy().tobytes())
+        h.update(b"".join(shapely.to_wkb(pois_gdf.geometry.to_numpy())))
+    return h.hexdigest()[:24]
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except OSError:
+        return None
+
+
+class AreaEntry:
+    """
+    An attached store entry. Every array is mapped when the entry is opened,
+    so it keeps reading from those mappings even if the directory is evicted
+    afterwards; the blocks are decoded from them lazily, once.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self._lock = threading.Lock()
+        self._blocks = None
+        # identifies this copy of the directory: a replaced entry is a new directory
+        self.inode = os.stat(path).st_ino
+        self._arrays = {name[:-len(".npy")]: np.load(os.path.join(path, name), mmap_mode="r", allow_pickle=False)
+                        for name in os.listdir(path) if name.endswith(".npy")}
+        # the area's CompactGraph; every array is a read-only view of the shared file
+        self.graph = (CompactGraph(**{name: self._array(f"graph.{name}") for name in GRAPH_FIELDS})
+                      if meta["graph"] else None)
+
+    def _array(self, name):
+        return self._arrays[name]
+
+    def matches(self, nodes_gdf, edges_gdf, pois_gdf=None):
+        """Whether this entry was scored from exactly this extract."""
+        return self.meta.get("fingerprint") == area_fingerprint(nodes_gdf, edges_gdf, pois_gdf)
+
+    @property
+    def blocks(self):
+        """Scored blocks GeoDataFrame (a fresh shallow copy per call, so callers may add columns)."""
+        with self._lock:
+            if self._blocks is None:
+                wkb, offsets = self._array("blocks.wkb"), self._array("blocks.offsets")
+                buffer = wkb.tobytes()
+                geoms = shapely.from_wkb([buffer[a:b] for a, b in zip(offsets[:-1], offsets[1:])])
+                columns = {col: self._array(f"blocks.col{i}") for i, col in enumerate(self.meta["columns"])}
+                index = pd.Index(self._array("blocks.index"), name=self.meta["index_name"])
+                self._blocks = gpd.GeoDataFrame(columns, index=index,
+                                                geometry=gpd.GeoSeries(geoms, index=index, crs=self.meta["crs"]))
+            return self._blocks.copy(deep=False)
+
+    @property
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, f)) for f in os.listdir(self.path))
+
+
+class AreaStore:
+    """
+    Directory of analysed areas (root/<digest>/). save() writes an entry
+    once; attach() maps it, keeping up to `memory_slots` entries open per
+    process.
+    """
+
+    def __init__(self, root=AREA_STORE_DIR, max_bytes=AREA_STORE_MAX_BYTES, memory_slots=AREA_MEMORY_SLOTS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.memory_slots = memory_slots
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _entry_dir(self, key, version):
+        digest = hashlib.sha1(f"v{AREA_STORE_VERSION}|{key}|{version}".encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.root, digest)
+
+    def _forget(self, path):
+        with self._lock:
+            self._memory.pop(path, None)
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    def attach(self, key, version=""):
+        """
+        The AreaEntry stored for an extract key and analysis version, or None.
+        Check entry.matches(...) against the fetched extract before using it.
+        """
+        path = self._entry_dir(key, version)
+        meta_path = os.path.join(path, "meta.json")
+        with self._lock:
+            entry = self._memory.get(path)
+            if entry is not None:
+                self._memory.move_to_end(path)
+        if entry is not None and (not os.path.isfile(meta_path) or _inode(path) != entry.inode):
+            # evicted (or replaced) by another worker since it was opened here
+            self._forget(path)
+            entry = None
+        if entry is None:
+            if not os.path.isfile(meta_path):
+                self._count("misses")
+                return None
+            try:
+                with open(meta_path, "r", encoding="utf-8") as fh:
+                    entry = AreaEntry(path, json.load(fh))
+            except FileNotFoundError:
+                # evicted between the check and the mapping
+                self._count("misses")
+                return None
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.warning("⚠️ Area store entry %s unreadable: %s", path, e)
+                self._count("errors")
+                return None
+            with self._lock:
+                self._memory[path] = entry
+                while len(self._memory) > self.memory_slots:
+                    self._memory.popitem(last=False)
+            try:
+                # meta.json mtime is the eviction clock
+                os.utime(meta_path, None)
+            except OSError:
+                pass
+        self._count("hits")
+        return entry
+
+    def save(self, key, nodes_gdf, edges_gdf, pois_gdf, blocks_gdf, graph=None, version=""):
+        """
+        Write an area's scored blocks (and CompactGraph) once. An entry for the
+        same extract is kept as it is; one scored from an older extract under
+        the same key is replaced.
+        """
+        final = self._entry_dir(key, version)
+        fingerprint = area_fingerprint(nodes_gdf, edges_gdf, pois_gdf)
+        stale = False
+        try:
+            with open(os.path.join(final, "meta.json"), "r", encoding="utf-8") as fh:
+                if json.load(fh).get("fingerprint") == fingerprint:
+                    return
+            stale = True
+        except (OSError, ValueError):
+            pass
+        columns = [c for c in blocks_gdf.columns if c != blocks_gdf.geometry.name]
+        numeric = [c for c in columns if pd.api.types.is_numeric_dtype(blocks_gdf[c]) or
+                   pd.api.types.is_bool_dtype(blocks_gdf[c])]
+        if blocks_gdf.index.dtype == object:
+            log.info("ℹ️ Blocks have an object index; area not stored")
+            return
+        if len(numeric) < len(columns):
+            log.info("ℹ️ Blocks carry non-numeric columns (%s); area not stored",
+                     ", ".join(sorted(set(columns) - set(numeric))))
+            return
+
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        try:
+            os.makedirs(tmp)
+            if isinstance(graph, CompactGraph):
+                for name in GRAPH_FIELDS:
+                    np.save(os.path.join(tmp, f"graph.{name}.npy"), np.ascontiguousarray(getattr(graph, name)))
+            wkb = shapely.to_wkb(blocks_gdf.geometry.to_numpy())
+            offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in wkb], out=offsets[1:])
+            np.save(os.path.join(tmp, "blocks.wkb.npy"), np.frombuffer(b"".join(wkb), dtype=np.uint8))
+            np.save(os.path.join(tmp, "blocks.offsets.npy"), offsets)
+            np.save(os.path.join(tmp, "blocks.index.npy"), blocks_gdf.index.to_numpy())
+            for i, col in enumerate(columns):
+                np.save(os.path.join(tmp, f"blocks.col{i}.npy"), blocks_gdf[col].to_numpy())
+            meta = {
+                "version": AREA_STORE_VERSION,
+                "analysis_version": version,
+                "key": key,
+                "fingerprint": fingerprint,
+                "created": time.time(),
+                "crs": None if blocks_gdf.crs is None else blocks_gdf.crs.to_wkt(),
+                "columns": columns,
+                "index_name": blocks_gdf.index.name,
+                "graph": isinstance(graph, CompactGraph),
+                "counts": {"blocks": len(blocks_gdf), "nodes": len(nodes_gdf), "edges": len(edges_gdf)},
+            }
+            # meta.json last: an entry without it is never attached
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+                json.dump(meta, fh)
+            if stale:
+                # swap out the older extract's entry; workers that mapped it keep their mappings
+                aside = os.path.join(self.root, f".old-{uuid.uuid4().hex}")
+                try:
+                    os.rename(final, aside)
+                except OSError:
+                    aside = None
+                self._forget(final)
+                os.replace(tmp, final)
+                if aside is not None:
+                    shutil.rmtree(aside, ignore_errors=True)
+            else:
+                os.replace(tmp, final)
+        except OSError as e:
+            # another worker stored the same area first (final exists) or the disk refused
+            if not os.path.isfile(os.path.join(final, "meta.json")):
+                log.warning("⚠️ Could not store area %s: %s", final, e)
+                self._count("errors")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        except Exception as e:
+            log.warning("⚠️ Could not store area %s: %s", final, e)
+            self._count("errors")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self._count("writes")
+        self.evict()
+
+    # ----------------------------
+    # Bookkeeping
+    # ----------------------------
+    def _entries(self):
+        """[(path, last_attach, size_bytes)] for every complete entry."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            meta = os.path.join(path, "meta.json")
+            if name.startswith(".") or not os.path.isfile(meta):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((path, os.path.getmtime(meta), size))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Drop least-recently-attached entries until the store fits in max_bytes.
+        Workers that have one mapped keep reading it (the files stay alive
+        until unmapped); later attaches miss and re-store it.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            self._forget(path)
+            total -= size
+            self._count("evictions")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["attached"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        entries = self._entries()
+        stats["entries"] = len(entries)
+        stats["size_bytes"] = sum(size for _, _, size in entries)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_area_store():
+    """Process-wide AreaStore configured from the WALK_AREA_* env vars."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AreaStore()
+        return _store
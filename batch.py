@@ -0,0 +1,336 @@
+# batch.py
+"""
+Precompute walkability for many areas at once, sharded across a process pool.
+
+    python batch.py --places places.txt --out runs/bangalore
+    python batch.py --bbox 77.55,12.90,77.70,13.05 --cell-m 2000 --out runs/bangalore --workers 8
+    python batch.py --bbox ... --osm-file karnataka.osm.pbf --out runs/offline
+
+Each shard (one place, or one grid cell) runs fetch → extract_features →
+compute_walkability → generate_recommendations and writes
+<out>/blocks/<shard>.parquet and <out>/recommendations/<shard>.parquet
+(GeoParquet) as soon as it finishes. <out>/manifest.json records every
+finished shard, so re-running the same command skips them (--force redoes
+everything). Grid cells are fetched with a --seam-m margin and keep only
+blocks whose centroid falls inside the cell itself, so a block spanning a
+seam is written exactly once, by the cell that owns its centroid.
+
+    python batch.py --out runs/bangalore --rescore --weights 0.3,0.3,0.2,0.2
+
+re-weights every finished shard from the feature columns stored with its
+blocks (see utils/scoring.py) without fetching or extracting anything.
+"""
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+STAGES = ("fetch", "extract", "score", "recommend", "write")
+MANIFEST_VERSION = 1
+METRES_PER_DEGREE = 111_320
+
+
+# ----------------------------
+# Shards
+# ----------------------------
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:80] or "place"
+
+
+def place_shards(places):
+    return [{"id": f"place-{_slug(p)}", "kind": "place", "place": p} for p in places]
+
+
+def grid_shards(west, south, east, north, cell_m, seam_m):
+    """Cells of ~cell_m covering the bbox; each is fetched as a point window with a seam_m margin."""
+    lat_mid = (south + north) / 2
+    dlat = cell_m / METRES_PER_DEGREE
+    dlon = cell_m / (METRES_PER_DEGREE * math.cos(math.radians(lat_mid)))
+    rows = max(1, math.ceil((north - south) / dlat))
+    cols = max(1, math.ceil((east - west) / dlon))
+
+    shards = []
+    for r in range(rows):
+        for c in range(cols):
+            core = (west + c * dlon, south + r * dlat, min(west + (c + 1) * dlon, east), min(south + (r + 1) * dlat, north))
+            shards.append({
+                "id": f"cell-{r:03d}-{c:03d}",
+                "kind": "cell",
+                "core": core,
+                "lat": (core[1] + core[3]) / 2,
+                "lon": (core[0] + core[2]) / 2,
+                # point windows are squares: half the cell plus the seam margin
+                "dist_m": int(cell_m / 2 + seam_m),
+            })
+    return shards
+
+
+def _in_core(blocks, core):
+    """Blocks whose centroid lies in the half-open core cell [west, east) x [south, north)."""
+    from utils.projection import to_wgs84
+
+    centroids = to_wgs84(blocks.geometry.centroid)
+    west, south, east, north = core
+    return ((centroids.x >= west) & (centroids.x < east) & (centroids.y >= south) & (centroids.y < north)).to_numpy()
+
+
+# ----------------------------
+# Worker
+# ----------------------------
+def _write_parquet(gdf, path):
+    tmp = f"{path}.tmp"
+    gdf.to_parquet(tmp)
+    os.replace(tmp, path)
+
+
+def run_shard(shard, out_dir, osm_file=None):
+    """Pool entry point: score one shard and write its GeoParquet files. Returns its manifest record."""
+    from utils.data_fetch import fetch_osm_data
+    from utils.feature_extract import extract_features
+    from utils.projection import area_crs, project_layers, to_wgs84
+    from utils.recommendations import generate_recommendations
+    from utils.scoring import compute_walkability
+
+    timings = {}
+    started = time.perf_counter()
+    log_path = os.path.join(out_dir, "logs", f"{shard['id']}.log")
+
+    def lap(stage, t0):
+        timings[stage] = round(time.perf_counter() - t0, 3)
+        return time.perf_counter()
+
+    # the pipeline is chatty; keep each shard's output in its own log
+    with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log):
+        t = time.perf_counter()
+        if shard["kind"] == "cell":
+            G, nodes, edges, pois = fetch_osm_data(shard["id"], point=(shard["lat"], shard["lon"]),
+                                                   dist_m=shard["dist_m"], compact=True, osm_file=osm_file)
+        else:
+            G, nodes, edges, pois = fetch_osm_data(shard["place"], compact=True, osm_file=osm_file)
+        if edges is None or len(edges) == 0:
+            raise RuntimeError("no walk network")
+        # one projection to the shard's UTM zone; outputs go back to WGS84 so shards merge
+        nodes, edges, pois = project_layers(area_crs(edges), nodes, edges, pois)
+        t = lap("fetch", t)
+
+        blocks, edges, nodes = extract_features(nodes, edges, pois, G)
+        t = lap("extract", t)
+
+        blocks = compute_walkability(blocks, edges)
+        seam_dropped = 0
+        if shard["kind"] == "cell" and len(blocks):
+            keep = _in_core(blocks, shard["core"])
+            seam_dropped = int((~keep).sum())
+            blocks = blocks[keep]
+        t = lap("score", t)
+
+        recs = generate_recommendations(blocks, edges, nodes, G)
+        t = lap("recommend", t)
+
+        blocks, recs = to_wgs84(blocks).assign(shard=shard["id"]), to_wgs84(recs)
+        _write_parquet(blocks, os.path.join(out_dir, "blocks", f"{shard['id']}.parquet"))
+        if len(recs):
+            _write_parquet(recs.assign(shard=shard["id"]), os.path.join(out_dir, "recommendations", f"{shard['id']}.parquet"))
+        lap("write", t)
+
+    return {
+        "status": "done",
+        "blocks": int(len(blocks)),
+        "recommendations": int(len(recs)),
+        "seam_dropped": seam_dropped,
+        "timings": timings,
+        "total_s": round(time.perf_counter() - started, 3),
+        "finished": time.time(),
+    }
+
+
+# ----------------------------
+# Manifest
+# ----------------------------
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, "manifest.json")
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    return {"version": MANIFEST_VERSION, "shards": {}}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, "manifest.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def _is_done(out_dir, shard_id, record):
+    return (record or {}).get("status") == "done" and os.path.isfile(os.path.join(out_dir, "blocks", f"{shard_id}.parquet"))
+
+
+# ----------------------------
+# Report
+# ----------------------------
+def timing_report(manifest, shard_ids):
+    """Per-shard stage timings plus totals, as printable text."""
+    header = f"{'shard':<28}{'status':<8}{'blocks':>7}" + "".join(f"{s:>10}" for s in STAGES) + f"{'total':>10}"
+    lines = [header, "-" * len(header)]
+    totals = dict.fromkeys(STAGES, 0.0)
+    done = failed = 0
+    for shard_id in shard_ids:
+        rec = manifest["shards"].get(shard_id, {})
+        status = rec.get("status", "-")
+        timings = rec.get("timings", {})
+        for s in STAGES:
+            totals[s] += timings.get(s, 0.0)
+        done += status == "done"
+        failed += status == "failed"
+        lines.append(
+            f"{shard_id:<28}{status:<8}{rec.get('blocks', 0):>7}"
+            + "".join(f"{timings.get(s, 0.0):>10.2f}" for s in STAGES)
+            + f"{rec.get('total_s', 0.0):>10.2f}"
+        )
+    lines.append("-" * len(header))
+    lines.append(f"{'all':<28}{'':<8}{'':>7}" + "".join(f"{totals[s]:>10.2f}" for s in STAGES)
+                 + f"{sum(totals.values()):>10.2f}")
+    lines.append(f"{done} done, {failed} failed, {len(shard_ids) - done - failed} pending")
+    return "\n".join(lines)
+
+
+def rescore_outputs(out_dir, shard_ids, weights):
+    """Re-weight finished shards in place from their stored feature columns."""
+    import geopandas as gpd
+
+    from utils.scoring import FEATURES, rescore_blocks
+
+    rescored = 0
+    for shard_id in shard_ids:
+        path = os.path.join(out_dir, "blocks", f"{shard_id}.parquet")
+        if not os.path.isfile(path):
+            continue
+        blocks = gpd.read_parquet(path)
+        if not set(FEATURES).issubset(blocks.columns):
+            print(f"⚠️ {shard_id}: no stored features, re-run it with --force")
+            continue
+        _write_parquet(rescore_blocks(blocks, weights), path)
+        rescored += 1
+    return rescored
+
+
+def merge_outputs(out_dir, shard_ids):
+    """Concatenate finished shards into <out>/blocks.parquet."""
+    import geopandas as gpd
+    import pandas as pd
+
+    frames = [gpd.read_parquet(os.path.join(out_dir, "blocks", f"{s}.parquet")) for s in shard_ids
+              if os.path.isfile(os.path.join(out_dir, "blocks", f"{s}.parquet"))]
+    if not frames:
+        return None
+    merged = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), geometry="geometry", crs=frames[0].crs)
+    path = os.path.join(out_dir, "blocks.parquet")
+    _write_parquet(merged, path)
+    return path
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--places", help="text file with one place name per line")
+    source.add_argument("--bbox", help="west,south,east,north in degrees, split into --cell-m cells")
+    parser.add_argument("--cell-m", type=int, default=2000, help="grid cell size in metres")
+    parser.add_argument("--seam-m", type=int, default=300, help="extra fetch margin around each cell")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="0 runs shards in-process")
+    parser.add_argument("--osm-file", help="local .osm/.osm.pbf extract instead of Overpass")
+    parser.add_argument("--force", action="store_true", help="redo shards already in the manifest")
+    parser.add_argument("--merge", action="store_true", help="also write <out>/blocks.parquet")
+    parser.add_argument("--rescore", action="store_true", help="only re-weight finished shards (see --weights)")
+    parser.add_argument("--weights", help="density,intersection,coverage,amenity weights for --rescore")
+    args = parser.parse_args(argv)
+
+    if args.rescore:
+        from utils.scoring import WEIGHTS
+
+        weights = tuple(float(w) for w in args.weights.split(",")) if args.weights else WEIGHTS
+        if len(weights) != len(WEIGHTS):
+            parser.error(f"--weights needs {len(WEIGHTS)} comma-separated values")
+        manifest = load_manifest(args.out)
+        shard_ids = [s for s, rec in manifest["shards"].items() if rec.get("status") == "done"]
+        started = time.perf_counter()
+        count = rescore_outputs(args.out, shard_ids, weights)
+        print(f"🔁 Rescored {count} shards with weights {weights} in {time.perf_counter() - started:.1f}s")
+        if args.merge:
+            merge_outputs(args.out, shard_ids)
+        return 0
+    if not (args.places or args.bbox):
+        parser.error("one of --places / --bbox is required")
+
+    if args.places:
+        with open(args.places, "r", encoding="utf-8") as fh:
+            places = [line.strip() for line in fh if line.strip() and not line.startswith("#")]
+        shards = place_shards(places)
+    else:
+        west, south, east, north = (float(v) for v in args.bbox.split(","))
+        shards = grid_shards(west, south, east, north, args.cell_m, args.seam_m)
+
+    out_dir = args.out
+    for sub in ("blocks", "recommendations", "logs"):
+        os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+
+    manifest = load_manifest(out_dir)
+    shard_ids = [s["id"] for s in shards]
+    todo = [s for s in shards if args.force or not _is_done(out_dir, s["id"], manifest["shards"].get(s["id"]))]
+    print(f"🗂️  {len(shards)} shards, {len(shards) - len(todo)} already done, {len(todo)} to run")
+
+    def record(shard, result):
+        manifest["shards"][shard["id"]] = result
+        save_manifest(out_dir, manifest)
+        if result["status"] == "done":
+            print(f"✅ {shard['id']}: {result['blocks']} blocks in {result['total_s']:.1f}s")
+        else:
+            print(f"❌ {shard['id']}: {result['error']}")
+
+    def failed(e):
+        return {"status": "failed", "error": str(e), "traceback": traceback.format_exc(), "finished": time.time()}
+
+    started = time.perf_counter()
+    if args.workers <= 0:
+        for shard in todo:
+            try:
+                record(shard, run_shard(shard, out_dir, args.osm_file))
+            except Exception as e:
+                record(shard, failed(e))
+    elif todo:
+        # spawn: the pipeline's native libraries are not fork-safe once loaded
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(run_shard, shard, out_dir, args.osm_file): shard for shard in todo}
+            for fut in as_completed(futures):
+                try:
+                    record(futures[fut], fut.result())
+                except Exception as e:
+                    record(futures[fut], failed(e))
+
+    print()
+    print(timing_report(manifest, shard_ids))
+    print(f"⏱️  wall time {time.perf_counter() - started:.1f}s")
+
+    if args.merge:
+        path = merge_outputs(out_dir, shard_ids)
+        if path:
+            print(f"📦 Merged blocks → {path}")
+
+    return 0 if all(_is_done(out_dir, s, manifest["shards"].get(s)) for s in shard_ids) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+# benchmarks/bench_extract.py
+"""
+Time extract_features in "components" vs "vectorized" mode.
+
+    python -m benchmarks.bench_extract                       # synthetic dense, fragmented lattice
+    python -m benchmarks.bench_extract --size 200 --drop 0.55 --workers 4
+    python -m benchmarks.bench_extract --location "Indiranagar, Bangalore"
+
+Both modes must produce the same blocks; the script checks total area and
+block count before reporting the speedup.
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import networkx as nx
+import numpy as np
+from shapely.geometry import LineString
+
+from utils.feature_extract import extract_features
+
+
+def synthetic_extract(size=120, drop=0.6, step_deg=0.0004, seed=0):
+    """
+    A size x size street lattice with a fraction `drop` of segments removed,
+    which leaves thousands of small components like a fragmented OSM walk network.
+    """
+    import osmnx as ox
+
+    rng = np.random.default_rng(seed)
+    G = nx.MultiDiGraph(crs="EPSG:4326")
+    lat0, lon0 = 12.97, 77.59
+    for i in range(size):
+        for j in range(size):
+            G.add_node(i * size + j, x=lon0 + j * step_deg, y=lat0 + i * step_deg)
+
+    for i in range(size):
+        for j in range(size):
+            for di, dj in ((0, 1), (1, 0)):
+                a, b = i + di, j + dj
+                if a >= size or b >= size or rng.random() < drop:
+                    continue
+                u, v = i * size + j, a * size + b
+                pu = (G.nodes[u]["x"], G.nodes[u]["y"])
+                pv = (G.nodes[v]["x"], G.nodes[v]["y"])
+                G.add_edge(u, v, length=step_deg * 111_000, geometry=LineString([pu, pv]))
+                G.add_edge(v, u, length=step_deg * 111_000, geometry=LineString([pv, pu]))
+
+    nodes, edges = ox.graph_to_gdfs(G)
+    return G, nodes, edges
+
+
+def _time(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--location", help="benchmark on a real (cached) OSM extract instead")
+    parser.add_argument("--size", type=int, default=120)
+    parser.add_argument("--drop", type=float, default=0.6)
+    parser.add_argument("--workers", type=int, default=0, help="process pool for large-component unions")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.location:
+        from utils.data_fetch import fetch_osm_data
+        G, nodes, edges, _ = fetch_osm_data(args.location)
+    else:
+        G, nodes, edges = synthetic_extract(args.size, args.drop)
+    print(f"extract: nodes={len(nodes)}, edges={len(edges)}")
+
+    # compared at full resolution: outline simplification depends on vertex order
+    t_old, old = _time(lambda: extract_features(nodes, edges, None, G, mode="components",
+                                                simplify_m=0, precision_m=0)[0], args.repeat)
+    t_new, new = _time(lambda: extract_features(nodes, edges, None, G, mode="vectorized", union_workers=args.workers,
+                                                simplify_m=0, precision_m=0)[0], args.repeat)
+
+    old_area = old.to_crs(epsg=3857).area.sum()
+    new_area = new.to_crs(epsg=3857).area.sum()
+    assert len(old) == len(new), f"block count differs: {len(old)} vs {len(new)}"
+    assert abs(old_area - new_area) <= 1e-6 * max(old_area, 1), f"block area differs: {old_area} vs {new_area}"
+
+    print(f"blocks={len(new)}  total_area={new_area:,.0f} m²")
+    print(f"components : {t_old * 1000:9.1f} ms")
+    print(f"vectorized : {t_new * 1000:9.1f} ms")
+    print(f"speedup    : {t_old / t_new:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# benchmarks/bench_pipeline.py
+"""
+Offline, reproducible pipeline benchmark on the recorded fixtures in
+benchmarks/fixtures/ (see benchmarks/make_fixtures.py).
+
+    python -m benchmarks.bench_pipeline                      # all fixtures, report to stdout
+    python -m benchmarks.bench_pipeline --fixture small --fixture medium --repeat 5
+    python -m benchmarks.bench_pipeline --out before.json
+    python -m benchmarks.bench_pipeline --baseline before.json --max-slowdown 0.2
+
+Each fixture runs in a fresh spawned process (so peak memory is its own)
+with the OSM cache pointed at a copy of the fixture in offline mode. It
+times every pipeline stage of analyze_point through the instrumentation
+spans (wall, CPU, resident memory) and the end-to-end POST /analyze handler
+through FastAPI's TestClient. The JSON report can be compared against a
+baseline report; the exit status is 1 when a stage or the HTTP round trip
+got slower, or peak memory grew, beyond the thresholds.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+REPORT_SCHEMA = 1
+
+# regression thresholds (overridable on the command line)
+MAX_SLOWDOWN = 0.25        # +25 % median wall time
+MAX_MEMORY_GROWTH = 0.20   # +20 % peak RSS
+MIN_DELTA_S = 0.02         # ignore differences smaller than this (timer noise on tiny stages)
+
+
+def available_fixtures():
+    if not os.path.isdir(FIXTURE_DIR):
+        return []
+    names = [n for n in os.listdir(FIXTURE_DIR) if os.path.isfile(os.path.join(FIXTURE_DIR, n, "meta.json"))]
+    # smallest first
+    return sorted(names, key=lambda n: os.path.getsize(os.path.join(FIXTURE_DIR, n, "edges.parquet")))
+
+
+def _summary(values):
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+
+def _mb(n):
+    return None if n is None else round(n / 1e6, 1)
+
+
+# ----------------------------
+# One fixture, inside its own process
+# ----------------------------
+def _bench_fixture(name, repeat, warmup, http):
+    work = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    # the utils modules read their configuration at import time
+    os.environ.update({
+        "WALK_OSM_CACHE_DIR": os.path.join(work, "osm"),
+        "WALK_OSM_CACHE_OFFLINE": "1",
+        "WALK_USE_TILES": "0",
+        "WALK_OSM_FILE": "",
+        "WALK_TILE_LAYER_DIR": os.path.join(work, "layers"),
+        "WALK_JOBS_DB": os.path.join(work, "jobs.sqlite3"),
+        "WALK_POOL_WORKERS": "0",
+        # time the analysis, not result cache / area store hits
+        "WALK_RESULT_CACHE_SLOTS": "0",
+        "WALK_AREA_STORE": "0",
+        "WALK_SERVER_TIMING": "1",
+        "WALK_LOG_LEVEL": "WARNING",
+    })
+    try:
+        from utils.instrumentation import run_traced
+        from utils.osm_cache import CACHE_VERSION, get_osm_cache
+        from utils.pipeline import analyze_point
+
+        with open(os.path.join(FIXTURE_DIR, name, "meta.json"), "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("version") != CACHE_VERSION:
+            raise RuntimeError(
+                f"Fixture {name!r} is an OSM cache entry of version {meta.get('version')}, the cache is at "
+                f"version {CACHE_VERSION}: rebuild it with `python -m benchmarks.make_fixtures`"
+            )
+        shutil.copytree(os.path.join(FIXTURE_DIR, name), get_osm_cache()._entry_dir(meta["key"]))
+        lat, lon = meta["center"]
+
+        runs = []
+        for i in range(warmup + repeat):
+            _, spans = run_traced(analyze_point, lat, lon)
+            if i >= warmup:
+                runs.append(spans)
+
+        stages = {}
+        for spans in runs:
+            previous_rss = None
+            for span in spans:
+                entry = stages.setdefault(span["stage"], {"wall_s": [], "cpu_s": [], "rss_delta": []})
+                entry["wall_s"].append(span["wall_s"])
+                entry["cpu_s"].append(span["cpu_s"])
+                if span["stage"] != "total" and span["rss_bytes"] is not None and previous_rss is not None:
+                    entry["rss_delta"].append(span["rss_bytes"] - previous_rss)
+                if span["stage"] != "total":
+                    previous_rss = span["rss_bytes"]
+        counts = {}
+        for span in runs[-1]:
+            counts.update(span["counts"])
+
+        result = {
+            "source": meta.get("source"),
+            "counts": counts,
+            "stages": {
+                stage: {
+                    "wall_s": _summary(v["wall_s"]),
+                    "cpu_s": statistics.median(v["cpu_s"]),
+                    "rss_delta_mb": _mb(statistics.median(v["rss_delta"])) if v["rss_delta"] else None,
+                }
+                for stage, v in stages.items()
+            },
+            "peak_rss_mb": _mb(max((s["peak_rss_bytes"] or 0) for spans in runs for s in spans)),
+        }
+
+        if http:
+            from fastapi.testclient import TestClient
+            from main import app
+
+            client = TestClient(app)
+            walls, server = [], {}
+            body = b""
+            for i in range(warmup + repeat):
+                started = time.perf_counter()
+                response = client.post("/analyze", json={"lat": lat, "lon": lon})
+                wall = time.perf_counter() - started
+                response.raise_for_status()
+                if i < warmup:
+                    continue
+                walls.append(wall)
+                body = response.content
+                for part in response.headers.get("server-timing", "").split(","):
+                    if ";dur=" in part:
+                        metric, dur = part.strip().split(";dur=")
+                        server.setdefault(metric, []).append(float(dur) / 1000)
+            result["http"] = {
+                "wall_s": _summary(walls),
+                "response_bytes": len(body),
+                "server_timing_s": {k: statistics.median(v) for k, v in server.items()},
+            }
+        return result
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+# ----------------------------
+# Report / comparison
+# ----------------------------
+def _environment():
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    for module in ("numpy", "pandas", "geopandas", "shapely", "osmnx", "scipy"):
+        try:
+            env[module] = __import__(module).__version__
+        except Exception:
+            env[module] = None
+    try:
+        env["git_commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                           cwd=os.path.dirname(FIXTURE_DIR), timeout=10).stdout.strip() or None
+    except Exception:
+        env["git_commit"] = None
+    return env
+
+
+def compare(report, baseline, max_slowdown=MAX_SLOWDOWN, max_memory_growth=MAX_MEMORY_GROWTH,
+            min_delta_s=MIN_DELTA_S):
+    """Regressions of `report` against `baseline`, as readable lines (empty list: none)."""
+    regressions = []
+
+    def check_time(label, new, old):
+        if old is None or new is None:
+            return
+        if new - old > min_delta_s and new > old * (1 + max_slowdown):
+            regressions.append(f"{label}: {old * 1000:.0f} ms → {new * 1000:.0f} ms (+{100 * (new / old - 1):.0f}%)")
+
+    for name, current in report["fixtures"].items():
+        previous = baseline.get("fixtures", {}).get(name)
+        if previous is None:
+            continue
+        for stage, stats in current["stages"].items():
+            old = previous["stages"].get(stage)
+            check_time(f"{name}/{stage}", stats["wall_s"]["median"], old and old["wall_s"]["median"])
+        if "http" in current and "http" in previous:
+            check_time(f"{name}/POST /analyze", current["http"]["wall_s"]["median"], previous["http"]["wall_s"]["median"])
+        new_mem, old_mem = current.get("peak_rss_mb"), previous.get("peak_rss_mb")
+        if new_mem and old_mem and new_mem > old_mem * (1 + max_memory_growth):
+            regressions.append(f"{name}/peak memory: {old_mem:.0f} MB → {new_mem:.0f} MB")
+    return regressions
+
+
+def print_report(report, baseline=None):
+    for name, result in report["fixtures"].items():
+        counts = ", ".join(f"{k}={v}" for k, v in result["counts"].items())
+        print(f"\n{name}  ({counts})  peak RSS {result['peak_rss_mb']} MB")
+        previous = (baseline or {}).get("fixtures", {}).get(name, {}).get("stages", {})
+        for stage, stats in result["stages"].items():
+            line = f"  {stage:<26} {stats['wall_s']['median'] * 1000:9.1f} ms  cpu {stats['cpu_s'] * 1000:9.1f} ms"
+            if stats["rss_delta_mb"] is not None:
+                line += f"  Δrss {stats['rss_delta_mb']:+7.1f} MB"
+            if stage in previous:
+                old = previous[stage]["wall_s"]["median"]
+                line += f"  (baseline {old * 1000:.1f} ms, {100 * (stats['wall_s']['median'] / old - 1):+.0f}%)"
+            print(line)
+        if "http" in result:
+            http = result["http"]
+            print(f"  {'POST /analyze':<26} {http['wall_s']['median'] * 1000:9.1f} ms  "
+                  f"{http['response_bytes'] / 1e3:.0f} KB response")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", action="append", help="fixture name (default: all, smallest first)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--no-http", action="store_true", help="skip the TestClient round trips")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN)
+    parser.add_argument("--max-memory-growth", type=float, default=MAX_MEMORY_GROWTH)
+    parser.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_S * 1000)
+    args = parser.parse_args()
+
+    fixtures = args.fixture or available_fixtures()
+    if not fixtures:
+        raise SystemExit(f"No fixtures in {FIXTURE_DIR}; build them with python -m benchmarks.make_fixtures")
+
+    report = {"schema": REPORT_SCHEMA, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "repeat": args.repeat, "environment": _environment(), "fixtures": {}}
+    for name in fixtures:
+        print(f"⏱️  {name} ...", file=sys.stderr)
+        # a fresh interpreter per fixture: clean import state and an honest peak RSS
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            report["fixtures"][name] = pool.submit(_bench_fixture, name, args.repeat, args.warmup,
+                                                   not args.no_http).result()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    print_report(report, baseline)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=1)
+        print(f"\n📝 Report written to {args.out}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.max_slowdown, args.max_memory_growth, args.min_delta_ms / 1000)
+        if regressions:
+            print("\n❌ Regressions beyond thresholds:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ No regressions beyond thresholds")
+
+
+if __name__ == "__main__":
+    main()
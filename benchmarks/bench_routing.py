@@ -0,0 +1,96 @@
+# benchmarks/bench_routing.py
+"""
+Route-query latency on one scored area: networkx Dijkstra on the osmnx
+MultiDiGraph vs A* / csgraph Dijkstra on the CSR RoutingGraph vs the
+contraction hierarchy.
+
+    python -m benchmarks.bench_routing                       # synthetic lattice
+    python -m benchmarks.bench_routing --size 150 --queries 500
+    python -m benchmarks.bench_routing --location "Indiranagar, Bangalore"
+
+Every method must agree on the route cost before timings are reported.
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import networkx as nx
+import numpy as np
+
+from benchmarks.bench_extract import synthetic_extract
+from utils.contraction import build_contraction_hierarchy
+from utils.feature_extract import extract_features
+from utils.routing import astar, build_routing_graph, dijkstra
+from utils.scoring import compute_walkability
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--location", help="benchmark on a real (cached) OSM extract instead")
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.location:
+            from utils.data_fetch import fetch_osm_data
+            G, nodes, edges, _ = fetch_osm_data(args.location)
+        else:
+            G, nodes, edges = synthetic_extract(args.size, drop=0.2)
+        blocks, edges, nodes = extract_features(nodes, edges, None, G)
+        blocks = compute_walkability(blocks, edges)
+    graph = build_routing_graph(nodes, edges, blocks)
+    print(f"graph: nodes={graph.n_nodes}, edges={graph.n_edges}")
+
+    # same walkability-weighted cost on the MultiDiGraph for the networkx baseline
+    u = nodes.index.get_indexer(edges.index.get_level_values(0))
+    v = nodes.index.get_indexer(edges.index.get_level_values(1))
+    slot_cost = {}
+    for a, b in zip(u, v):
+        slot_cost[(a, b)] = float(graph.cost[graph.edge_position(a, b)])
+    nx.set_edge_attributes(G, {
+        key: slot_cost[(a, b)] for key, a, b in zip(edges.index, u, v)
+    }, "walk_cost")
+
+    start = time.perf_counter()
+    ch = build_contraction_hierarchy(graph)
+    print(f"contraction hierarchy: {time.perf_counter() - start:.1f} s, "
+          f"{len(ch.up_indices) + len(ch.down_indices)} search edges")
+
+    rng = np.random.default_rng(args.seed)
+    pairs = [tuple(map(int, rng.integers(0, graph.n_nodes, 2))) for _ in range(args.queries)]
+    ch.query(*pairs[0])  # build the query lists outside the timed loop
+
+    methods = {
+        "networkx dijkstra": lambda s, t: nx.shortest_path_length(
+            G, graph.node_ids[s], graph.node_ids[t], weight="walk_cost"),
+        "csr astar": lambda s, t: astar(graph, s, t)[1],
+        "csgraph dijkstra": lambda s, t: dijkstra(graph, s, t)[1],
+        "contraction hierarchy": lambda s, t: ch.query(s, t)[1],
+    }
+    costs, timings = {}, {}
+    for name, fn in methods.items():
+        out = []
+        start = time.perf_counter()
+        for s, t in pairs:
+            try:
+                out.append(fn(s, t))
+            except nx.NetworkXNoPath:
+                out.append(float("inf"))
+        timings[name] = (time.perf_counter() - start) / len(pairs)
+        costs[name] = np.array(out, dtype=float)
+
+    reference = costs["networkx dijkstra"]
+    for name, c in costs.items():
+        same = np.isclose(c, reference, rtol=1e-4) | (np.isinf(c) & np.isinf(reference))
+        assert same.all(), f"{name} disagrees with networkx on {int((~same).sum())} queries"
+
+    base = timings["networkx dijkstra"]
+    for name, t in timings.items():
+        print(f"{name:22s}: {t * 1000:8.3f} ms/query  ({base / t:6.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_simplify.py
+"""
+Measure the block simplification stage of extract_features: vertex counts,
+the effect on walkability scores, and what it saves downstream
+(compute_walkability time and GeoJSON size).
+
+    python -m benchmarks.bench_simplify                      # synthetic lattice
+    python -m benchmarks.bench_simplify --simplify-m 2 --precision-m 0.5
+    python -m benchmarks.bench_simplify --location "Indiranagar, Bangalore"
+"""
+import argparse
+import contextlib
+import io
+
+from benchmarks.bench_extract import _time, synthetic_extract
+from utils.feature_extract import BLOCK_PRECISION_M, BLOCK_SIMPLIFY_M, extract_features, simplification_report
+from utils.scoring import compute_walkability
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--location", help="benchmark on a real (cached) OSM extract instead")
+    parser.add_argument("--size", type=int, default=120)
+    parser.add_argument("--drop", type=float, default=0.45)
+    parser.add_argument("--simplify-m", type=float, default=BLOCK_SIMPLIFY_M)
+    parser.add_argument("--precision-m", type=float, default=BLOCK_PRECISION_M)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pois = None
+    if args.location:
+        from utils.data_fetch import fetch_osm_data
+        G, nodes, edges, pois = fetch_osm_data(args.location)
+    else:
+        G, nodes, edges = synthetic_extract(args.size, args.drop)
+    print(f"extract: nodes={len(nodes)}, edges={len(edges)}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        raw = extract_features(nodes, edges, pois, G, simplify_m=0, precision_m=0)[0]
+        simplified = extract_features(nodes, edges, pois, G, simplify_m=args.simplify_m,
+                                      precision_m=args.precision_m)[0]
+    assert len(raw) == len(simplified), f"block count differs: {len(raw)} vs {len(simplified)}"
+
+    report = simplification_report(raw, simplified, edges, nodes, pois)
+    t_raw, _ = _time(lambda: compute_walkability(raw, edges, nodes, pois), args.repeat)
+    t_new, _ = _time(lambda: compute_walkability(simplified, edges, nodes, pois), args.repeat)
+    size_raw, size_new = len(raw.to_json()), len(simplified.to_json())
+
+    print(f"blocks={report['blocks']}  simplify={args.simplify_m} m  precision={args.precision_m} m")
+    print(f"vertices   : {report['vertices_before']:,} → {report['vertices_after']:,} "
+          f"(-{100 * report['vertex_reduction']:.1f}%)")
+    print(f"area change: {100 * report['area_change']:+.3f}%")
+    print(f"score diff : mean {report['score_mean_abs_diff']:.5f}  max {report['score_max_abs_diff']:.5f}  "
+          f"rank correlation {report['rank_correlation']:.4f}")
+    print(f"scoring    : {t_raw * 1000:9.1f} ms → {t_new * 1000:.1f} ms")
+    print(f"GeoJSON    : {size_raw / 1e6:9.2f} MB → {size_new / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
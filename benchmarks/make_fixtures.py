@@ -0,0 +1,198 @@
+# benchmarks/make_fixtures.py
+"""
+(Re)build the recorded fetch_osm_data outputs under benchmarks/fixtures/.
+
+    python -m benchmarks.make_fixtures                       # synthetic small / medium / large
+    python -m benchmarks.make_fixtures --only small
+    python -m benchmarks.make_fixtures --record city --location "Indiranagar, Bangalore"
+
+Each fixture is an OSM cache entry (nodes / edges / pois GeoParquet +
+meta.json, exactly what OSMCache stores for a fetch) plus the centre point
+it answers for, so benchmarks/bench_pipeline.py can run fully offline.
+
+Synthetic fixtures are generated as OSM XML and read through the local-file
+loader, so they go through the same tag handling, simplification and walk
+attribute inference as a real extract: a jittered street grid with gaps,
+mixed highway classes and sidewalk / lit / surface tags, crossings, cut-through
+footpaths and amenity / shop / leisure / transit POIs. Rail / river style
+barriers without crossings split it into districts, so extraction yields
+many blocks of different sizes as on real extracts.
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+DIST_M = 2000
+
+# name -> (grid size, seed); grid spacing is ~90 m
+SYNTHETIC = {
+    "small": (24, 1),
+    "medium": (60, 2),
+    "large": (110, 3),
+}
+
+HIGHWAYS = ["residential", "residential", "residential", "tertiary", "secondary", "primary",
+            "footway", "service", "living_street", "unclassified"]
+SIDEWALKS = ["both", "both", "no", "left", "right", "separate", None, None, None]
+SURFACES = ["asphalt", "asphalt", "paving_stones", "concrete", "gravel", "unpaved", None, None]
+POI_KINDS = [("amenity", "cafe"), ("amenity", "school"), ("amenity", "restaurant"), ("amenity", "pharmacy"),
+             ("shop", "supermarket"), ("shop", "bakery"), ("tourism", "museum"),
+             ("public_transport", "platform")]
+
+
+def _synthetic_osm(size, seed, lat0=12.95, lon0=77.58, step=0.0008):
+    """OSM XML text for a size x size jittered street grid around (lat0, lon0)."""
+    rng = np.random.default_rng(seed)
+    out = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6" generator="walkability-fixtures">']
+    nid = lambda i, j: 1 + i * size + j
+    lat = lat0 + np.arange(size)[:, None] * step + rng.normal(0, step * 0.08, (size, size))
+    lon = lon0 + np.arange(size)[None, :] * step + rng.normal(0, step * 0.08, (size, size))
+    crossing = rng.random((size, size)) < 0.08
+    # a barrier before row / column k cuts every segment between k - 1 and k
+    cut_rows = set(np.cumsum(rng.integers(5, 12, size)).tolist())
+    cut_cols = set(np.cumsum(rng.integers(5, 12, size)).tolist())
+    for i in range(size):
+        for j in range(size):
+            tag = '<tag k="highway" v="crossing"/>' if crossing[i, j] else ""
+            out.append(f'<node id="{nid(i, j)}" lat="{lat[i, j]:.7f}" lon="{lon[i, j]:.7f}">{tag}</node>'
+                       if tag else f'<node id="{nid(i, j)}" lat="{lat[i, j]:.7f}" lon="{lon[i, j]:.7f}"/>')
+
+    next_node = size * size + 1
+    pois = []
+    for _ in range(size * size // 6):
+        key, value = POI_KINDS[rng.integers(len(POI_KINDS))]
+        y = lat0 + rng.uniform(0, (size - 1) * step)
+        x = lon0 + rng.uniform(0, (size - 1) * step)
+        pois.append(f'<node id="{next_node}" lat="{y:.7f}" lon="{x:.7f}"><tag k="{key}" v="{value}"/></node>')
+        next_node += 1
+    out += pois
+
+    way_id = 1
+
+    def way(refs, tags):
+        nonlocal way_id
+        nds = "".join(f'<nd ref="{r}"/>' for r in refs)
+        tag_xml = "".join(f'<tag k="{k}" v="{v}"/>' for k, v in tags.items() if v is not None)
+        out.append(f'<way id="{way_id}">{nds}{tag_xml}</way>')
+        way_id += 1
+
+    def street_tags():
+        return {
+            "highway": HIGHWAYS[rng.integers(len(HIGHWAYS))],
+            "sidewalk": SIDEWALKS[rng.integers(len(SIDEWALKS))],
+            "lit": "yes" if rng.random() < 0.35 else None,
+            "surface": SURFACES[rng.integers(len(SURFACES))],
+        }
+
+    # streets along rows and columns, broken into runs where segments are missing
+    for axis in (0, 1):
+        cuts = cut_cols if axis == 0 else cut_rows
+        for k in range(size):
+            run = [nid(k, 0) if axis == 0 else nid(0, k)]
+            tags = street_tags()
+            for m in range(1, size):
+                node = nid(k, m) if axis == 0 else nid(m, k)
+                if m in cuts or rng.random() < 0.12:
+                    if len(run) > 1:
+                        way(run, tags)
+                    run, tags = [node], street_tags()
+                else:
+                    run.append(node)
+            if len(run) > 1:
+                way(run, tags)
+
+    # diagonal cut-through footpaths
+    for _ in range(size * size // 25):
+        i, j = rng.integers(0, size - 1, 2)
+        if i + 1 not in cut_rows and j + 1 not in cut_cols:
+            way([nid(i, j), nid(i + 1, j + 1)], {"highway": "footway", "surface": "paving_stones"})
+
+    # parks as closed ways (leisure POIs)
+    for _ in range(max(2, size // 8)):
+        i, j = rng.integers(0, size - 3, 2)
+        ring = [nid(i, j), nid(i, j + 2), nid(i + 2, j + 2), nid(i + 2, j), nid(i, j)]
+        way(ring, {"leisure": "park"})
+
+    out.append("</osm>")
+    return "\n".join(out), (float(lat.mean()), float(lon.mean()))
+
+
+def _write_fixture(name, G, nodes, edges, pois, center, source):
+    """Store the extract as an OSM cache entry under fixtures/<name>/."""
+    from utils.osm_cache import OSMCache, point_key
+
+    key = point_key(center[0], center[1], DIST_M)
+    with tempfile.TemporaryDirectory() as root:
+        cache = OSMCache(root=root, max_bytes=1 << 40)
+        cache.put(key, G, nodes, edges, pois)
+        entry = cache._entry_dir(key)
+        with open(os.path.join(entry, "meta.json"), "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        meta.update({"fixture": name, "center": list(center), "dist_m": DIST_M, "source": source})
+        with open(os.path.join(entry, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, indent=1, default=str)
+
+        final = os.path.join(FIXTURE_DIR, name)
+        shutil.rmtree(final, ignore_errors=True)
+        shutil.copytree(entry, final)
+    size = sum(os.path.getsize(os.path.join(final, f)) for f in os.listdir(final))
+    print(f"📦 {name}: nodes={len(nodes)}, edges={len(edges)}, pois={len(pois)} ({size / 1e6:.2f} MB) → {final}")
+
+
+def build_synthetic(name):
+    from utils.data_fetch import POI_TAGS, _add_geometry_flags, _add_walk_attributes
+    from utils.osm_cache import snap_point
+    from utils.osm_file import read_osm_file
+
+    size, seed = SYNTHETIC[name]
+    xml, center = _synthetic_osm(size, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{name}.osm.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as fh:
+            fh.write(xml)
+        with contextlib.redirect_stdout(io.StringIO()):
+            G, nodes, edges, pois = read_osm_file(path, poi_tags=POI_TAGS, retain_all=True)
+            _add_walk_attributes(edges)
+            _add_geometry_flags(G, edges)
+    _write_fixture(name, G, nodes, edges, pois, snap_point(*center), f"synthetic grid size={size} seed={seed}")
+
+
+def record(name, location):
+    """Record a live fetch (needs network access) as a fixture."""
+    from utils.data_fetch import fetch_osm_data
+    from utils.osm_cache import snap_point
+
+    G, nodes, edges, pois = fetch_osm_data(location, use_cache=False, use_tiles=False)
+    if len(edges) == 0:
+        raise SystemExit(f"Nothing fetched for {location!r}")
+    center = snap_point(nodes["y"].mean(), nodes["x"].mean())
+    _write_fixture(name, G, nodes, edges, pois, center, f"recorded: {location}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=sorted(SYNTHETIC), action="append", help="synthetic fixture(s) to rebuild")
+    parser.add_argument("--record", metavar="NAME", help="record a live place fetch under this fixture name")
+    parser.add_argument("--location", help="place name for --record")
+    args = parser.parse_args()
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    if args.record:
+        if not args.location:
+            parser.error("--record needs --location")
+        record(args.record, args.location)
+        return
+    for name in args.only or SYNTHETIC:
+        build_synthetic(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# utils/clustering.py
+"""
+Spatial clustering of recommendation points for the /analyze `clusters` payload.
+
+Points are grouped per priority with DBSCAN over metric coordinates. The
+eps-neighbourhoods come from one cKDTree.query_pairs call, and clusters are
+the connected components of the core-point graph (scipy csgraph). Border
+points join the cluster of a neighbouring core point. Everything stays in
+NumPy arrays, so tens of thousands of points cluster in milliseconds. Only
+the clusters themselves are turned into dicts, in the shape the frontend
+reads (src/utils/dataTransform.ts).
+"""
+import os
+
+import numpy as np
+import shapely
+
+from utils.instrumentation import get_logger
+from utils.projection import WGS84, area_crs, to_metric, transform_geoms
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+# neighbourhood radius in metres and DBSCAN min_samples (1 = every point is a core point)
+CLUSTER_EPS_M = float(os.environ.get("WALK_CLUSTER_EPS_M", 150))
+CLUSTER_MIN_SAMPLES = int(os.environ.get("WALK_CLUSTER_MIN_SAMPLES", 1))
+# clusters returned, best first
+MAX_CLUSTERS = int(os.environ.get("WALK_MAX_CLUSTERS", 50))
+
+PRIORITIES = ("HIGH", "MEDIUM", "LOW")
+ACTION_LABELS = {
+    "add_sidewalk": "Sidewalk gaps",
+    "add_connector": "Missing links",
+    "add_poi": "Amenity gaps",
+}
+
+
+def dbscan(xy, eps, min_samples=CLUSTER_MIN_SAMPLES):
+    """
+    DBSCAN labels for an (n, 2) array of metric coordinates; noise is -1.
+    Labels are 0..k-1 in order of each cluster's first point.
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+    from scipy.spatial import cKDTree
+
+    n = len(xy)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    pairs = cKDTree(xy).query_pairs(eps, output_type="ndarray")
+    neighbours = np.bincount(pairs.ravel(), minlength=n) + 1
+    core = neighbours >= min_samples
+
+    both = core[pairs[:, 0]] & core[pairs[:, 1]]
+    a, b = pairs[both, 0], pairs[both, 1]
+    graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n, n))
+    _, component = connected_components(graph, directed=False)
+
+    labels = np.where(core, component, -1)
+    # border points: the cluster of any core neighbour
+    for i, j in ((0, 1), (1, 0)):
+        border = ~core[pairs[:, i]] & core[pairs[:, j]]
+        labels[pairs[border, i]] = component[pairs[border, j]]
+
+    # relabel to 0..k-1, in order of first appearance
+    clustered = labels >= 0
+    _, first, dense = np.unique(labels[clustered], return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first))
+    labels[clustered] = order[dense.ravel()]
+    return labels
+
+
+def _column(gdf, name, default):
+    return gdf[name].to_numpy() if name in gdf.columns else np.full(len(gdf), default)
+
+
+def cluster_recommendations(rec_gdf, blocks_gdf=None, eps_m=CLUSTER_EPS_M, min_samples=CLUSTER_MIN_SAMPLES,
+                            max_clusters=MAX_CLUSTERS):
+    """
+    Group recommendation points by priority and proximity. Returns up to
+    `max_clusters` JSON-safe dicts (highest severity, then largest impact
+    first) with id, name, description, lat / lon / coordinates (centroid,
+    WGS84), severity, risk_level, size, impact, score_gain, cost, actions and,
+    given the scored blocks, the mean walkability_score_normalized under the
+    cluster.
+    """
+    if rec_gdf is None or not hasattr(rec_gdf, "geometry") or len(rec_gdf) == 0:
+        return []
+    crs = area_crs(rec_gdf)
+    recs = to_metric(rec_gdf, crs)
+    geoms = recs.geometry.to_numpy()
+    valid = ~shapely.is_empty(geoms) & ~shapely.is_missing(geoms)
+    recs, geoms = recs[valid], shapely.centroid(geoms[valid])
+    if len(recs) == 0:
+        return []
+    xy = np.column_stack([shapely.get_x(geoms), shapely.get_y(geoms)])
+
+    # DBSCAN within each priority, labels offset so they stay unique
+    priority = np.char.upper(_column(recs, "priority", "MEDIUM").astype(str))
+    rank = np.array([PRIORITIES.index(p) if p in PRIORITIES else 1 for p in priority])
+    labels = np.full(len(recs), -1, dtype=np.int64)
+    offset = 0
+    for level in np.unique(rank):
+        members = np.flatnonzero(rank == level)
+        sub = dbscan(xy[members], eps_m, min_samples)
+        labels[members] = np.where(sub >= 0, sub + offset, -1)
+        offset += int(sub.max()) + 1 if (sub >= 0).any() else 0
+    keep = labels >= 0
+    if not keep.any():
+        return []
+    labels, xy, rank = labels[keep], xy[keep], rank[keep]
+    recs = recs[keep]
+    k = offset
+
+    # per-cluster aggregates
+    size = np.bincount(labels, minlength=k)
+    centre = np.column_stack([np.bincount(labels, weights=xy[:, 0], minlength=k),
+                              np.bincount(labels, weights=xy[:, 1], minlength=k)]) / size[:, None]
+    cluster_rank = np.zeros(k, dtype=np.int64)
+    cluster_rank[labels] = rank
+    impact = np.bincount(labels, weights=_column(recs, "impact_estimate", 0.0).astype(float), minlength=k)
+    gain = np.bincount(labels, weights=_column(recs, "score_gain", 0.0).astype(float), minlength=k)
+    cost = np.bincount(labels, weights=_column(recs, "cost", 0.0).astype(float), minlength=k)
+    simulated = "score_gain" in recs.columns
+    actions = _column(recs, "action_type", "intervention").astype(str)
+    kinds, kind = np.unique(actions, return_inverse=True)
+    action_counts = np.zeros((k, len(kinds)), dtype=np.int64)
+    np.add.at(action_counts, (labels, kind.ravel()), 1)
+
+    score = np.full(k, np.nan)
+    if blocks_gdf is not None and len(blocks_gdf) and "walkability_score_normalized" in blocks_gdf.columns:
+        blocks = to_metric(blocks_gdf, crs)
+        point, block = blocks.sindex.query(shapely.points(xy), predicate="intersects")
+        point, first = np.unique(point, return_index=True)
+        values = blocks["walkability_score_normalized"].to_numpy(dtype=float)[block[first]]
+        hits = np.bincount(labels[point], minlength=k)
+        score = np.bincount(labels[point], weights=values, minlength=k) / np.where(hits > 0, hits, 1)
+        score[hits == 0] = np.nan
+
+    order = np.lexsort((-impact, cluster_rank))[:max_clusters]
+    lonlat = transform_geoms(shapely.points(centre[order]), crs, WGS84) if crs is not None else shapely.points(centre[order])
+    lon, lat = shapely.get_x(lonlat), shapely.get_y(lonlat)
+
+    clusters = []
+    for n, c in enumerate(order):
+        counts = {str(kinds[j]): int(action_counts[c, j]) for j in np.flatnonzero(action_counts[c])}
+        dominant = max(counts, key=counts.get)
+        level = PRIORITIES[cluster_rank[c]]
+        noun = "intervention" if simulated else "below-average block"
+        members = f"{int(size[c])} {noun}{'' if size[c] == 1 else 's'}"
+        cluster = {
+            "id": n,
+            "name": f"{ACTION_LABELS.get(dominant, 'Walkability issues')} ({int(size[c])})",
+            "description": f"{members}, +{impact[c]:.2f} mean walkability score" if simulated else members,
+            "lat": float(lat[n]),
+            "lon": float(lon[n]),
+            "coordinates": [float(lat[n]), float(lon[n])],
+            "severity": level.lower(),
+            "risk_level": level.capitalize(),
+            "size": int(size[c]),
+            "impact": round(float(impact[c]), 3),
+            "score_gain": round(float(gain[c]), 3),
+            "cost": round(float(cost[c]), 1),
+            "actions": counts,
+        }
+        if np.isfinite(score[c]):
+            cluster["walkability_score_normalized"] = round(float(score[c]), 1)
+        clusters.append(cluster)
+    log.info("📍 %s recommendations → %s clusters (eps=%.0f m)", len(recs), k, eps_m)
+    return clusters
@@ -0,0 +1,166 @@
+# utils/compact_graph.py
+from dataclasses import dataclass
+
+import numpy as np
+import shapely
+
+# edges column recording whether an edge carried its own geometry in the osmnx graph
+GEOMETRY_STORED = "geometry_stored"
+
+
+def stored_geometry_flags(edges_gdf, G=None):
+    """
+    Per-edge "carried its own geometry" flags, aligned with edges_gdf.
+    graph_to_gdfs fills straight u → v lines for edges without one, and block
+    extraction skips those. The flags come from the edges' GEOMETRY_STORED
+    column when the fetch recorded it, else from the osmnx graph G. Without
+    either they are derived from the geometry: a filled-in line has exactly
+    two coordinates, while a stored (simplified) one runs through the merged
+    nodes.
+    """
+    if GEOMETRY_STORED in edges_gdf.columns:
+        return edges_gdf[GEOMETRY_STORED].fillna(True).to_numpy(dtype=bool)
+    if G is not None and not isinstance(G, CompactGraph) and len(G) > 0 and G.is_multigraph():
+        missing = [(u, v, k) for u, v, k, geom in G.edges(keys=True, data="geometry") if geom is None]
+        return ~edges_gdf.index.isin(missing) if missing else np.ones(len(edges_gdf), dtype=bool)
+    geoms = edges_gdf.geometry.to_numpy()
+    return ~shapely.is_missing(geoms) & (shapely.get_num_coordinates(geoms) > 2)
+
+
+@dataclass
+class CompactGraph:
+    """
+    Array-backed walk graph, converted once from osmnx output.
+
+    Nodes are addressed by position (node_ids maps back to OSM ids, x/y are
+    lon/lat). Edges are stored as CSR: the out-edges of node i occupy slots
+    indptr[i]:indptr[i + 1] of every per-edge array. edge_row maps a slot back
+    to its row in the edges GeoDataFrame, so per-edge results can be aligned
+    with it in either direction.
+    """
+    node_ids: np.ndarray      # int64  (n_nodes,)
+    x: np.ndarray             # float32 lon
+    y: np.ndarray             # float32 lat
+    indptr: np.ndarray        # int32  (n_nodes + 1,)
+    indices: np.ndarray       # int32  (n_edges,) target node position
+    length: np.ndarray        # float32 metres
+    has_sidewalk: np.ndarray  # bool
+    geometry_stored: np.ndarray  # bool: edge carried its own geometry in the osmnx graph
+    edge_row: np.ndarray      # int32  row in edges_gdf
+
+    # ----------------------------
+    # Construction
+    # ----------------------------
+    @classmethod
+    def from_gdfs(cls, nodes_gdf, edges_gdf, geometry_stored=None):
+        """
+        Build from osmnx node/edge GeoDataFrames (edges indexed by u, v, key)
+        without touching networkx. geometry_stored defaults to
+        stored_geometry_flags(edges_gdf).
+        """
+        node_ids = nodes_gdf.index.to_numpy().astype(np.int64)
+        n = len(node_ids)
+
+        if len(edges_gdf) and edges_gdf.index.nlevels >= 2:
+            u = nodes_gdf.index.get_indexer(edges_gdf.index.get_level_values(0))
+            v = nodes_gdf.index.get_indexer(edges_gdf.index.get_level_values(1))
+        else:
+            u = v = np.zeros(0, dtype=np.intp)
+        rows = np.flatnonzero((u >= 0) & (v >= 0))
+        u, v = u[rows], v[rows]
+
+        if "length" in edges_gdf.columns:
+            length = edges_gdf["length"].to_numpy(dtype=float)[rows]
+        else:
+            length = np.zeros(len(rows))
+        if "has_sidewalk" in edges_gdf.columns:
+            sidewalk = edges_gdf["has_sidewalk"].fillna(False).to_numpy(dtype=bool)[rows]
+        else:
+            sidewalk = np.zeros(len(rows), dtype=bool)
+        if geometry_stored is None:
+            geometry_stored = stored_geometry_flags(edges_gdf)
+        stored = np.asarray(geometry_stored, dtype=bool)[rows]
+
+        order = np.argsort(u, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(u, minlength=n), out=indptr[1:])
+
+        return cls(
+            node_ids=node_ids,
+            x=(nodes_gdf["x"] if "x" in nodes_gdf.columns else nodes_gdf.geometry.x).to_numpy(dtype=np.float32),
+            y=(nodes_gdf["y"] if "y" in nodes_gdf.columns else nodes_gdf.geometry.y).to_numpy(dtype=np.float32),
+            indptr=indptr,
+            indices=v[order].astype(np.int32),
+            length=length[order].astype(np.float32),
+            has_sidewalk=sidewalk[order],
+            geometry_stored=stored[order],
+            edge_row=rows[order].astype(np.int32),
+        )
+
+    @classmethod
+    def from_osmnx(cls, G, nodes_gdf, edges_gdf):
+        """
+        Build from a fetched osmnx graph and its GeoDataFrames. G is read once,
+        only to record which edges carried their own geometry (graph_to_gdfs
+        fills straight lines for the rest, which block extraction skips).
+        """
+        return cls.from_gdfs(nodes_gdf, edges_gdf, geometry_stored=stored_geometry_flags(edges_gdf, G))
+
+    # ----------------------------
+    # Shape / views
+    # ----------------------------
+    def __len__(self):
+        return self.n_nodes
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    @property
+    def lat(self):
+        return self.y
+
+    @property
+    def lon(self):
+        return self.x
+
+    @property
+    def src(self):
+        """Source node position per edge slot."""
+        return np.repeat(np.arange(self.n_nodes, dtype=np.int32), np.diff(self.indptr))
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, f).nbytes for f in self.__dataclass_fields__)
+
+    def to_csr(self, weight="length"):
+        """scipy CSR matrix of `weight`; parallel edges collapse to their minimum."""
+        from scipy.sparse import csr_matrix
+
+        src, dst = self.src, self.indices
+        data = getattr(self, weight).astype(np.float64)
+        order = np.lexsort((data, dst, src))
+        keep = order[np.r_[True, (src[order][1:] != src[order][:-1]) | (dst[order][1:] != dst[order][:-1])]]
+        return csr_matrix((data[keep], (src[keep], dst[keep])), shape=(self.n_nodes, self.n_nodes))
+
+    def edge_component_labels(self):
+        """(n_components, weakly connected component label per edge slot)."""
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        adjacency = csr_matrix(
+            (np.ones(self.n_edges, dtype=np.int8), self.indices, self.indptr),
+            shape=(self.n_nodes, self.n_nodes),
+        )
+        n_components, node_labels = connected_components(adjacency, directed=False)
+        return n_components, node_labels[self.src]
+
+    def simulation_arrays(self):
+        """The /analyze `simulation` block as typed arrays: OSM node ids and an (n_edges, 2) int32 edge index."""
+        from utils.serialization import simulation_arrays
+
+        return simulation_arrays(self.node_ids, np.column_stack([self.src, self.indices]))
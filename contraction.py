@@ -0,0 +1,323 @@
+# utils/contraction.py
+import hashlib
+import heapq
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.instrumentation import get_logger
+
+log = get_logger(__name__)
+
+# witness searches give up after settling this many nodes (an extra shortcut is always safe)
+WITNESS_SETTLE_LIMIT = int(os.environ.get("WALK_CH_WITNESS_LIMIT", 60))
+
+
+def graph_fingerprint(graph):
+    """Stable hash of a RoutingGraph's topology and costs; names its serialized hierarchy."""
+    h = hashlib.sha1()
+    for arr in (graph.node_ids, graph.indptr, graph.indices, graph.cost):
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()[:24]
+
+
+@dataclass
+class ContractionHierarchy:
+    """
+    Upward/downward search graphs of a contraction hierarchy, as CSR arrays.
+
+    up_*   : edges u → w with rank[w] > rank[u]           (forward search from the source)
+    down_* : edges w → u stored at w with rank[u] > rank[w] (reverse search from the target)
+    *_mid  : contracted middle node of a shortcut, -1 for an original edge
+    """
+    rank: np.ndarray
+    up_indptr: np.ndarray
+    up_indices: np.ndarray
+    up_cost: np.ndarray
+    up_mid: np.ndarray
+    down_indptr: np.ndarray
+    down_indices: np.ndarray
+    down_cost: np.ndarray
+    down_mid: np.ndarray
+    fingerprint: str = ""
+
+    # ----------------------------
+    # Serialization
+    # ----------------------------
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, fingerprint=np.array(self.fingerprint), **{
+            name: getattr(self, name) for name in (
+                "rank", "up_indptr", "up_indices", "up_cost", "up_mid",
+                "down_indptr", "down_indices", "down_cost", "down_mid",
+            )
+        })
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            fields = {name: data[name] for name in data.files if name != "fingerprint"}
+            return cls(fingerprint=str(data["fingerprint"]), **fields)
+
+    # ----------------------------
+    # Queries
+    # ----------------------------
+    def _search_lists(self):
+        """
+        Plain-list views of the search graphs plus a (u, w) → middle map of
+        shortcuts, built once: indexing NumPy scalars in the inner loop costs
+        more than the whole search.
+        """
+        if getattr(self, "_lists", None) is None:
+            def adjacency(indptr, indices, cost):
+                indptr, indices, cost = indptr.tolist(), indices.tolist(), cost.tolist()
+                return [list(zip(indices[indptr[i]:indptr[i + 1]], cost[indptr[i]:indptr[i + 1]]))
+                        for i in range(len(indptr) - 1)]
+
+            middles = {}
+            n = len(self.up_indptr) - 1
+            up_src = np.repeat(np.arange(n), np.diff(self.up_indptr))
+            for u, w, m in zip(up_src[self.up_mid >= 0].tolist(), self.up_indices[self.up_mid >= 0].tolist(),
+                               self.up_mid[self.up_mid >= 0].tolist()):
+                middles[(u, w)] = m
+            down_dst = np.repeat(np.arange(n), np.diff(self.down_indptr))
+            for w, u, m in zip(down_dst[self.down_mid >= 0].tolist(), self.down_indices[self.down_mid >= 0].tolist(),
+                               self.down_mid[self.down_mid >= 0].tolist()):
+                middles[(u, w)] = m
+
+            self._lists = (
+                adjacency(self.up_indptr, self.up_indices, self.up_cost),
+                adjacency(self.down_indptr, self.down_indices, self.down_cost),
+                middles,
+            )
+        return self._lists
+
+    def _unpack(self, u, w, out):
+        middles = self._search_lists()[2]
+        stack = [(u, w)]
+        while stack:
+            a, b = stack.pop()
+            mid = middles.get((a, b), -1)
+            if mid < 0:
+                out.append(b)
+            else:
+                # process (a, mid) first, then (mid, b)
+                stack.append((mid, b))
+                stack.append((a, mid))
+
+    def query(self, source, target):
+        """Bidirectional upward Dijkstra. Returns (path positions, cost) or ([], inf)."""
+        if source == target:
+            return [source], 0.0
+
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        graphs = self._search_lists()[:2]
+        best, meet = float("inf"), -1
+
+        side = 0
+        while heaps[0] or heaps[1]:
+            # alternate sides, skipping an exhausted one
+            if not heaps[side]:
+                side = 1 - side
+            d, node = heapq.heappop(heaps[side])
+            if d > dist[side].get(node, float("inf")):
+                continue
+            if d >= best:
+                # this side cannot improve the meeting point any more
+                heaps[side].clear()
+                side = 1 - side
+                continue
+
+            other = dist[1 - side].get(node)
+            if other is not None and d + other < best:
+                best, meet = d + other, node
+
+            dist_side, parent_side, heap_side = dist[side], parent[side], heaps[side]
+            for nxt, c in graphs[side][node]:
+                nd = d + c
+                if nd < dist_side.get(nxt, float("inf")):
+                    dist_side[nxt] = nd
+                    parent_side[nxt] = node
+                    heapq.heappush(heap_side, (nd, nxt))
+            side = 1 - side
+
+        if meet < 0:
+            return [], float("inf")
+
+        # hierarchy path: source ..up.. meet ..down.. target
+        up_chain = [meet]
+        while parent[0][up_chain[-1]] != -1:
+            up_chain.append(parent[0][up_chain[-1]])
+        up_chain.reverse()
+        down_chain = [meet]
+        while parent[1][down_chain[-1]] != -1:
+            down_chain.append(parent[1][down_chain[-1]])
+        chain = up_chain + down_chain[1:]
+
+        path = [chain[0]]
+        for a, b in zip(chain[:-1], chain[1:]):
+            self._unpack(a, b, path)
+        return path, best
+
+
+def _witness_cost(out_adj, source, target, skip, limit):
+    """Cost of the best source → target path avoiding `skip`, searched up to `limit` (inf if none found)."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > dist.get(node, float("inf")):
+            continue
+        if node == target or d > limit:
+            return d
+        settled += 1
+        if settled > WITNESS_SETTLE_LIMIT:
+            break
+        for nxt, w in out_adj[node].items():
+            if nxt == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(nxt, float("inf")):
+                dist[nxt] = nd
+                heapq.heappush(heap, (nd, nxt))
+    return dist.get(target, float("inf"))
+
+
+def _shortcuts_for(v, out_adj, in_adj):
+    """Shortcuts (u, w, cost) needed if v were contracted now."""
+    shortcuts = []
+    ins = [(u, c) for u, c in in_adj[v].items() if u != v]
+    outs = [(w, c) for w, c in out_adj[v].items() if w != v]
+    if not ins or not outs:
+        return shortcuts
+    max_out = max(c for _, c in outs)
+    for u, c_uv in ins:
+        for w, c_vw in outs:
+            if w == u:
+                continue
+            via = c_uv + c_vw
+            if _witness_cost(out_adj, u, w, v, via if len(outs) == 1 else c_uv + max_out) > via:
+                shortcuts.append((u, w, via))
+    return shortcuts
+
+
+def build_contraction_hierarchy(graph):
+    """
+    Contract every node of a RoutingGraph in edge-difference order (lazy
+    updates) and return the resulting ContractionHierarchy over its cost weights.
+    """
+    n = graph.n_nodes
+    out_adj = [dict() for _ in range(n)]
+    in_adj = [dict() for _ in range(n)]
+    # (u, w) -> middle node for every shortcut
+    middle = {}
+
+    for u in range(n):
+        for slot in range(graph.indptr[u], graph.indptr[u + 1]):
+            w = int(graph.indices[slot])
+            if w == u:
+                continue
+            c = float(graph.cost[slot])
+            if c < out_adj[u].get(w, float("inf")):
+                out_adj[u][w] = c
+                in_adj[w][u] = c
+
+    # every edge ever present (original + shortcuts), kept for the final search graphs
+    all_edges = {(u, w): c for u in range(n) for w, c in out_adj[u].items()}
+
+    deleted_neighbours = np.zeros(n, dtype=np.int32)
+
+    def priority(v):
+        n_shortcuts = len(_shortcuts_for(v, out_adj, in_adj))
+        edge_difference = n_shortcuts - len(in_adj[v]) - len(out_adj[v])
+        return edge_difference + deleted_neighbours[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.full(n, -1, dtype=np.int32)
+    level = 0
+
+    while heap:
+        _, v = heapq.heappop(heap)
+        if rank[v] >= 0:
+            continue
+        # lazy update: re-evaluate and push back if it is no longer the minimum
+        current = priority(v)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, v))
+            continue
+
+        for u, w, c in _shortcuts_for(v, out_adj, in_adj):
+            if c < out_adj[u].get(w, float("inf")):
+                out_adj[u][w] = c
+                in_adj[w][u] = c
+                if c < all_edges.get((u, w), float("inf")):
+                    all_edges[(u, w)] = c
+                    middle[(u, w)] = v
+
+        rank[v] = level
+        level += 1
+        neighbours = set(in_adj[v]) | set(out_adj[v])
+        for u in in_adj[v]:
+            out_adj[u].pop(v, None)
+        for w in out_adj[v]:
+            in_adj[w].pop(v, None)
+        in_adj[v].clear()
+        out_adj[v].clear()
+        for x in neighbours:
+            deleted_neighbours[x] += 1
+
+    # split every edge into the upward (forward) or downward (reverse) search graph
+    if all_edges:
+        pairs = np.array(list(all_edges.keys()), dtype=np.int64)
+        costs = np.fromiter(all_edges.values(), dtype=np.float64, count=len(all_edges))
+        mids = np.fromiter((middle.get(k, -1) for k in all_edges), dtype=np.int64, count=len(all_edges))
+    else:
+        pairs, costs, mids = np.zeros((0, 2), dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    u, w = pairs[:, 0], pairs[:, 1]
+    upward = rank[w] > rank[u]
+
+    def to_csr(src, dst, c, m):
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        return indptr, dst[order].astype(np.int32), c[order].astype(np.float32), m[order].astype(np.int32)
+
+    up = to_csr(u[upward], w[upward], costs[upward], mids[upward])
+    # downward edges u → w (rank[u] > rank[w]) are searched backwards from w
+    down = to_csr(w[~upward], u[~upward], costs[~upward], mids[~upward])
+
+    return ContractionHierarchy(
+        rank=rank,
+        up_indptr=up[0], up_indices=up[1], up_cost=up[2], up_mid=up[3],
+        down_indptr=down[0], down_indices=down[1], down_cost=down[2], down_mid=down[3],
+        fingerprint=graph_fingerprint(graph),
+    )
+
+
+def load_or_build_hierarchy(graph, cache_dir):
+    """Load the hierarchy serialized for this exact graph from cache_dir/ch, building it if missing."""
+    fingerprint = graph_fingerprint(graph)
+    path = os.path.join(cache_dir, "ch", f"{fingerprint}.npz")
+    if os.path.isfile(path):
+        try:
+            ch = ContractionHierarchy.load(path)
+            if ch.fingerprint == fingerprint:
+                log.info("💾 Loaded contraction hierarchy %s", fingerprint)
+                return ch
+        except Exception as e:
+            log.warning("⚠️ Could not load contraction hierarchy %s: %s", path, e)
+
+    log.info("🏗️ Building contraction hierarchy for %s nodes...", graph.n_nodes)
+    ch = build_contraction_hierarchy(graph)
+    try:
+        ch.save(path)
+    except OSError as e:
+        log.warning("⚠️ Could not save contraction hierarchy: %s", e)
+    return ch
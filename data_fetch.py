@@ -1,84 +1,424 @@
 # utils/data_fetch.py
 import geopandas as gpd
 import networkx as nx
+import numpy as np
+import os
 import pandas as pd
-import traceback
-from shapely.geometry import Point
+import threading
+from collections import OrderedDict
+from shapely.geometry import Point, box
 
-def fetch_osm_data(location_query: str, point: tuple = None, dist_m: int = 2000):
+from utils.compact_graph import GEOMETRY_STORED, CompactGraph, stored_geometry_flags
+from utils.instrumentation import get_logger
+from utils.osm_cache import file_key, get_osm_cache, place_key, point_key, snap_point
+from utils.osm_file import read_osm_file
+from utils.tiles import TILE_ZOOM, point_window, tile_bounds, tiles_for_bbox
+
+log = get_logger(__name__)
+
+# point queries are stitched from cached z14 tiles unless disabled
+USE_TILES = os.environ.get("WALK_USE_TILES", "1").lower() in ("1", "true", "yes")
+# decoded tiles kept in memory per process (each is one tile's nodes/edges/pois)
+TILE_MEMORY_SLOTS = int(os.environ.get("WALK_TILE_MEMORY_SLOTS", 64))
+# local .osm(.gz/.bz2) / .osm.pbf extract to read instead of Overpass (air-gapped batch runs)
+OSM_FILE = os.environ.get("WALK_OSM_FILE") or None
+
+# way tags kept on edges for _add_walk_attributes
+WALK_TAGS = ["sidewalk", "sidewalk:left", "sidewalk:right", "footway", "crossing", "lit", "surface"]
+SIDEWALK_KEYS = ("sidewalk", "sidewalk:left", "sidewalk:right")
+SIDEWALK_YES = ["yes", "both", "left", "right", "1", "true"]
+LIT_YES = ["yes", "24/7", "automatic", "limited", "sunset-sunrise", "interval", "1", "true"]
+
+# walk_class categories, most pedestrian first; highway values not listed are "other"
+WALK_CLASSES = ("pedestrian", "cycleway", "local", "arterial", "other")
+HIGHWAY_CLASS = {
+    **dict.fromkeys(["footway", "pedestrian", "path", "steps", "living_street", "corridor",
+                     "track", "bridleway", "crossing"], 0),
+    "cycleway": 1,
+    **dict.fromkeys(["residential", "service", "unclassified", "road"], 2),
+    **dict.fromkeys(["primary", "primary_link", "secondary", "secondary_link", "tertiary",
+                     "tertiary_link", "trunk", "trunk_link"], 3),
+}
+
+SURFACE_CLASSES = ("paved", "unpaved", "unknown")
+PAVED_SURFACES = ["paved", "asphalt", "concrete", "concrete:plates", "concrete:lanes", "paving_stones",
+                  "sett", "cobblestone", "unhewn_cobblestone", "bricks", "metal", "wood", "rubber"]
+UNPAVED_SURFACES = ["unpaved", "gravel", "fine_gravel", "compacted", "dirt", "earth", "ground", "grass",
+                    "mud", "sand", "pebblestone", "rock", "woodchips"]
+
+POI_TAGS = {
+    "amenity": True,
+    "shop": True,
+    "leisure": True,
+    "tourism": True,
+    "public_transport": True,
+}
+
+_tile_memory = OrderedDict()
+_tile_memory_lock = threading.Lock()
+
+# whether the last fetch_osm_data call in this thread returned everything it asked for
+_fetch_state = threading.local()
+
+
+def _fetch_incomplete():
+    _fetch_state.complete = False
+
+
+def fetch_complete():
+    """
+    False when the last fetch_osm_data call in this thread fell back to
+    partial data: a tile or the POIs failed to load, or the whole fetch did
+    (empty frames). Results built from such a fetch must not be cached.
+    """
+    return getattr(_fetch_state, "complete", True)
+
+
+def _configure_osmnx(ox):
+    """Keep the tags the walk-attribute pass reads on simplified edges."""
+    missing = [t for t in WALK_TAGS if t not in ox.settings.useful_tags_way]
+    if missing:
+        ox.settings.useful_tags_way = list(ox.settings.useful_tags_way) + missing
+
+
+def _tag_values(edges, key):
+    """
+    Lowercased values of one tag, one row per value on the positional edge
+    index: list-valued tags (merged by simplification) explode into several rows.
+    """
+    values = pd.Series(edges[key].to_numpy(dtype=object)).explode()
+    values = values[values.notna()]
+    return values.astype(str).str.strip().str.lower()
+
+
+def _positions(values, n, accepted=None):
+    """Boolean mask over n edges: edges having any value (in `accepted`, when given)."""
+    mask = np.zeros(n, dtype=bool)
+    hits = values if accepted is None else values[values.isin(accepted)]
+    mask[hits.index.to_numpy(dtype=np.intp)] = True
+    return mask
+
+
+def _add_walk_attributes(edges):
+    """
+    Tag normalization in one vectorized pass (no per-edge Python calls):
+    - has_sidewalk: the first of sidewalk / sidewalk:left / sidewalk:right
+      present on an edge decides; a list value counts if any element is positive
+    - walk_class:   categorical from highway (most pedestrian class for lists)
+    - is_crossing:  footway=crossing, highway=crossing or a crossing=* tag other than "no"
+    - is_lit:       lit=yes/24/7/automatic/...
+    - surface_class: categorical paved / unpaved / unknown
+    """
+    n = len(edges)
+
+    has_sidewalk = np.zeros(n, dtype=bool)
+    decided = np.zeros(n, dtype=bool)
+    for key in SIDEWALK_KEYS:
+        if key not in edges.columns:
+            continue
+        values = _tag_values(edges, key)
+        take = _positions(values, n) & ~decided
+        has_sidewalk[take] = _positions(values, n, SIDEWALK_YES)[take]
+        decided |= take
+    edges["has_sidewalk"] = has_sidewalk
+
+    walk_class = np.full(n, len(WALK_CLASSES) - 1)
+    if "highway" in edges.columns:
+        ranks = _tag_values(edges, "highway").map(HIGHWAY_CLASS).fillna(len(WALK_CLASSES) - 1)
+        best = ranks.groupby(level=0).min()
+        walk_class[best.index.to_numpy(dtype=np.intp)] = best.to_numpy(dtype=int)
+    edges["walk_class"] = pd.Categorical.from_codes(walk_class, categories=list(WALK_CLASSES))
+
+    is_crossing = np.zeros(n, dtype=bool)
+    for key, accepted in (("footway", ["crossing"]), ("highway", ["crossing"])):
+        if key in edges.columns:
+            is_crossing |= _positions(_tag_values(edges, key), n, accepted)
+    if "crossing" in edges.columns:
+        crossing = _tag_values(edges, "crossing")
+        is_crossing |= _positions(crossing[crossing != "no"], n)
+    edges["is_crossing"] = is_crossing
+
+    edges["is_lit"] = _positions(_tag_values(edges, "lit"), n, LIT_YES) if "lit" in edges.columns \
+        else np.zeros(n, dtype=bool)
+
+    surface = np.full(n, SURFACE_CLASSES.index("unknown"))
+    if "surface" in edges.columns:
+        values = _tag_values(edges, "surface")
+        surface[_positions(values, n, UNPAVED_SURFACES)] = SURFACE_CLASSES.index("unpaved")
+        # any paved segment of a merged edge wins
+        surface[_positions(values, n, PAVED_SURFACES)] = SURFACE_CLASSES.index("paved")
+    edges["surface_class"] = pd.Categorical.from_codes(surface, categories=list(SURFACE_CLASSES))
+    return edges
+
+
+def _add_geometry_flags(G, edges):
+    """
+    Record in the edges which ones carried their own geometry in G
+    (GEOMETRY_STORED). The flag is stored with the extract, so cache hits and
+    stitched tiles extract the same blocks as a cold fetch.
+    """
+    edges[GEOMETRY_STORED] = stored_geometry_flags(edges, G)
+    return edges
+
+
+def _load_tile(x, y, zoom, cache):
+    """One tile's unsimplified (nodes, edges, pois): memory → disk cache → Overpass."""
+    import osmnx as ox
+
+    _configure_osmnx(ox)
+    tile_key = f"tile:{zoom}/{x}/{y}"
+    with _tile_memory_lock:
+        if tile_key in _tile_memory:
+            _tile_memory.move_to_end(tile_key)
+            return _tile_memory[tile_key]
+
+    cached = cache.get(tile_key, build_graph=False) if cache is not None else None
+    if cached is not None:
+        _, nodes, edges, pois = cached
+    else:
+        if cache is not None and cache.offline:
+            raise RuntimeError(f"Offline mode and no cached tile {tile_key}")
+
+        polygon = box(*tile_bounds(x, y, zoom))
+        # truncate_by_edge keeps ways crossing the tile border so neighbours stitch on shared nodes;
+        # tiles stay unsimplified (one edge per OSM segment) so the seams are simplified once, after stitching
+        G = ox.graph_from_polygon(polygon, network_type="walk", simplify=False,
+                                  retain_all=True, truncate_by_edge=True)
+        nodes, edges = ox.graph_to_gdfs(G, nodes=True, edges=True)
+
+        try:
+            pois = ox.features_from_polygon(polygon, tags=POI_TAGS)
+            pois = pois[~pois.geometry.is_empty]
+            pois_ok = True
+        except Exception as e:
+            log.warning("⚠️  POI fetch failed for %s: %s", tile_key, e)
+            pois = gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326")
+            pois_ok = False
+
+        if cache is not None and pois_ok:
+            cache.put(tile_key, G, nodes, edges, pois)
+        if not pois_ok:
+            # used for this window only; the next request fetches the tile again
+            _fetch_incomplete()
+            return nodes, edges, pois
+
+    tile = (nodes, edges, pois)
+    with _tile_memory_lock:
+        _tile_memory[tile_key] = tile
+        while len(_tile_memory) > TILE_MEMORY_SLOTS:
+            _tile_memory.popitem(last=False)
+    return tile
+
+
+def _fetch_tiled(lat, lon, dist_m, cache, compact=False):
+    """
+    Build the dist_m window around a point from fixed z14 tiles:
+    load every tile the window touches, stitch their unsimplified segments
+    on shared OSM node ids, clip to the window and simplify the result once,
+    so ways crossing a tile border come out as single edges. compact=True
+    returns a CompactGraph in place of the networkx graph.
+    """
+    import osmnx as ox
+
+    west, south, east, north = point_window(lat, lon, dist_m)
+    tile_ids = tiles_for_bbox(west, south, east, north, TILE_ZOOM)
+    log.info("🧱 Stitching %s z%s tiles around (%s, %s) ±%s m", len(tile_ids), TILE_ZOOM, lat, lon, dist_m)
+
+    from osmnx._errors import InsufficientResponseError
+
+    tiles = []
+    for x, y in tile_ids:
+        try:
+            tiles.append(_load_tile(x, y, TILE_ZOOM, cache))
+        except InsufficientResponseError as e:
+            # e.g. a tile of open water has no walk network
+            log.info("ℹ️ Tile %s/%s/%s has no walk network: %s", TILE_ZOOM, x, y, e)
+        except Exception as e:
+            log.warning("⚠️  Tile %s/%s/%s unavailable: %s", TILE_ZOOM, x, y, e)
+            _fetch_incomplete()
+
+    if not tiles:
+        raise RuntimeError("No tiles could be loaded for this window")
+
+    nodes = pd.concat([t[0] for t in tiles])
+    nodes = nodes[~nodes.index.duplicated(keep="first")]
+    nodes = nodes[(nodes["x"] >= west) & (nodes["x"] <= east) & (nodes["y"] >= south) & (nodes["y"] <= north)]
+
+    edges = pd.concat([t[1] for t in tiles])
+    edges = edges[~edges.index.duplicated(keep="first")]
+    u = edges.index.get_level_values("u")
+    v = edges.index.get_level_values("v")
+    edges = edges[u.isin(nodes.index) & v.isin(nodes.index)]
+
+    if len(nodes) == 0 or len(edges) == 0:
+        raise RuntimeError("No walk network inside the requested window")
+
+    nodes = gpd.GeoDataFrame(nodes, geometry="geometry", crs="EPSG:4326")
+    # segment geometries are straight lines; simplify_graph rebuilds them for the edges it merges
+    edges = gpd.GeoDataFrame(edges.drop(columns="geometry"), geometry=gpd.GeoSeries(None, index=edges.index),
+                             crs="EPSG:4326")
+    G = ox.simplify_graph(ox.graph_from_gdfs(nodes, edges))
+    nx.set_node_attributes(G, ox.stats.count_streets_per_node(G), name="street_count")
+    nodes, edges = ox.graph_to_gdfs(G, nodes=True, edges=True)
+    _add_walk_attributes(edges)
+    _add_geometry_flags(G, edges)
+    if compact:
+        G = CompactGraph.from_osmnx(G, nodes, edges)
+
+    poi_frames = [t[2] for t in tiles if len(t[2]) > 0]
+    if poi_frames:
+        pois = pd.concat(poi_frames)
+        pois = pois[~pois.index.duplicated(keep="first")]
+        pois = gpd.GeoDataFrame(pois, geometry="geometry", crs="EPSG:4326")
+        pois = pois[pois.intersects(box(west, south, east, north))]
+    else:
+        pois = gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326")
+
+    return G, nodes, edges, pois
+
+
+def extract_key(location_query: str, point: tuple = None, dist_m: int = 2000, use_tiles: bool = USE_TILES,
+                osm_file: str = OSM_FILE):
+    """
+    Key naming the extract fetch_osm_data returns for these arguments: its
+    OSM cache key, or a key for the tile-backed window. Computed without
+    fetching anything.
+    """
+    if osm_file:
+        return file_key(osm_file, point, dist_m)
+    if point and use_tiles:
+        return f"tiles:z{TILE_ZOOM}:{point_key(point[0], point[1], dist_m)}"
+    if point:
+        return point_key(point[0], point[1], dist_m)
+    return place_key(location_query)
+
+
+def fetch_osm_data(location_query: str, point: tuple = None, dist_m: int = 2000, use_cache: bool = True,
+                   use_tiles: bool = USE_TILES, compact: bool = False, osm_file: str = OSM_FILE,
+                   graph: CompactGraph = None):
     """
     Fetch OSM walk network for a location or lat/lon point.
     Larger radius (2 km) helps capture meaningful variation across cities.
     Also fetches amenities/shops/leisure POIs for contextual scoring.
+    Extracts are served from / stored in the on-disk OSM cache unless use_cache=False.
+    Point queries are assembled from shared z14 tiles unless use_tiles=False.
+    compact=True returns a CompactGraph (utils/compact_graph.py) in place of
+    the networkx graph, converted once and never materialized on cache hits.
+    osm_file reads a local OSM extract (streamed, utils/osm_file.py) instead of
+    the network: point queries take their dist_m window out of it, place
+    queries use the whole file.
+    graph: a CompactGraph already built for this extract (e.g. attached from
+    utils/area_store.py), returned as is on cache hits with compact=True.
     """
     import osmnx as ox  # ensure import works at runtime
 
+    _configure_osmnx(ox)
+    _fetch_state.complete = True
     try:
-        print(f"\n🌍 Fetching OSM data for: {location_query}")
+        log.info("🌍 Fetching OSM data for: %s", location_query)
+
+        cache = get_osm_cache() if use_cache else None
+
+        # ----------------------------
+        # 0️⃣ Tile-backed point window
+        # ----------------------------
+        if point and use_tiles and not osm_file:
+            lat, lon = point
+            G, nodes, edges, pois = _fetch_tiled(lat, lon, dist_m, cache, compact=compact)
+            log.info("📦 Data summary: nodes=%s, edges=%s, pois=%s", len(nodes), len(edges), len(pois))
+            return G, nodes, edges, pois
+
+        # ----------------------------
+        # 0️⃣ Local extract cache
+        # ----------------------------
+        cache_key = extract_key(location_query, point, dist_m, use_tiles=False, osm_file=osm_file)
+        if point and not osm_file and cache is not None:
+            # fetch around the snapped point so the entry matches its key exactly
+            point = snap_point(*point)
+
+        if cache is not None:
+            cached = cache.get(cache_key, build_graph=not compact)
+            if cached is not None:
+                G, nodes, edges, pois = cached
+                if compact:
+                    G = graph if isinstance(graph, CompactGraph) else CompactGraph.from_gdfs(nodes, edges)
+                log.info("💾 Cache hit (%s) — nodes=%s, edges=%s, pois=%s", cache_key, len(nodes), len(edges), len(pois))
+                return G, nodes, edges, pois
+            if cache.offline and not osm_file:
+                raise RuntimeError(f"Offline mode and no cached extract for {cache_key}")
 
         # ----------------------------
         # 1️⃣ Fetch the OSM network
         # ----------------------------
+        if osm_file:
+            bbox = point_window(point[0], point[1], dist_m) if point else None
+            G, nodes, edges, pois = read_osm_file(osm_file, bbox=bbox, poi_tags=POI_TAGS)
+            _add_walk_attributes(edges)
+            _add_geometry_flags(G, edges)
+            if cache is not None:
+                cache.put(cache_key, G, nodes, edges, pois)
+            if compact:
+                G = CompactGraph.from_osmnx(G, nodes, edges)
+            log.info("📦 Data summary: nodes=%s, edges=%s, pois=%s", len(nodes), len(edges), len(pois))
+            return G, nodes, edges, pois
+
         if point:
             lat, lon = point
-            print(f"📍 Using point-based fetch around ({lat}, {lon}) ±{dist_m} m")
+            log.info("📍 Using point-based fetch around (%s, %s) ±%s m", lat, lon, dist_m)
             G = ox.graph_from_point((lat, lon), dist=dist_m, network_type="walk", simplify=True)
         else:
-            print("📍 Using place-name fetch via Nominatim")
+            log.info("📍 Using place-name fetch via Nominatim")
             G = ox.graph_from_place(location_query, network_type="walk", simplify=True)
 
         nodes, edges = ox.graph_to_gdfs(G, nodes=True, edges=True)
-        print(f"✅ OSM fetch successful — nodes={len(nodes)}, edges={len(edges)}")
+        log.info("✅ OSM fetch successful — nodes=%s, edges=%s", len(nodes), len(edges))
 
         # ----------------------------
         # 2️⃣ Infer sidewalk presence
         # ----------------------------
-        def infer_sidewalk(row):
-            for key in ["sidewalk", "sidewalk:left", "sidewalk:right"]:
-                if key in row and pd.notna(row[key]):
-                    val = str(row[key]).lower()
-                    return val in ("yes", "both", "left", "right", "1", "true")
-            return False
-
-        if "has_sidewalk" not in edges.columns:
-            edges["has_sidewalk"] = edges.apply(infer_sidewalk, axis=1)
+        _add_walk_attributes(edges)
+        _add_geometry_flags(G, edges)
 
         # ----------------------------
         # 3️⃣ Fetch POIs (amenities, shops, leisure, transport)
         # ----------------------------
-        tags = {
-            "amenity": True,
-            "shop": True,
-            "leisure": True,
-            "tourism": True,
-            "public_transport": True,
-        }
-
+        pois_ok = True
         try:
             if point:
-                pois = ox.features_from_point((lat, lon), dist=dist_m, tags=tags)
+                pois = ox.features_from_point((lat, lon), dist=dist_m, tags=POI_TAGS)
             else:
-                pois = ox.features_from_place(location_query, tags=tags)
+                pois = ox.features_from_place(location_query, tags=POI_TAGS)
 
             # Drop empty geometries
             pois = pois[~pois.geometry.is_empty]
-            print(f"🏙️  POIs fetched: {len(pois)}")
+            log.info("🏙️  POIs fetched: %s", len(pois))
         except Exception as e:
-            print("⚠️  POI fetch failed:", e)
+            log.warning("⚠️  POI fetch failed: %s", e)
             pois = gpd.GeoDataFrame(columns=["geometry"], geometry="geometry")
+            pois_ok = False
+            _fetch_incomplete()
+
+        # only complete extracts are worth keeping
+        if cache is not None and pois_ok:
+            cache.put(cache_key, G, nodes, edges, pois)
+
+        if compact:
+            G = CompactGraph.from_osmnx(G, nodes, edges)
 
         # ----------------------------
         # 4️⃣ Return everything
         # ----------------------------
-        print(f"📦 Data summary: nodes={len(nodes)}, edges={len(edges)}, pois={len(pois)}\n")
+        log.info("📦 Data summary: nodes=%s, edges=%s, pois=%s", len(nodes), len(edges), len(pois))
         return G, nodes, edges, pois
 
     except Exception:
-        print("❌ OSM fetch failed:")
-        traceback.print_exc()
+        log.exception("❌ OSM fetch failed:")
+        _fetch_incomplete()
 
         empty_nodes = gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326")
         empty_edges = gpd.GeoDataFrame(columns=["geometry", "has_sidewalk"], geometry="geometry", crs="EPSG:4326")
         empty_pois = gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326")
 
+        if compact:
+            return CompactGraph.from_gdfs(empty_nodes, empty_edges), empty_nodes, empty_edges, empty_pois
         return nx.Graph(), empty_nodes, empty_edges, empty_pois
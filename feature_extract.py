@@ -1,67 +1,278 @@
 # utils/feature_extract.py
 import geopandas as gpd
 import networkx as nx
+import numpy as np
+import os
 import shapely
 import shapely.ops as ops
 from shapely.geometry import MultiPolygon, Polygon
-import traceback
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_features(nodes_gdf, edges_gdf, pois_gdf=None, G=None):
+from utils.compact_graph import GEOMETRY_STORED, CompactGraph, stored_geometry_flags
+from utils.instrumentation import get_logger
+from utils.projection import WGS84, area_crs, to_metric, to_wgs84, transform_geoms
+
+log = get_logger(__name__)
+
+# "vectorized" (array component labels, one projection + buffer) or "components" (per-subgraph loop)
+EXTRACT_MODE = os.environ.get("WALK_EXTRACT_MODE", "vectorized")
+# components with at least this many edges are unioned in a process pool (when workers > 0)
+PARALLEL_UNION_MIN_EDGES = int(os.environ.get("WALK_PARALLEL_UNION_MIN_EDGES", 5000))
+UNION_WORKERS = int(os.environ.get("WALK_UNION_WORKERS", 0))
+
+# post-extraction clean-up of block outlines: topology-preserving simplification
+# tolerance and the coordinate grid they are snapped to (both in metres, 0 disables)
+BLOCK_SIMPLIFY_M = float(os.environ.get("WALK_BLOCK_SIMPLIFY_M", 1.0))
+BLOCK_PRECISION_M = float(os.environ.get("WALK_BLOCK_PRECISION_M", 0.1))
+
+BUFFER_M = 6
+MIN_BLOCK_AREA_M2 = 30
+# metres per degree of latitude, for expressing the precision grid in EPSG:4326
+M_PER_DEG = 111_320
+
+
+def _component_polygons(G, crs):
+    """Original path: one subgraph copy and union per connected component."""
+    subgraphs = [G.subgraph(c).copy() for c in nx.connected_components(G.to_undirected())]
+    log.info("🔹 Found %s connected components", len(subgraphs))
+
+    # the graph keeps its own (fetch) CRS: project every component's edges in one batch
+    sub_edges = [[data["geometry"] for _, _, data in subG.edges(data=True) if "geometry" in data] for subG in subgraphs]
+    projected = transform_geoms([g for geoms in sub_edges for g in geoms], G.graph.get("crs", WGS84), crs)
+    ends = np.cumsum([len(geoms) for geoms in sub_edges])
+
+    all_polygons = []
+    for start, end in zip(np.r_[0, ends[:-1]], ends):
+        if start == end:
+            continue
+
+        # buffer only this component
+        buffered = gpd.GeoSeries(projected[start:end], crs=crs).buffer(BUFFER_M)
+        merged = ops.unary_union(buffered)
+
+        # break multipolygons into individual polygons
+        if isinstance(merged, Polygon):
+            polygons = [merged]
+        elif isinstance(merged, MultiPolygon):
+            polygons = list(merged.geoms)
+        else:
+            polygons = []
+
+        for poly in polygons:
+            if poly.area > MIN_BLOCK_AREA_M2:  # ignore tiny bits
+                all_polygons.append(poly)
+    return all_polygons
+
+
+def _edge_component_labels(edges_gdf):
+    """Connected-component id per edge row, from the (u, v) index arrays — no subgraph copies."""
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    u = edges_gdf.index.get_level_values(0).to_numpy()
+    v = edges_gdf.index.get_level_values(1).to_numpy()
+    node_ids, inverse = np.unique(np.concatenate([u, v]), return_inverse=True)
+    ui, vi = inverse[: len(u)], inverse[len(u):]
+
+    adjacency = coo_matrix((np.ones(len(ui), dtype=np.int8), (ui, vi)), shape=(len(node_ids), len(node_ids)))
+    n_components, node_labels = connected_components(adjacency, directed=False)
+    return n_components, node_labels[ui]
+
+
+def _stored_geometry_mask(G, edges_gdf):
     """
-    Convert network edges into multiple local walkability blocks
-    by splitting the graph into subcomponents and buffering each separately.
+    The component path only buffers edges that carry a 'geometry' attribute in G
+    (graph_to_gdfs fills straight lines for the rest); keep that selection.
+    The fetch's GEOMETRY_STORED column wins over G, which a graph rebuilt with
+    graph_from_gdfs no longer tells apart.
     """
-    try:
-        if edges_gdf is None or len(edges_gdf) == 0:
-            print("⚠️ No edges found — cannot extract features.")
-            return gpd.GeoDataFrame(), edges_gdf, nodes_gdf
+    if GEOMETRY_STORED not in edges_gdf.columns and (G is None or len(G) == 0 or not G.is_multigraph()):
+        return np.ones(len(edges_gdf), dtype=bool)
+    return stored_geometry_flags(edges_gdf, G)
+
+
+def _union_group(geoms):
+    return shapely.union_all(geoms)
+
+
+def _vectorized_polygons(G, edges_gdf, crs, union_workers=UNION_WORKERS):
+    """
+    Array path: label edges by component, buffer every edge (in the metric
+    `crs`) in one call, then dissolve the buffers per component label. A
+    CompactGraph supplies the labels and stored-geometry flags directly.
+    """
+    if isinstance(G, CompactGraph):
+        n_components, labels = G.edge_component_labels()
+        keep = G.geometry_stored
+        edges, labels = edges_gdf.iloc[G.edge_row[keep]], labels[keep]
+        present = edges.geometry.notna().to_numpy()
+        edges, labels = edges[present], labels[present]
+        if len(edges) == 0:
+            return []
+    else:
+        edges = edges_gdf[_stored_geometry_mask(G, edges_gdf)]
+        edges = edges[edges.geometry.notna()]
+        if len(edges) == 0:
+            return []
+        n_components, labels = _edge_component_labels(edges)
+    log.info("🔹 Found %s connected components", n_components)
+
+    # one vectorized buffer for every edge (a no-op projection when the pipeline already projected them)
+    # (quad_segs=16 matches GeoSeries.buffer, which the component path uses)
+    buffered = shapely.buffer(to_metric(edges.geometry, crs).to_numpy(), BUFFER_M, quad_segs=16)
+
+    # group buffers by component label
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+
+    merged = [None] * len(starts)
+    big = []
+    for g, (s, e) in enumerate(zip(starts, ends)):
+        if e - s == 1:
+            merged[g] = buffered[order[s]]
+        elif union_workers > 0 and e - s >= PARALLEL_UNION_MIN_EDGES:
+            big.append(g)
+        else:
+            merged[g] = shapely.union_all(buffered[order[s:e]])
+
+    if big:
+        log.info("🔹 Unioning %s large components across %s processes", len(big), union_workers)
+        with ProcessPoolExecutor(max_workers=union_workers) as pool:
+            results = pool.map(_union_group, [buffered[order[starts[g]:ends[g]]] for g in big])
+            for g, geom in zip(big, results):
+                merged[g] = geom
+
+    # break multipolygons into individual polygons, ignore tiny bits
+    parts = shapely.get_parts(np.asarray(merged, dtype=object))
+    parts = parts[shapely.get_type_id(parts) == 3]
+    return list(parts[shapely.area(parts) > MIN_BLOCK_AREA_M2])
+
 
-        print("🧩 Extracting multi-block features from edges...")
+def _vertex_count(geoms):
+    return int(shapely.get_num_coordinates(np.asarray(geoms, dtype=object)).sum())
 
-        # Fallback: build graph if not provided
-        if G is None or len(G) == 0:
-            import osmnx as ox
-            G = ox.graph_from_gdfs(nodes_gdf, edges_gdf)
 
-        # 1️⃣ Split graph into connected components
-        subgraphs = [G.subgraph(c).copy() for c in nx.connected_components(G.to_undirected())]
-        print(f"🔹 Found {len(subgraphs)} connected components")
+def simplify_blocks(blocks_m, tolerance_m=BLOCK_SIMPLIFY_M):
+    """
+    Simplify block polygons (an array of geometries in metres) with
+    topology-preserving Douglas-Peucker at `tolerance_m`, in one vectorized
+    call. Blocks are unions of 16-segment buffer arcs, so most of their
+    vertices sit well within a metre of their neighbours. A block that would
+    collapse keeps its original outline, so rows stay aligned.
+    """
+    blocks_m = np.asarray(blocks_m, dtype=object)
+    if tolerance_m <= 0 or len(blocks_m) == 0:
+        return blocks_m
+    simplified = shapely.simplify(blocks_m, tolerance_m, preserve_topology=True)
+    collapsed = shapely.is_empty(simplified) | (shapely.area(simplified) <= MIN_BLOCK_AREA_M2)
+    return np.where(collapsed, blocks_m, simplified)
 
-        all_polygons = []
-        for idx, subG in enumerate(subgraphs):
-            sub_edges = [data["geometry"] for _, _, data in subG.edges(data=True) if "geometry" in data]
-            if not sub_edges:
-                continue
 
-            # project to metric for proper buffering
-            sub_gdf = gpd.GeoDataFrame(geometry=sub_edges, crs=edges_gdf.crs).to_crs(epsg=3857)
+def snap_precision(blocks, precision_m=BLOCK_PRECISION_M):
+    """
+    Snap block geometries to a `precision_m` grid with shapely.set_precision,
+    which also drops vertices that land on the same grid point. Blocks in
+    EPSG:4326 use the nearest decimal-degree grid (1e-6° for the 0.1 m
+    default), so shorter coordinates make GeoJSON / map output smaller.
+    """
+    if precision_m <= 0 or len(blocks) == 0:
+        return blocks
+    if blocks.crs is not None and blocks.crs.is_projected:
+        grid = precision_m
+    else:
+        grid = 10.0 ** -round(np.log10(M_PER_DEG / precision_m))
+    geoms = blocks.geometry.to_numpy()
+    snapped = shapely.set_precision(geoms, grid)
+    blocks = blocks.copy()
+    blocks.geometry = np.where(shapely.is_empty(snapped), geoms, snapped)
+    return blocks
+
+
+def simplification_report(raw_blocks, blocks, edges_gdf, nodes_gdf=None, pois_gdf=None):
+    """
+    Vertex-count reduction between the full-resolution and simplified blocks
+    (same rows and CRS) and its effect on compute_walkability: mean / max
+    absolute score change (0-100 scale) and the Spearman rank correlation.
+    """
+    import contextlib
+    import io
+
+    from scipy.stats import spearmanr
+
+    from utils.scoring import compute_walkability
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        before = compute_walkability(raw_blocks, edges_gdf, nodes_gdf, pois_gdf)["walkability_score"].to_numpy()
+        after = compute_walkability(blocks, edges_gdf, nodes_gdf, pois_gdf)["walkability_score"].to_numpy()
+    diff = np.abs(after - before)
+    area_before = to_metric(raw_blocks).area.sum()
+    area_after = to_metric(blocks, area_crs(raw_blocks)).area.sum()
+    n_before, n_after = _vertex_count(raw_blocks.geometry), _vertex_count(blocks.geometry)
+    return {
+        "blocks": len(blocks),
+        "vertices_before": n_before,
+        "vertices_after": n_after,
+        "vertex_reduction": 1 - n_after / max(n_before, 1),
+        "area_change": area_after / max(area_before, 1e-9) - 1,
+        "score_mean_abs_diff": float(diff.mean()) if len(diff) else 0.0,
+        "score_max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+        "rank_correlation": float(spearmanr(before, after)[0]) if len(diff) > 1 else 1.0,
+    }
+
+
+def extract_features(nodes_gdf, edges_gdf, pois_gdf=None, G=None, mode=EXTRACT_MODE, union_workers=UNION_WORKERS,
+                     simplify_m=BLOCK_SIMPLIFY_M, precision_m=BLOCK_PRECISION_M):
+    """
+    Convert network edges into multiple local walkability blocks
+    by splitting the graph into subcomponents and buffering each separately.
+    mode="vectorized" does this with array component labels and one
+    buffer/dissolve pass (large components optionally unioned across
+    `union_workers` processes); mode="components" is the per-subgraph loop.
+    G may be the networkx graph or the area's CompactGraph.
+    Block outlines are then simplified (`simplify_m`) and snapped to a
+    `precision_m` grid; pass 0 for either to keep full resolution.
+    Blocks come back in the CRS of edges_gdf when it is projected (see
+    utils/projection.py), else buffered in the local UTM zone and returned
+    in EPSG:4326.
+    """
+    try:
+        if edges_gdf is None or len(edges_gdf) == 0:
+            log.warning("⚠️ No edges found — cannot extract features.")
+            return gpd.GeoDataFrame(), edges_gdf, nodes_gdf
 
-            # buffer only this component
-            buffered = sub_gdf.buffer(6)
-            merged = ops.unary_union(buffered)
+        log.info("🧩 Extracting multi-block features from edges...")
+        crs = area_crs(edges_gdf)
+        projected_input = edges_gdf.crs is not None and edges_gdf.crs.is_projected
 
-            # break multipolygons into individual polygons
-            if isinstance(merged, Polygon):
-                polygons = [merged]
-            elif isinstance(merged, MultiPolygon):
-                polygons = list(merged.geoms)
-            else:
-                polygons = []
+        if mode == "components":
+            # Fallback: build graph if not provided
+            if G is None or isinstance(G, CompactGraph) or len(G) == 0:
+                import osmnx as ox
+                G = ox.graph_from_gdfs(nodes_gdf, edges_gdf)
 
-            for poly in polygons:
-                if poly.area > 30:  # ignore tiny bits
-                    all_polygons.append(poly)
+            # 1️⃣ Split graph into connected components
+            all_polygons = _component_polygons(G, crs)
+        else:
+            all_polygons = _vectorized_polygons(G, edges_gdf, crs, union_workers)
 
         if not all_polygons:
-            print("⚠️ No polygons generated, fallback to one combined block")
-            return gpd.GeoDataFrame(geometry=[ops.unary_union(edges_gdf.to_crs(epsg=3857).buffer(5))],
-                                    crs="EPSG:3857").to_crs(epsg=4326), edges_gdf, nodes_gdf
+            log.warning("⚠️ No polygons generated, fallback to one combined block")
+            blocks = gpd.GeoDataFrame(geometry=[ops.unary_union(to_metric(edges_gdf, crs).buffer(5))], crs=crs)
+            return (blocks if projected_input else to_wgs84(blocks)), edges_gdf, nodes_gdf
 
-        blocks = gpd.GeoDataFrame(geometry=all_polygons, crs="EPSG:3857").to_crs(epsg=4326)
-        print(f"✅ Extracted {len(blocks)} block polygons.")
+        n_vertices = _vertex_count(all_polygons)
+        all_polygons = simplify_blocks(all_polygons, simplify_m)
+        blocks = gpd.GeoDataFrame(geometry=all_polygons, crs=crs)
+        blocks = snap_precision(blocks if projected_input else to_wgs84(blocks), precision_m)
+        if simplify_m > 0 or precision_m > 0:
+            n_kept = _vertex_count(blocks.geometry)
+            log.info("🪶 Simplified block outlines: %s → %s vertices (-%.0f%%)",
+                     n_vertices, n_kept, 100 * (1 - n_kept / max(n_vertices, 1)))
+        log.info("✅ Extracted %s block polygons.", len(blocks))
         return blocks, edges_gdf, nodes_gdf
 
     except Exception as e:
-        traceback.print_exc()
-        print(f"❌ Feature extraction failed: {e}")
+        log.exception("❌ Feature extraction failed: %s", e)
         return gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326"), edges_gdf, nodes_gdf
@@ -0,0 +1,471 @@
+# utils/hexgrid.py
+"""
+Multi-resolution hexagonal aggregation of the street network.
+
+A pure-NumPy stand-in for H3: pointy-top hexagons laid out in the area's UTM
+zone (see utils/projection.py), so a cell is the same size in metres in
+every city and its id is stable across analyses. Resolution HEX_LEVELS - 1
+is the finest (edge length HEX_FINEST_M); every coarser resolution doubles
+the edge length. Edges (by length), nodes and POIs are binned into the
+finest cells in one vectorized pass; each coarser level is built by summing
+the additive aggregates of its children (a child belongs to the parent
+containing its centre, as in H3). Scores are absolute per-area densities,
+with no local min-max, so walkability_score compares across areas and
+resolutions.
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import CRS
+
+from utils.instrumentation import get_logger
+from utils.osm_cache import CACHE_DIR
+from utils.projection import WGS84, area_crs, to_metric, transform_geoms
+from utils.scoring import WEIGHTS, normalize_scores, rescore_blocks, score_features
+from utils.tiles import MERCATOR_HALF_WORLD
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+# edge length of the finest cells, in metres
+HEX_FINEST_M = float(os.environ.get("WALK_HEX_FINEST_M", 50))
+# number of resolutions (0 = coarsest, HEX_LEVELS - 1 = finest)
+HEX_LEVELS = int(os.environ.get("WALK_HEX_LEVELS", 5))
+HEX_DIR = os.environ.get("WALK_HEX_DIR", os.path.join(CACHE_DIR, "hex"))
+HEX_MAX_BYTES = int(float(os.environ.get("WALK_HEX_MAX_MB", 256)) * 1024 * 1024)
+# analysed areas whose cell tables are kept in memory
+HEX_MEMORY_SLOTS = int(os.environ.get("WALK_HEX_SLOTS", 16))
+# /hex?zoom= picks the resolution whose cells are closest to this many screen pixels across
+HEX_TARGET_PX = float(os.environ.get("WALK_HEX_TARGET_PX", 24))
+
+# densities (per hectare) at which the node / POI components saturate at 1.0
+NODE_SATURATION_PER_HA = 20.0
+POI_SATURATION_PER_HA = 10.0
+
+SQRT3 = math.sqrt(3.0)
+# summed from children to parents
+ADDITIVE = ["length_m", "sidewalk_m", "segments", "nodes", "pois"]
+# id layout: resolution (8 bits) | zone code (8 bits) | q + 2^23 (24 bits) | r + 2^23 (24 bits)
+_AXIAL_OFFSET = 1 << 23
+
+
+def hex_size(res):
+    """Edge length (= circumradius) of a resolution's cells, in metres."""
+    return HEX_FINEST_M * 2.0 ** (HEX_LEVELS - 1 - res)
+
+
+def hex_area(res):
+    return 1.5 * SQRT3 * hex_size(res) ** 2
+
+
+def hex_index(x, y, size):
+    """Axial (q, r) of the pointy-top hexagon containing each metric point (cube rounding)."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    qf = (SQRT3 / 3 * x - y / 3) / size
+    rf = (2 / 3 * y) / size
+    sf = -qf - rf
+    q, r, s = np.round(qf), np.round(rf), np.round(sf)
+    dq, dr, ds = np.abs(q - qf), np.abs(r - rf), np.abs(s - sf)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+    return q.astype(np.int64), r.astype(np.int64)
+
+
+def hex_centers(q, r, size):
+    """Metric centres of axial cells."""
+    q, r = np.asarray(q, dtype=float), np.asarray(r, dtype=float)
+    return size * SQRT3 * (q + r / 2), size * 1.5 * r
+
+
+def hex_polygons(q, r, size):
+    """Cell outlines (metric shapely polygons) for axial cells, in one vectorized call."""
+    cx, cy = hex_centers(q, r, size)
+    angles = np.radians(30 + 60 * np.arange(7))
+    ring = np.stack([cx[:, None] + size * np.cos(angles), cy[:, None] + size * np.sin(angles)], axis=-1)
+    return shapely.polygons(ring)
+
+
+def zone_code(crs):
+    """8-bit zone part of a cell id: UTM zone (north 1-60, south 101-160); 0 for any other CRS."""
+    epsg = CRS.from_user_input(crs).to_epsg() or 0
+    if 32601 <= epsg <= 32660 or 32701 <= epsg <= 32760:
+        return epsg - 32600
+    return 0
+
+
+def encode_cells(res, code, q, r):
+    """64-bit cell ids."""
+    q, r = np.asarray(q, dtype=np.int64), np.asarray(r, dtype=np.int64)
+    return (np.int64(res) << 56) | (np.int64(code) << 48) | ((q + _AXIAL_OFFSET) << 24) | (r + _AXIAL_OFFSET)
+
+
+def decode_cells(ids):
+    """(res, zone code, q, r) arrays for cell ids."""
+    ids = np.asarray(ids, dtype=np.int64)
+    mask = (1 << 24) - 1
+    return ids >> 56, (ids >> 48) & 0xFF, ((ids >> 24) & mask) - _AXIAL_OFFSET, (ids & mask) - _AXIAL_OFFSET
+
+
+def cell_token(cell_id):
+    """Hex-string form of a cell id, as used in JSON output."""
+    return f"{int(cell_id) & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+# ----------------------------
+# Binning and roll-up
+# ----------------------------
+def _bin(res, code, x, y, weights):
+    """Sum of `weights` columns per finest cell, as a frame indexed by cell id."""
+    q, r = hex_index(x, y, hex_size(res))
+    frame = pd.DataFrame(weights)
+    frame["cell"] = encode_cells(res, code, q, r)
+    return frame.groupby("cell", sort=False).sum()
+
+
+def _edge_segments(edges_m, step):
+    """Midpoints, lengths and sidewalk flags of every edge cut into pieces no longer than `step`."""
+    geoms = edges_m.geometry.to_numpy()
+    sidewalk = (edges_m["has_sidewalk"].astype(bool).to_numpy() if "has_sidewalk" in edges_m.columns
+                else np.zeros(len(edges_m), dtype=bool))
+    parts, part_edge = shapely.get_parts(geoms, return_index=True)
+    parts = shapely.segmentize(parts, step)
+    coords, part = shapely.get_coordinates(parts, return_index=True)
+    same = part[1:] == part[:-1]
+    start, end = coords[:-1][same], coords[1:][same]
+    mid = (start + end) / 2
+    length = np.hypot(*(end - start).T)
+    return mid[:, 0], mid[:, 1], length, sidewalk[part_edge[part[:-1][same]]]
+
+
+def aggregate_finest(edges_m, nodes_m=None, pois_m=None, code=0, res=None):
+    """Additive aggregates (ADDITIVE columns) of the finest cells touched by the layers (all metric)."""
+    res = HEX_LEVELS - 1 if res is None else res
+    frames = []
+    if edges_m is not None and len(edges_m) > 0:
+        x, y, length, sidewalk = _edge_segments(edges_m, hex_size(res) / 2)
+        frames.append(_bin(res, code, x, y, {"length_m": length, "sidewalk_m": length * sidewalk,
+                                             "segments": np.ones(len(length), dtype=np.int64)}))
+    if nodes_m is not None and len(nodes_m) > 0:
+        frames.append(_bin(res, code, shapely.get_x(nodes_m.geometry.to_numpy()),
+                           shapely.get_y(nodes_m.geometry.to_numpy()), {"nodes": np.ones(len(nodes_m), dtype=np.int64)}))
+    if pois_m is not None and len(pois_m) > 0:
+        points = shapely.point_on_surface(pois_m.geometry.to_numpy())
+        frames.append(_bin(res, code, shapely.get_x(points), shapely.get_y(points),
+                           {"pois": np.ones(len(pois_m), dtype=np.int64)}))
+    if not frames:
+        return pd.DataFrame(columns=ADDITIVE, index=pd.Index([], dtype=np.int64, name="cell"))
+    table = pd.concat(frames, axis=1).reindex(columns=ADDITIVE).fillna(0)
+    counts = ["segments", "nodes", "pois"]
+    table[counts] = table[counts].astype(np.int64)
+    return table.rename_axis("cell")
+
+
+def roll_up(children, child_res):
+    """Parent-resolution aggregates from child aggregates: each child goes to the parent containing its centre."""
+    if len(children) == 0:
+        return children.copy()
+    _, code, q, r = decode_cells(children.index.to_numpy())
+    cx, cy = hex_centers(q, r, hex_size(child_res))
+    pq, pr = hex_index(cx, cy, hex_size(child_res - 1))
+    parents = encode_cells(child_res - 1, code, pq, pr)
+    return children.groupby(parents).sum().rename_axis("cell")
+
+
+def hex_features(table, res):
+    """Per-cell FEATURES (+ edge_count, for score_features) from additive aggregates, as densities per area."""
+    area = hex_area(res)
+    length = table["length_m"].to_numpy(dtype=float)
+    ha = area / 10_000
+    features = pd.DataFrame({
+        "density_score": np.clip(np.log1p(length / area * 1000), 0, 6) / 6,
+        "intersection_density": np.clip(np.log1p(table["nodes"].to_numpy(dtype=float) / ha)
+                                        / np.log1p(NODE_SATURATION_PER_HA), 0, 1),
+        "coverage": table["sidewalk_m"].to_numpy(dtype=float) / np.maximum(length, 1e-9),
+        "amenity_density": np.clip(np.log1p(table["pois"].to_numpy(dtype=float) / ha)
+                                   / np.log1p(POI_SATURATION_PER_HA), 0, 1),
+    }, index=table.index)
+    # score_features zeroes cells without any street
+    features["edge_count"] = table["segments"].to_numpy()
+    return features
+
+
+class HexGrid:
+    """
+    Hex aggregates of one analysed area at every resolution. `levels[res]` is
+    a frame indexed by cell id with the ADDITIVE columns; `scored(res)` adds
+    FEATURES and walkability_score, `cells(res)` the cell outlines.
+    """
+
+    def __init__(self, levels, crs, weights=WEIGHTS):
+        self.levels = levels
+        self.crs = crs
+        self.weights = weights
+
+    @classmethod
+    def from_layers(cls, edges_gdf, nodes_gdf=None, pois_gdf=None, levels=HEX_LEVELS, weights=WEIGHTS):
+        """Bin an area's layers (projected to its metric CRS unless they already are) and roll up every level."""
+        crs = area_crs(edges_gdf)
+        edges_m, nodes_m, pois_m = (to_metric(g, crs) for g in (edges_gdf, nodes_gdf, pois_gdf))
+        table = aggregate_finest(edges_m, nodes_m, pois_m, zone_code(crs), levels - 1)
+        out = {levels - 1: table}
+        for res in range(levels - 1, 0, -1):
+            out[res - 1] = roll_up(out[res], res)
+        return cls(out, crs, weights)
+
+    @property
+    def finest(self):
+        return max(self.levels)
+
+    def scored(self, res=None, accessibility=None):
+        """Aggregates + features + absolute walkability_score (and the local walkability_score_normalized)."""
+        res = self.finest if res is None else res
+        table = self.levels[res]
+        features = hex_features(table, res)
+        score = score_features(features, self.weights, accessibility)
+        out = pd.concat([table, features], axis=1)
+        out["walkability_score"] = score
+        out["walkability_score_normalized"] = normalize_scores(score)
+        return out
+
+    def cells(self, res=None):
+        """Scored cells of one resolution as a GeoDataFrame of metric hexagons (a drop-in for blocks)."""
+        res = self.finest if res is None else res
+        scored = self.scored(res)
+        _, _, q, r = decode_cells(scored.index.to_numpy())
+        cells = gpd.GeoDataFrame(scored.reset_index(drop=True), geometry=hex_polygons(q, r, hex_size(res)), crs=self.crs)
+        cells.insert(0, "cell", scored.index.to_numpy())
+        return cells
+
+    def table(self):
+        """Every resolution in one frame (res, cell, centre lon/lat, aggregates, features, score) for the store."""
+        frames = []
+        for res in sorted(self.levels):
+            # the area-local normalized score means nothing across areas; edge_count repeats segments
+            scored = self.scored(res).drop(columns=["edge_count", "walkability_score_normalized"])
+            _, _, q, r = decode_cells(scored.index.to_numpy())
+            cx, cy = hex_centers(q, r, hex_size(res))
+            centres = transform_geoms(shapely.points(cx, cy), self.crs, WGS84)
+            scored.insert(0, "lat", shapely.get_y(centres))
+            scored.insert(0, "lon", shapely.get_x(centres))
+            scored.insert(0, "res", res)
+            frames.append(scored.rename_axis("cell").reset_index())
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def with_accessibility(cells, accessibility):
+    """Hex cells (from HexGrid.cells) with walk-time accessibility blended in, as compute_walkability does for blocks."""
+    if accessibility is None or len(accessibility) != len(cells):
+        return cells
+    cells = cells.copy()
+    for col in accessibility.columns:
+        cells[col] = accessibility[col].to_numpy()
+    return rescore_blocks(cells)
+
+
+def zoom_resolution(zoom, lat=0.0, target_px=HEX_TARGET_PX):
+    """Resolution whose cells span closest to `target_px` screen pixels at a web-map zoom level."""
+    pixel_m = 2 * MERCATOR_HALF_WORLD / (256 * 2 ** zoom) * math.cos(math.radians(lat))
+    wanted = target_px * pixel_m / SQRT3
+    return min(range(HEX_LEVELS), key=lambda res: abs(math.log(hex_size(res) / wanted)))
+
+
+# ----------------------------
+# Store (GET /hex)
+# ----------------------------
+class HexStore:
+    """
+    Cell tables of analysed areas, for dashboards. Every analysis saves its
+    table under root/<digest>.parquet with a sidecar JSON (bounds, created).
+    A query loads the areas overlapping the bbox (small in-memory LRU) and
+    returns the cells of one resolution whose centre lies inside; a cell id
+    seen in several areas comes from the most recently analysed one. The
+    least recently queried areas are evicted once the store outgrows
+    max_bytes.
+    """
+
+    def __init__(self, root=HEX_DIR, memory_slots=HEX_MEMORY_SLOTS, max_bytes=HEX_MAX_BYTES):
+        self.root = root
+        self.memory_slots = memory_slots
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._index = None
+        self._index_mtime = None
+        self._stats = {"queries": 0, "saves": 0, "evictions": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    def save(self, key, grid):
+        """Store an area's HexGrid under `key`, replacing a previous save."""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]
+        path = os.path.join(self.root, f"{digest}.parquet")
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        try:
+            table = grid.table()
+            if len(table) == 0:
+                return
+            table.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+            meta = {"key": key, "created": time.time(), "crs": grid.crs.to_string(),
+                    "bounds": [float(table["lon"].min()), float(table["lat"].min()),
+                               float(table["lon"].max()), float(table["lat"].max())]}
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(meta, fh)
+            os.replace(tmp, path[:-len(".parquet")] + ".json")
+        except Exception as e:
+            log.warning("⚠️ Could not save hex cells for %s: %s", key, e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._stats["saves"] += 1
+        self.evict()
+
+    def _entries(self):
+        """[(parquet path, sidecar path, last_query, size_bytes)] for every complete area."""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.root, name)
+            path = meta_path[:-len(".json")] + ".parquet"
+            try:
+                entries.append((path, meta_path, os.path.getmtime(meta_path),
+                                os.path.getsize(path) + os.path.getsize(meta_path)))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """Drop least-recently-queried areas until the store fits in max_bytes."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for *_, size in entries)
+        for path, meta_path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            # sidecar first: an area without it is never queried
+            for file in (meta_path, path):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+            total -= size
+            with self._lock:
+                self._stats["evictions"] += 1
+
+    def _areas(self):
+        """[(parquet path, meta)] newest first; re-scanned when the root directory changes."""
+        mtime = os.stat(self.root).st_mtime
+        with self._lock:
+            if self._index is not None and self._index_mtime == mtime:
+                return self._index
+        areas = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.root, name), "r", encoding="utf-8") as fh:
+                    meta = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            path = os.path.join(self.root, name[:-len(".json")] + ".parquet")
+            if os.path.isfile(path):
+                areas.append((path, meta))
+        areas.sort(key=lambda a: a[1]["created"], reverse=True)
+        with self._lock:
+            self._index, self._index_mtime = areas, mtime
+        return areas
+
+    def _table(self, path):
+        # keyed by mtime too: another worker process may have re-saved the area
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        table = pd.read_parquet(path)
+        with self._lock:
+            self._memory[key] = table
+            while len(self._memory) > self.memory_slots:
+                self._memory.popitem(last=False)
+        return table
+
+    def query(self, res, west, south, east, north):
+        """Cells of resolution `res` with their centre in the bbox, newest area first, as a frame."""
+        frames, seen = [], set()
+        for path, meta in self._areas():
+            b = meta["bounds"]
+            if b[0] > east or b[2] < west or b[1] > north or b[3] < south:
+                continue
+            try:
+                table = self._table(path)
+                # sidecar mtime is the eviction clock
+                os.utime(path[:-len(".parquet")] + ".json", None)
+            except OSError:
+                # evicted since the index was read
+                continue
+            rows = table[(table["res"] == res) & table["lon"].between(west, east) & table["lat"].between(south, north)]
+            rows = rows[~rows["cell"].isin(seen)].assign(crs=meta["crs"])
+            seen.update(rows["cell"].tolist())
+            frames.append(rows)
+        with self._lock:
+            self._stats["queries"] += 1
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def geojson(self, res, west, south, east, north):
+        """query() as a GeoJSON FeatureCollection of WGS84 hexagons, as text."""
+        rows = self.query(res, west, south, east, north)
+        features = []
+        if len(rows):
+            _, _, q, r = decode_cells(rows["cell"].to_numpy())
+            geoms = np.empty(len(rows), dtype=object)
+            crs = rows["crs"].to_numpy()
+            for area_crs_name in np.unique(crs):
+                sel = crs == area_crs_name
+                geoms[sel] = transform_geoms(hex_polygons(q[sel], r[sel], hex_size(res)), area_crs_name, WGS84)
+            geoms = shapely.transform(geoms, lambda c: np.round(c, 6))
+            props = rows.drop(columns=["cell", "lon", "lat", "crs"])
+            for cell, text, p in zip(rows["cell"], shapely.to_geojson(geoms), props.to_dict("records")):
+                p = {k: (round(float(v), 4) if isinstance(v, float) else int(v)) for k, v in p.items()}
+                p["id"] = cell_token(cell)
+                features.append(f'{{"type":"Feature","geometry":{text},"properties":{json.dumps(p)}}}')
+        return '{"type":"FeatureCollection","features":[' + ",".join(features) + "]}"
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["areas_in_memory"] = len(self._memory)
+        entries = self._entries()
+        stats["areas"] = len(entries)
+        stats["size_bytes"] = sum(size for *_, size in entries)
+        stats["max_bytes"] = self.max_bytes
+        stats["resolutions"] = {res: hex_size(res) for res in range(HEX_LEVELS)}
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_hex_store():
+    """Process-wide HexStore configured from the WALK_HEX_* env vars."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HexStore()
+        return _store
@@ -0,0 +1,316 @@
+# utils/instrumentation.py
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+# DEBUG / INFO / WARNING / ERROR, or OFF
+LOG_LEVEL = os.environ.get("WALK_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("WALK_LOG_FORMAT", "%(message)s")
+# requests slower than this (seconds) dump a sampled stack profile; 0 disables the profiler
+PROFILE_SLOW_S = float(os.environ.get("WALK_PROFILE_SLOW_S", 0))
+PROFILE_INTERVAL_S = float(os.environ.get("WALK_PROFILE_INTERVAL_MS", 10)) / 1000
+PROFILE_DIR = os.environ.get("WALK_PROFILE_DIR", "profiles")
+
+# upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+# ----------------------------
+# Logging
+# ----------------------------
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is at emit time, so redirect_stdout still captures pipeline output."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+_root_logger = logging.getLogger("walk")
+if not _root_logger.handlers:
+    _handler = _StdoutHandler()
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _root_logger.addHandler(_handler)
+    _root_logger.propagate = False
+_root_logger.setLevel(logging.CRITICAL + 1 if LOG_LEVEL == "OFF" else LOG_LEVEL)
+
+
+def get_logger(name):
+    """Logger for a module (pass __name__); messages are %-formatted only when the level is enabled."""
+    return _root_logger.getChild(name.rsplit(".", 1)[-1])
+
+
+log = get_logger(__name__)
+
+
+# ----------------------------
+# Per-request stage spans (recorded in whichever process runs the pipeline)
+# ----------------------------
+def _rss_bytes():
+    """(current, peak) resident set size of this process in bytes; None where unavailable."""
+    current = peak = None
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            current = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024
+    return current, peak
+
+
+class Trace:
+    """
+    Stage spans of one pipeline call. Each mark() closes a span running from
+    the previous mark (or the start) with its wall time, CPU time (process
+    CPU, so it includes native threads), resident memory at the end of the
+    stage and the process peak so far, and integer counts reported for it.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.spans = []
+        self.started = self._last_wall = time.perf_counter()
+        self.started_cpu = self._last_cpu = time.process_time()
+
+    def mark(self, stage, counts):
+        wall, cpu = time.perf_counter(), time.process_time()
+        rss, peak = _rss_bytes()
+        self.spans.append({
+            "stage": stage,
+            "wall_s": wall - self._last_wall,
+            "cpu_s": cpu - self._last_cpu,
+            "rss_bytes": rss,
+            "peak_rss_bytes": peak,
+            "counts": counts,
+        })
+        self._last_wall, self._last_cpu = wall, cpu
+
+    @property
+    def wall_s(self):
+        return time.perf_counter() - self.started
+
+
+_local = threading.local()
+
+
+def mark(stage, **partial):
+    """Close the current stage of the active trace; a no-op outside run_traced."""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return
+    counts = {k: v for k, v in partial.items() if isinstance(v, int) and not isinstance(v, bool)}
+    trace.mark(stage, counts)
+
+
+def run_traced(fn, *args):
+    """
+    fn(*args) under a Trace, returning (result, spans). The last span is the
+    whole call, labelled "total". Picklable, so it runs in pool workers.
+    """
+    trace = Trace(getattr(fn, "__name__", "call"))
+    profiler = SamplingProfiler(threading.get_ident()) if PROFILE_SLOW_S > 0 else None
+    _local.trace = trace
+    if profiler is not None:
+        profiler.start()
+    try:
+        result = fn(*args)
+    finally:
+        _local.trace = None
+        if profiler is not None:
+            profiler.stop()
+            if trace.wall_s >= PROFILE_SLOW_S:
+                profiler.dump(trace.label, trace.wall_s)
+    rss, peak = _rss_bytes()
+    trace.spans.append({
+        "stage": "total",
+        "wall_s": trace.wall_s,
+        "cpu_s": time.process_time() - trace.started_cpu,
+        "rss_bytes": rss,
+        "peak_rss_bytes": peak,
+        "counts": {},
+    })
+    return result, trace.spans
+
+
+def server_timing(spans, **extra_s):
+    """Server-Timing header value (durations in ms) for a trace plus extra named durations."""
+    parts = [f"{s['stage']};dur={s['wall_s'] * 1000:.1f}" for s in spans if s["stage"] != "total"]
+    parts += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in extra_s.items()]
+    total = next((s for s in spans if s["stage"] == "total"), None)
+    if total is not None:
+        parts.append(f"total;dur={total['wall_s'] * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# ----------------------------
+# Sampling profiler (opt-in, WALK_PROFILE_SLOW_S)
+# ----------------------------
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every PROFILE_INTERVAL_S from a daemon
+    thread and counts collapsed stacks ("root;...;leaf"). dump() writes them
+    in the folded format read by flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self, thread_id, interval_s=PROFILE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="walk-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, label, wall_s):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}.folded")
+        with open(path, "w", encoding="utf-8") as fh:
+            for stack, count in self.stacks.most_common():
+                fh.write(f"{stack} {count}\n")
+        log.warning("🐢 %s took %.1fs — %d stack samples written to %s", label, wall_s,
+                    sum(self.stacks.values()), path)
+        return path
+
+
+# ----------------------------
+# Prometheus metrics (server process)
+# ----------------------------
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+def _labels(**labels):
+    text = ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for k, v in labels.items())
+    return "{" + text + "}"
+
+
+class Metrics:
+    """
+    In-process registry rendered in the Prometheus text exposition format:
+    stage spans shipped back from pool workers, HTTP request durations, and
+    gauges supplied at render time (pool / cache stats).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stage_duration = {}   # (task, stage) -> _Histogram
+        self._stage_cpu = Counter()  # (task, stage) -> seconds
+        self._stage_rss = {}         # (task, stage) -> bytes at end of stage (last seen)
+        self._peak_rss = {}          # task -> max process peak seen
+        self._items = Counter()      # (task, stage, kind) -> count
+        self._requests = Counter()   # (method, path, status) -> count
+        self._request_duration = {}  # path -> _Histogram
+
+    def observe_spans(self, task, spans):
+        with self._lock:
+            for span in spans:
+                key = (task, span["stage"])
+                self._stage_duration.setdefault(key, _Histogram()).observe(span["wall_s"])
+                self._stage_cpu[key] += span["cpu_s"]
+                if span.get("rss_bytes") is not None:
+                    self._stage_rss[key] = span["rss_bytes"]
+                if span.get("peak_rss_bytes") is not None:
+                    self._peak_rss[task] = max(self._peak_rss.get(task, 0), span["peak_rss_bytes"])
+                for kind, n in span.get("counts", {}).items():
+                    self._items[(task, span["stage"], kind)] += n
+
+    def observe_request(self, method, path, status, seconds):
+        with self._lock:
+            self._requests[(method, path, status)] += 1
+            self._request_duration.setdefault(path, _Histogram()).observe(seconds)
+
+    @staticmethod
+    def _histogram_lines(name, labels, hist):
+        lines = []
+        for bound, count in zip(DURATION_BUCKETS, hist.buckets):
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+        lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+        return lines
+
+    def render(self, gauges=None):
+        """Prometheus text format; `gauges` is {name: value} or {name: {labels_tuple: value}} added as-is."""
+        out = []
+        with self._lock:
+            out += ["# HELP walk_stage_duration_seconds Wall time per pipeline stage.",
+                    "# TYPE walk_stage_duration_seconds histogram"]
+            for (task, stage), hist in sorted(self._stage_duration.items()):
+                out += self._histogram_lines("walk_stage_duration_seconds", {"task": task, "stage": stage}, hist)
+            out += ["# HELP walk_stage_cpu_seconds_total Process CPU time per pipeline stage.",
+                    "# TYPE walk_stage_cpu_seconds_total counter"]
+            out += [f"walk_stage_cpu_seconds_total{_labels(task=t, stage=s)} {v:.6f}"
+                    for (t, s), v in sorted(self._stage_cpu.items())]
+            out += ["# HELP walk_stage_rss_bytes Worker resident memory at the end of the stage (last run).",
+                    "# TYPE walk_stage_rss_bytes gauge"]
+            out += [f"walk_stage_rss_bytes{_labels(task=t, stage=s)} {v}" for (t, s), v in sorted(self._stage_rss.items())]
+            out += ["# HELP walk_worker_peak_rss_bytes Highest worker peak resident memory seen per task.",
+                    "# TYPE walk_worker_peak_rss_bytes gauge"]
+            out += [f"walk_worker_peak_rss_bytes{_labels(task=t)} {v}" for t, v in sorted(self._peak_rss.items())]
+            out += ["# HELP walk_stage_items_total Nodes / edges / blocks / POIs / ... processed per stage.",
+                    "# TYPE walk_stage_items_total counter"]
+            out += [f"walk_stage_items_total{_labels(task=t, stage=s, kind=k)} {v}"
+                    for (t, s, k), v in sorted(self._items.items())]
+            out += ["# HELP walk_http_requests_total HTTP requests by route and status.",
+                    "# TYPE walk_http_requests_total counter"]
+            out += [f"walk_http_requests_total{_labels(method=m, path=p, status=s)} {v}"
+                    for (m, p, s), v in sorted(self._requests.items())]
+            out += ["# HELP walk_http_request_duration_seconds HTTP request duration by route.",
+                    "# TYPE walk_http_request_duration_seconds histogram"]
+            for path, hist in sorted(self._request_duration.items()):
+                out += self._histogram_lines("walk_http_request_duration_seconds", {"path": path}, hist)
+
+        for name, value in (gauges or {}).items():
+            out.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                out += [f"{name}{_labels(**dict(labels))} {v}" for labels, v in value.items()]
+            else:
+                out.append(f"{name} {value}")
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()
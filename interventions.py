@@ -0,0 +1,354 @@
+# utils/interventions.py
+"""
+What-if simulator behind generate_recommendations.
+
+Candidate interventions are generated from the scored area in bulk:
+
+- add_sidewalk:   a street (both directions) without a sidewalk
+- add_connector:  a short footpath / crossing between two nearby nodes whose
+                  network distance is a long detour (or that are not
+                  connected at all), found with a KD-tree and one batched
+                  csgraph search
+- add_poi:        one more amenity in a block (only when POIs were scored)
+
+Each candidate is a sparse delta on the raw per-block counts kept by
+compute_walkability (scoring.COUNTS). Gains are evaluated for every
+(candidate, block) pair in one vectorized pass through the same feature and
+score functions as compute_walkability, so a gain is exactly the change in
+walkability_score the intervention would cause; access_score is held fixed.
+A lazy greedy search then picks candidates by score gain per cost,
+re-evaluating a candidate only when a pick has changed one of its blocks,
+until it runs out of candidates, picks or time.
+"""
+import heapq
+import os
+import time
+
+import numpy as np
+import shapely
+
+from utils.compact_graph import CompactGraph
+from utils.instrumentation import get_logger
+from utils.projection import area_crs, to_metric
+from utils.scoring import WEIGHTS, features_from_counts, score_matrix
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+# wall-clock budget for candidate generation + search, per request
+SIMULATE_BUDGET_S = float(os.environ.get("WALK_SIMULATE_BUDGET_S", 0.5))
+MAX_RECOMMENDATIONS = int(os.environ.get("WALK_MAX_RECOMMENDATIONS", 25))
+# connector candidates: node pairs at most this far apart whose walk is DETOUR_RATIO times longer
+CONNECTOR_MAX_M = float(os.environ.get("WALK_CONNECTOR_MAX_M", 60))
+DETOUR_RATIO = 3.0
+MAX_CONNECTOR_CANDIDATES = 5000
+# cap on the (sources x nodes) distance block held in memory per csgraph call
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# relative costs, in "metres of new sidewalk"
+SIDEWALK_COST_PER_M = 1.0
+CONNECTOR_COST_FIXED = 40.0
+CONNECTOR_COST_PER_M = 3.0
+POI_COST = 500.0
+COST_CLASSES = ((100.0, "LOW"), (400.0, "MEDIUM"), (float("inf"), "HIGH"))
+
+# walk_class codes (utils/data_fetch.py WALK_CLASSES) that are pedestrian ways already
+PEDESTRIAN_CLASSES = ("pedestrian",)
+
+DESCRIPTIONS = {
+    "add_sidewalk": "Add a sidewalk along this {length_m:.0f} m street.",
+    "add_connector": "Add a {length_m:.0f} m footpath or crossing here to replace a {detour_m:.0f} m detour.",
+    "link_components": "Add a {length_m:.0f} m footpath or crossing here to join two disconnected parts of the network.",
+    "add_poi": "Add an everyday amenity (shop, cafe, service) in this block.",
+}
+
+
+def _cost_class(cost):
+    return next(label for limit, label in COST_CLASSES if cost < limit)
+
+
+def _merge_pairs(cand, block, n_blocks, **deltas):
+    """Sum deltas of duplicate (candidate, block) pairs; pairs come back sorted by candidate."""
+    key = cand.astype(np.int64) * n_blocks + block
+    unique, inverse = np.unique(key, return_inverse=True)
+    merged = {name: np.bincount(inverse, weights=values, minlength=len(unique)) for name, values in deltas.items()}
+    return unique // n_blocks, unique % n_blocks, merged
+
+
+class InterventionSimulator:
+    """
+    Candidate generation, vectorized evaluation and greedy selection for one
+    scored area. blocks_gdf must come from compute_walkability (it carries
+    the COUNTS columns); hex cells and older results raise ValueError.
+    """
+
+    def __init__(self, blocks_gdf, edges_gdf, nodes_gdf=None, graph=None, weights=WEIGHTS):
+        missing = [c for c in ("street_length_m", "area_m2", "edge_count") if c not in blocks_gdf.columns]
+        if missing:
+            raise ValueError(f"blocks carry no raw counts ({', '.join(missing)}); score them with compute_walkability")
+        self.crs = area_crs(blocks_gdf)
+        self.blocks = to_metric(blocks_gdf, self.crs)
+        self.edges = to_metric(edges_gdf, self.crs)
+        self.nodes = to_metric(nodes_gdf, self.crs)
+        self.graph = graph
+        self.weights = weights
+        self.n_blocks = len(blocks_gdf)
+
+        def column(name):
+            return blocks_gdf[name].to_numpy(dtype=float).copy() if name in blocks_gdf.columns else None
+
+        self.counts = {name: column(name) for name in ("street_length_m", "area_m2", "edge_count",
+                                                       "sidewalk_edges", "node_count", "poi_count")}
+        self.access = column("access_score")
+        self.score = self._score(np.arange(self.n_blocks), {})
+
+    # ----------------------------
+    # Scoring
+    # ----------------------------
+    def _score(self, blocks, deltas):
+        """Raw walkability score of `blocks` with per-pair count `deltas` applied (same model as compute_walkability)."""
+        counts = {}
+        for name, values in self.counts.items():
+            if values is None:
+                counts[name] = None
+                continue
+            counts[name] = values[blocks] + deltas[name] if name in deltas else values[blocks]
+        matrix = features_from_counts(counts["street_length_m"], counts["area_m2"], counts["edge_count"],
+                                      counts["sidewalk_edges"], counts["node_count"], counts["poi_count"])
+        access = None if self.access is None else self.access[blocks]
+        return score_matrix(matrix, counts["edge_count"], self.weights, access)
+
+    # ----------------------------
+    # Candidates
+    # ----------------------------
+    def _sidewalk_candidates(self):
+        if self.counts["sidewalk_edges"] is None or "has_sidewalk" not in self.edges.columns or len(self.edges) == 0:
+            return None
+        rows = ~self.edges["has_sidewalk"].fillna(False).astype(bool).to_numpy()
+        if "walk_class" in self.edges.columns:
+            rows &= ~self.edges["walk_class"].astype(str).isin(PEDESTRIAN_CLASSES).to_numpy()
+        rows = np.flatnonzero(rows & self.edges.geometry.notna().to_numpy())
+        if len(rows) == 0 or self.edges.index.nlevels < 2:
+            return None
+
+        # both directions of a street are one candidate
+        u = self.edges.index.get_level_values(0).to_numpy()[rows]
+        v = self.edges.index.get_level_values(1).to_numpy()[rows]
+        pair = np.stack([np.minimum(u, v), np.maximum(u, v)], axis=1)
+        _, first, street = np.unique(pair, axis=0, return_index=True, return_inverse=True)
+        street = street.ravel()
+
+        geoms = self.edges.geometry.to_numpy()[rows]
+        edge_idx, block = self.blocks.sindex.query(geoms, predicate="intersects")
+        cand, block, deltas = _merge_pairs(street[edge_idx], block, self.n_blocks,
+                                           sidewalk_edges=np.ones(len(edge_idx)))
+        length = shapely.length(geoms[first])
+        return {
+            "action": "add_sidewalk",
+            "cost": SIDEWALK_COST_PER_M * length,
+            "geometry": shapely.line_interpolate_point(geoms[first], 0.5, normalized=True),
+            "extra": [{"edge": [int(a), int(b)], "length_m": round(float(m), 1)}
+                      for (a, b), m in zip(pair[first], length)],
+            "pairs": (cand, block, deltas),
+        }
+
+    def _connector_candidates(self, deadline):
+        if self.nodes is None or len(self.nodes) < 2 or len(self.edges) == 0:
+            return None
+        from scipy.sparse.csgraph import dijkstra
+        from scipy.spatial import cKDTree
+
+        graph = self.graph if isinstance(self.graph, CompactGraph) else CompactGraph.from_gdfs(self.nodes, self.edges)
+        rows = self.nodes.index.get_indexer(graph.node_ids)
+        if (rows < 0).any():
+            return None
+        points = self.nodes.geometry.to_numpy()[rows]
+        xy = np.column_stack([shapely.get_x(points), shapely.get_y(points)])
+
+        pairs = cKDTree(xy).query_pairs(CONNECTOR_MAX_M, output_type="ndarray")
+        if len(pairs) == 0:
+            return None
+        src, dst = graph.src.astype(np.int64), graph.indices.astype(np.int64)
+        linked = np.isin(pairs[:, 0] * graph.n_nodes + pairs[:, 1], np.r_[src * graph.n_nodes + dst, dst * graph.n_nodes + src])
+        pairs = pairs[~linked]
+        straight = np.hypot(*(xy[pairs[:, 0]] - xy[pairs[:, 1]]).T)
+        keep = np.argsort(straight, kind="stable")[:MAX_CONNECTOR_CANDIDATES]
+        pairs, straight = pairs[keep], straight[keep]
+
+        # one limited search per distinct source node, chunked
+        csr = graph.to_csr("length")
+        sources, source_row = np.unique(pairs[:, 0], return_inverse=True)
+        network = np.full(len(pairs), np.inf)
+        chunk = max(1, CHUNK_BYTES // (8 * graph.n_nodes))
+        for start in range(0, len(sources), chunk):
+            if time.perf_counter() > deadline:
+                break
+            dist = dijkstra(csr, directed=False, indices=sources[start:start + chunk],
+                            limit=DETOUR_RATIO * CONNECTOR_MAX_M)
+            sel = (source_row >= start) & (source_row < start + chunk)
+            network[sel] = dist[source_row[sel] - start, pairs[sel, 1]]
+        else:
+            detour = network > DETOUR_RATIO * straight
+            pairs, straight, network = pairs[detour], straight[detour], network[detour]
+            if len(pairs) == 0:
+                return None
+            lines = shapely.linestrings(np.stack([xy[pairs[:, 0]], xy[pairs[:, 1]]], axis=1))
+            link, block = self.blocks.sindex.query(lines, predicate="intersects")
+            # modelled as a two-way footway with its own walkable surface, like an osmnx edge pair
+            cand, block, deltas = _merge_pairs(link, block, self.n_blocks,
+                                               street_length_m=straight[link], edge_count=np.full(len(link), 2.0),
+                                               sidewalk_edges=np.full(len(link), 2.0))
+            if self.counts["sidewalk_edges"] is None:
+                deltas.pop("sidewalk_edges")
+            return {
+                "action": "add_connector",
+                "cost": CONNECTOR_COST_FIXED + CONNECTOR_COST_PER_M * straight,
+                "geometry": shapely.line_interpolate_point(lines, 0.5, normalized=True),
+                "extra": [{"nodes": [int(graph.node_ids[a]), int(graph.node_ids[b])], "length_m": round(float(s), 1),
+                           "detour_m": None if not np.isfinite(n) else round(float(n), 1)}
+                          for (a, b), s, n in zip(pairs, straight, network)],
+                "pairs": (cand, block, deltas),
+            }
+        log.info("⏱️ Connector search cut short by the time budget")
+        return None
+
+    def _poi_candidates(self):
+        if self.counts["poi_count"] is None:
+            return None
+        blocks = np.flatnonzero(self.counts["edge_count"] > 0)
+        if len(blocks) == 0:
+            return None
+        return {
+            "action": "add_poi",
+            "cost": np.full(len(blocks), POI_COST),
+            "geometry": shapely.point_on_surface(self.blocks.geometry.to_numpy()[blocks]),
+            "extra": [{} for _ in blocks],
+            "pairs": (np.arange(len(blocks)), blocks, {"poi_count": np.ones(len(blocks))}),
+        }
+
+    def candidates(self, deadline=None):
+        """Every candidate as one flat table: actions, costs, geometries, extras and (candidate, block, deltas) pairs."""
+        deadline = time.perf_counter() + SIMULATE_BUDGET_S if deadline is None else deadline
+        groups = [g for g in (self._sidewalk_candidates(), self._poi_candidates(), self._connector_candidates(deadline))
+                  if g is not None and len(g["cost"])]
+        actions, costs, geoms, extras = [], [], [], []
+        cand, block, deltas = [], [], {}
+        offset = 0
+        for g in groups:
+            n = len(g["cost"])
+            c, b, d = g["pairs"]
+            cand.append(c + offset)
+            block.append(b)
+            for name in ("street_length_m", "edge_count", "sidewalk_edges", "poi_count"):
+                deltas.setdefault(name, []).append(d.get(name, np.zeros(len(c))))
+            actions += [g["action"]] * n
+            costs.append(g["cost"])
+            geoms.append(g["geometry"])
+            extras += g["extra"]
+            offset += n
+        if not groups:
+            return None
+        cand = np.concatenate(cand)
+        return {
+            "action": np.array(actions),
+            "cost": np.concatenate(costs),
+            "geometry": np.concatenate(geoms),
+            "extra": extras,
+            "cand": cand,
+            "block": np.concatenate(block),
+            "deltas": {name: np.concatenate(v) for name, v in deltas.items() if self.counts[name] is not None},
+            # pairs of candidate i are ptr[i]:ptr[i + 1] (pairs are grouped by candidate)
+            "ptr": np.r_[0, np.cumsum(np.bincount(cand, minlength=offset))],
+        }
+
+    # ----------------------------
+    # Evaluation and search
+    # ----------------------------
+    def _pair_gains(self, table, sel=slice(None)):
+        blocks = table["block"][sel]
+        deltas = {name: values[sel] for name, values in table["deltas"].items()}
+        return self._score(blocks, deltas) - self.score[blocks]
+
+    def evaluate(self, table):
+        """Score gain (sum over affected blocks, raw score points) of every candidate against the current state."""
+        return np.bincount(table["cand"], weights=self._pair_gains(table), minlength=len(table["cost"]))
+
+    def apply(self, table, i):
+        """Apply candidate i to the current counts; returns the blocks it changed."""
+        sel = slice(table["ptr"][i], table["ptr"][i + 1])
+        blocks = table["block"][sel]
+        for name, values in table["deltas"].items():
+            np.add.at(self.counts[name], blocks, values[sel])
+        self.score[blocks] = self._score(blocks, {})
+        return blocks
+
+    def recommend(self, max_items=MAX_RECOMMENDATIONS, budget_s=SIMULATE_BUDGET_S, max_cost=None):
+        """
+        Lazy greedy selection by score gain per cost. Returns (picks, summary);
+        each pick is a dict with the candidate's action, cost, gain and extras.
+        """
+        started = time.perf_counter()
+        deadline = started + budget_s
+        table = self.candidates(deadline)
+        if table is None:
+            return [], {"candidates": 0, "picked": 0, "elapsed_s": time.perf_counter() - started}
+        n = len(table["cost"])
+        gains = self.evaluate(table)
+        cost = np.maximum(table["cost"], 1e-9)
+        heap = [(-g / c, i, 0) for i, (g, c) in enumerate(zip(gains, cost)) if g > 1e-9]
+        heapq.heapify(heap)
+
+        changed_at = np.zeros(self.n_blocks, dtype=np.int64)  # step at which each block last changed
+        picks, spent, step = [], 0.0, 0
+        while heap and len(picks) < max_items and time.perf_counter() < deadline:
+            neg_ratio, i, evaluated_at = heapq.heappop(heap)
+            sel = slice(table["ptr"][i], table["ptr"][i + 1])
+            if evaluated_at < step and (changed_at[table["block"][sel]] > evaluated_at).any():
+                gain = float(self._pair_gains(table, sel).sum())
+                if gain > 1e-9:
+                    heapq.heappush(heap, (-gain / cost[i], i, step))
+                continue
+            if max_cost is not None and spent + cost[i] > max_cost:
+                continue
+            gain = -neg_ratio * cost[i]
+            step += 1
+            changed_at[self.apply(table, i)] = step
+            spent += cost[i]
+            picks.append({
+                "action_type": str(table["action"][i]),
+                "cost": round(float(table["cost"][i]), 1),
+                "score_gain": round(float(gain), 3),
+                "gain_per_cost": float(-neg_ratio),
+                "blocks_affected": int(sel.stop - sel.start),
+                "geometry": table["geometry"][i],
+                **table["extra"][i],
+            })
+        summary = {"candidates": n, "picked": len(picks), "cost": round(spent, 1),
+                   "elapsed_s": time.perf_counter() - started}
+        return picks, summary
+
+
+def simulate_recommendations(blocks_gdf, edges_gdf, nodes_gdf=None, graph=None, max_items=MAX_RECOMMENDATIONS,
+                             budget_s=SIMULATE_BUDGET_S, weights=WEIGHTS):
+    """
+    Ranked interventions for a scored area as recommendation records
+    (action_type, description, priority, impact_estimate, cost_class, ...,
+    geometry in the blocks' CRS). impact_estimate is the gain in the area's
+    mean walkability_score; score_gain is summed over the blocks touched.
+    """
+    sim = InterventionSimulator(blocks_gdf, edges_gdf, nodes_gdf, graph, weights)
+    picks, summary = sim.recommend(max_items, budget_s)
+    log.info("🧪 Simulated %s candidates in %.0f ms, picked %s",
+             summary["candidates"], summary["elapsed_s"] * 1000, summary["picked"])
+
+    best = max((p["gain_per_cost"] for p in picks), default=0.0)
+    for p in picks:
+        ratio = p.pop("gain_per_cost")
+        p["priority"] = "HIGH" if ratio >= 0.5 * best else "MEDIUM" if ratio >= 0.2 * best else "LOW"
+        p["impact_estimate"] = round(p["score_gain"] / max(sim.n_blocks, 1), 3)
+        p["cost_class"] = _cost_class(p["cost"])
+        template = "link_components" if p["action_type"] == "add_connector" and p["detour_m"] is None else p["action_type"]
+        p["description"] = DESCRIPTIONS[template].format(**p)
+    return picks
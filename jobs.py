@@ -0,0 +1,248 @@
+# utils/jobs.py
+import json
+import os
+import socket
+import sqlite3
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+
+from utils.instrumentation import get_logger
+from utils.serialization import jsonable
+
+log = get_logger(__name__)
+
+JOBS_DB = os.environ.get("WALK_JOBS_DB", "jobs.sqlite3")
+# a job owned by a process on another host is only failed once it has been silent this long
+JOB_LEASE_S = float(os.environ.get("WALK_JOB_LEASE_S", 3600))
+
+# job lifecycle
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    params      TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    stage       TEXT,
+    created     REAL NOT NULL,
+    updated     REAL NOT NULL,
+    result      TEXT,
+    map_html    TEXT,
+    error       TEXT,
+    owner       TEXT
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id      TEXT NOT NULL,
+    seq         INTEGER NOT NULL,
+    stage       TEXT NOT NULL,
+    data        TEXT,
+    ts          REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r", encoding="ascii") as fh:
+            return fh.read().strip()
+    except OSError:
+        return ""
+
+
+def process_owner():
+    """Owner id of this process: host, boot id and pid."""
+    return f"{socket.gethostname()}|{_boot_id()}|{os.getpid()}"
+
+
+def owner_alive(owner, now=None, updated=None):
+    """
+    Whether the process recorded as a job's owner may still be running it.
+    Owners on this host are checked directly (same boot and a live pid);
+    for other hosts the job's last update must be within JOB_LEASE_S.
+    """
+    if not owner:
+        return False
+    host, boot, pid = owner.rsplit("|", 2)
+    if host != socket.gethostname():
+        return updated is not None and (now or time.time()) - updated < JOB_LEASE_S
+    if boot != _boot_id():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        # PermissionError: the pid exists but belongs to another user
+        return True
+    return True
+
+
+class JobStore:
+    """
+    SQLite-backed job table plus a per-job event log.
+
+    Every call opens its own short-lived connection, so the store can be
+    shared between the API process and pool workers (WAL mode lets readers
+    stream events while a worker writes them).
+    """
+
+    def __init__(self, db_path=JOBS_DB):
+        self.db_path = db_path
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                # job stores created before jobs recorded their owner
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ----------------------------
+    # Writes
+    # ----------------------------
+    def create(self, params):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, params, status, created, updated, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(params), QUEUED, now, now, process_owner()),
+            )
+        return job_id
+
+    def start(self, job_id, params):
+        """Mark a job running and owned by the calling (worker) process."""
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (process_owner(), job_id))
+            self._add_event(conn, job_id, "started", params, status=RUNNING)
+
+    def delete(self, job_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def _add_event(self, conn, job_id, stage, data=None, status=None):
+        now = time.time()
+        seq = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        conn.execute(
+            "INSERT INTO job_events (job_id, seq, stage, data, ts) VALUES (?, ?, ?, ?, ?)",
+            (job_id, seq, stage, json.dumps(data or {}, default=str), now),
+        )
+        if status is None:
+            conn.execute("UPDATE jobs SET stage = ?, updated = ? WHERE id = ?", (stage, now, job_id))
+        else:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, status = ?, updated = ? WHERE id = ?",
+                (stage, status, now, job_id),
+            )
+        return seq
+
+    def add_event(self, job_id, stage, data=None, status=None):
+        """Append a progress event and move the job to `stage` (and `status`, if given)."""
+        with self._conn() as conn:
+            return self._add_event(conn, job_id, stage, data, status)
+
+    def finish(self, job_id, result, map_html=None):
+        # one transaction, result first: a job reported DONE always has its result
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET result = ?, map_html = ? WHERE id = ?",
+                (json.dumps(jsonable(result)), map_html, job_id),
+            )
+            self._add_event(conn, job_id, "done", {"report": result.get("report")}, status=DONE)
+
+    def fail(self, job_id, error, tb=None):
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET error = ? WHERE id = ?", (error, job_id))
+            self._add_event(conn, job_id, "failed", {"error": error, "traceback": tb}, status=FAILED)
+
+    def mark_interrupted(self):
+        """
+        Jobs left queued/running by a process that is gone can never finish:
+        fail them. Jobs owned by live processes (other server workers and
+        their pools share the store) are left alone.
+        """
+        now = time.time()
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT id, owner, updated FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+        ids = [r["id"] for r in rows if not owner_alive(r["owner"], now, r["updated"])]
+        for job_id in ids:
+            self.fail(job_id, "Interrupted by server restart")
+        return len(ids)
+
+    # ----------------------------
+    # Reads
+    # ----------------------------
+    def get(self, job_id):
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT id, params, status, stage, created, updated, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def result(self, job_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["result"]) if row is not None and row["result"] else None
+
+    def map_html(self, job_id):
+        with self._conn() as conn:
+            row = conn.execute("SELECT map_html FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["map_html"] if row is not None else None
+
+    def events(self, job_id, after_seq=0):
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT seq, stage, data, ts FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq),
+            ).fetchall()
+        return [{"seq": r["seq"], "stage": r["stage"], "data": json.loads(r["data"]), "ts": r["ts"]} for r in rows]
+
+
+def run_job(job_id, db_path, params):
+    """
+    Pool entry point: run the analysis for one job, recording one event per
+    pipeline stage and the final result in the store.
+    """
+    from utils.pipeline import analyze_location, analyze_point
+
+    store = JobStore(db_path)
+    store.start(job_id, params)
+
+    def progress(stage, partial):
+        store.add_event(job_id, stage, partial)
+
+    try:
+        with_map = bool(params.get("include_map", True))
+        if params.get("location"):
+            result = analyze_location(params["location"], progress=progress, with_map=with_map)
+        else:
+            result = analyze_point(params["lat"], params["lon"], progress=progress, with_map=with_map)
+        map_html = result.pop("map_html", None)
+        store.finish(job_id, result, map_html)
+    except Exception as e:
+        tb = traceback.format_exc()
+        log.error("❌ Job %s failed:\n%s", job_id, tb)
+        store.fail(job_id, str(e), tb)
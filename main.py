@@ -1,17 +1,56 @@
 # main.py
-from fastapi import FastAPI, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import traceback
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Tuple, Optional
 
-# --- Import from utils (only the functions you said exist) ---
-from utils.data_fetch import fetch_osm_data
-from utils.feature_extract import extract_features
-from utils.scoring import compute_walkability
-from utils.recommendations import generate_recommendations
-from utils.visualization import generate_walkability_map
+# --- Import from utils ---
+from utils.area_store import get_area_store
+from utils.instrumentation import METRICS, get_logger, server_timing
+from utils.hexgrid import HEX_LEVELS, get_hex_store, zoom_resolution
+from utils.jobs import FINISHED, DONE, FAILED, JobStore, run_job
+from utils.osm_cache import get_osm_cache, place_key, point_key, snap_point
+from utils.pipeline import analyze_location_map, analyze_point, build_area_routing_graph
+from utils.result_cache import RESULT_MAX_AGE_S, CachedResult, etag_matches, get_result_cache, result_key
+from utils.routing import haversine_m, route
+from utils.serialization import encode_response, negotiate
+from utils.vector_tiles import get_tile_store
+from utils.worker_pool import AnalysisPool, PoolSaturated
+
+log = get_logger(__name__)
+
+# shared by every request; see utils/worker_pool.py for the WALK_POOL_* settings
+analysis_pool = AnalysisPool()
+# background analysis jobs (WALK_JOBS_DB)
+job_store = JobStore()
+
+# send per-stage durations to clients as a Server-Timing header on /analyze
+SERVER_TIMING = os.environ.get("WALK_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+# how often the SSE stream polls the job store for new events
+JOB_POLL_S = 0.5
+
+# scored routing graphs kept in memory, most recently used last
+ROUTE_AREA_SLOTS = int(os.environ.get("WALK_ROUTE_AREA_SLOTS", 8))
+ROUTE_MAX_DIST_M = int(os.environ.get("WALK_ROUTE_MAX_DIST_M", 5000))
+routing_areas: "OrderedDict[str, Any]" = OrderedDict()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    interrupted = job_store.mark_interrupted()
+    if interrupted:
+        log.warning("⚠️ Marked %s unfinished job(s) whose owner process is gone as failed", interrupted)
+    yield
+    analysis_pool.shutdown()
 
 
 # ------------------------------------------------
@@ -21,6 +60,7 @@ app = FastAPI(
     title="Walkability & Sidewalk Analysis API",
     description="Analyze OSM data for sidewalks and walkability recommendations.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # ------------------------------------------------
@@ -34,6 +74,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# ------------------------------------------------
+# Request counts / durations for GET /metrics (by route template, not raw path)
+# ------------------------------------------------
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or "unmatched"
+    METRICS.observe_request(request.method, path, response.status_code, time.perf_counter() - started)
+    return response
+
+
+def _timing_headers(spans, **extra_s):
+    return {"Server-Timing": server_timing(spans, **extra_s)} if SERVER_TIMING else {}
+
+
+async def _cached_result(key, fn, *args):
+    """
+    Result cache entry for a pool task, computing it on a miss. Only complete
+    results (value["complete"], see utils/pipeline.py) are stored: one built
+    from a partial OSM fetch comes back in an uncached entry.
+    Returns (entry, spans, extra Server-Timing durations, cached).
+    """
+    cache = get_result_cache()
+    started = time.perf_counter()
+    entry = await asyncio.to_thread(cache.get, result_key(*key))
+    if entry is not None:
+        return entry, [], {"cache": time.perf_counter() - started}, True
+    value, spans = await analysis_pool.run_traced(key, fn, *args)
+    if not value.get("complete"):
+        log.warning("⚠️ Partial result for %s not cached", key)
+        return CachedResult(key=result_key(*key), value=value, created=time.time()), spans, {}, False
+    entry = await asyncio.to_thread(cache.put, result_key(*key), value)
+    return entry, spans, {}, True
+
+
+def _validator_headers(etag, cached=True):
+    """ETag + Cache-Control for a cached result; an uncached (partial) one must not be reused."""
+    if not cached:
+        return {"Cache-Control": "no-store"}
+    return {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={RESULT_MAX_AGE_S}"}
+
+
+def _not_modified(headers):
+    get_result_cache().not_modified()
+    return Response(status_code=304, headers=headers)
+
+
 # ------------------------------------------------
 # Request model for POST /analyze
 # ------------------------------------------------
@@ -42,6 +132,16 @@ class Coordinates(BaseModel):
     lon: float
 
 
+# ------------------------------------------------
+# Request model for POST /jobs (place name or point)
+# ------------------------------------------------
+class JobRequest(BaseModel):
+    location: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    include_map: bool = True
+
+
 # ------------------------------------------------
 # Routes
 # ------------------------------------------------
@@ -54,344 +154,287 @@ def home():
 # GET /analyze  -> returns map HTML (map preview)
 # ------------------------------
 @app.get("/analyze", response_class=HTMLResponse)
-def analyze_get(location: str = Query(..., description="Enter a location name, e.g., 'Indiranagar, Bangalore'")):
+async def analyze_get(location: str = Query(..., description="Enter a location name, e.g., 'Indiranagar, Bangalore'"),
+                      if_none_match: Optional[str] = Header(None)):
     try:
-        # Step 1: Fetch OSM Data (expected G, nodes_gdf, edges_gdf, pois_gdf)
-        G, nodes_gdf, edges_gdf, pois_gdf = fetch_osm_data(location)
-
-        # Step 2: Extract features (creates blocks_gdf)
-        blocks_gdf, edges_gdf, nodes_gdf = extract_features(nodes_gdf, edges_gdf, pois_gdf, G)
-
-        # Step 3: Compute walkability (mutates/returns blocks_gdf)
-        blocks_gdf = compute_walkability(blocks_gdf, edges_gdf)
-
-        # Step 4: Generate recommendations (returns a GeoDataFrame or list-like)
-        rec_gdf = generate_recommendations(blocks_gdf, edges_gdf)
-
-        # Step 5: Generate map HTML
-        map_html = generate_walkability_map(blocks_gdf, edges_gdf, rec_gdf)
-
-        return HTMLResponse(content=map_html)
+        # fetch → extract → score → recommend → map, off the event loop; repeats come from the result cache
+        entry, spans, extra, cached = await _cached_result(("map", place_key(location)), analyze_location_map,
+                                                           location)
+        headers = _validator_headers(f"{entry.etag}.html", cached)
+        if cached and etag_matches(if_none_match, headers["ETag"]):
+            return _not_modified(headers)
+        return HTMLResponse(content=entry.value["map_html"], headers={**headers, **_timing_headers(spans, **extra)})
+    except PoolSaturated as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
     except Exception as e:
         tb = traceback.format_exc()
-        print("❌ INTERNAL ERROR (GET /analyze):")
-        print(tb)
+        log.error("❌ INTERNAL ERROR (GET /analyze):\n%s", tb)
         return JSONResponse(status_code=500, content={"error": str(e), "traceback": tb})
 
 
 # ------------------------------
-# POST /analyze  -> JSON for frontend (Lovable)
+# POST /analyze  -> JSON for frontend (Lovable); Arrow IPC / MessagePack on request
 # ------------------------------
 @app.post("/analyze")
-def analyze_post(data: Coordinates):
+async def analyze_post(data: Coordinates, accept: Optional[str] = Header(None),
+                       if_none_match: Optional[str] = Header(None)):
     try:
-        lat, lon = data.lat, data.lon
-
-        # ---------------------------
-        # Flexible fetch_osm_data caller:
-        # try: fetch_osm_data(lat, lon), then (lat,lon) tuple, then single arg string
-        # ---------------------------
-        fetched = None
-        fetch_attempts = [
-            lambda: fetch_osm_data(lat, lon),
-            lambda: fetch_osm_data((lat, lon)),
-            lambda: fetch_osm_data(f"{lat},{lon}"),
-            lambda: fetch_osm_data(lat),  # last resort
-        ]
-        for fn in fetch_attempts:
-            try:
-                fetched = fn()
-                if fetched is not None:
-                    break
-            except TypeError:
-                # signature mismatch - try next
-                continue
-            except Exception:
-                # If fetch fails for other reasons, re-raise
-                raise
-
-        if fetched is None:
-            raise RuntimeError("fetch_osm_data returned no usable result")
-
-        # ---------------------------
-        # Interpret fetched return shapes
-        # Possible shapes:
-        # - (G, nodes_gdf, edges_gdf, pois_gdf)
-        # - (graph, pois)
-        # - graph only
-        # - other single object
-        # ---------------------------
-        graph = None
-        nodes_gdf = edges_gdf = pois_gdf = None
-        try:
-            # try 4-tuple
-            G, nodes_gdf, edges_gdf, pois_gdf = fetched
-            graph = G
-        except Exception:
-            try:
-                # try 2-tuple
-                graph, pois_gdf = fetched
-            except Exception:
-                # assume fetched is a graph-like object
-                graph = fetched
-
-        # ---------------------------
-        # Default containers
-        # ---------------------------
-        blocks_gdf = None
-        recommendations = []
-        clusters: List[Any] = []
-
-        # ---------------------------
-        # If we have GeoDataFrame path, use it
-        # ---------------------------
-        if nodes_gdf is not None and edges_gdf is not None and pois_gdf is not None:
-            try:
-                blocks_gdf, edges_gdf, nodes_gdf = extract_features(nodes_gdf, edges_gdf, pois_gdf, graph)
-            except Exception:
-                # extraction failed, keep blocks_gdf None and continue
-                blocks_gdf = None
-
-            if blocks_gdf is not None:
-                try:
-                    blocks_gdf = compute_walkability(blocks_gdf, edges_gdf)
-                except Exception:
-                    # let blocks_gdf remain as whatever compute_walkability returned or None
-                    pass
-
-            # generate recommendations (defensive)
-            try:
-                recommendations = generate_recommendations(blocks_gdf, edges_gdf)
-            except Exception:
-                recommendations = []
-
-            # clusters: best-effort: try to derive from recommendations if they have coords
-            try:
-                # If recommendations is a GeoDataFrame-like with geometry, build small clusters list
-                if hasattr(recommendations, "to_dict"):
-                    rec_records = recommendations.to_dict("records")
-                    clusters = []
-                    for rec in rec_records:
-                        if ("coordinates" in rec and isinstance(rec["coordinates"], (list, tuple))):
-                            clusters.append([float(rec["coordinates"][0]), float(rec["coordinates"][1])])
-                        elif ("lat" in rec and "lon" in rec):
-                            clusters.append([float(rec["lat"]), float(rec["lon"])])
-                    # fallback: if empty, use first up to 20 rec coords if present
-                    if not clusters:
-                        for rec in rec_records[:20]:
-                            # try common geometry keys
-                            if "geometry" in rec:
-                                clusters.append([rec["geometry"].y, rec["geometry"].x])
-                else:
-                    # assume list of dicts
-                    clusters = []
-                    for rec in (recommendations or [])[:50]:
-                        if isinstance(rec, dict) and "coordinates" in rec and isinstance(rec["coordinates"], (list, tuple)):
-                            clusters.append([float(rec["coordinates"][0]), float(rec["coordinates"][1])])
-            except Exception:
-                clusters = []
-
-        else:
-            # ---------------------------
-            # Graph-based fallback path
-            # ---------------------------
-            # compute_walkability may accept graph or graph+pois; try best-effort
-            scores = None
-            try:
-                scores = compute_walkability(graph, pois_gdf)
-            except Exception:
-                try:
-                    scores = compute_walkability(graph, None)
-                except Exception:
-                    scores = None
-
-            try:
-                recommendations = generate_recommendations(scores)
-            except Exception:
-                recommendations = []
-
-            # clusters from recommendations if possible
-            try:
-                clusters = []
-                for rec in (recommendations or [])[:50]:
-                    if isinstance(rec, dict) and "coordinates" in rec:
-                        coords = rec["coordinates"]
-                        clusters.append([float(coords[0]), float(coords[1])])
-            except Exception:
-                clusters = []
-
-        # ---------------------------
-        # Build simulation (pure python lists)
-        # ---------------------------
-        simulation: Dict[str, List[Any]] = {"nodes": [], "edges": []}
-        try:
-            if graph is not None and hasattr(graph, "nodes") and hasattr(graph, "edges"):
-                for n in graph.nodes():
-                    try:
-                        simulation["nodes"].append(int(n))
-                    except Exception:
-                        simulation["nodes"].append(n)
-                for u, v in graph.edges():
-                    try:
-                        simulation["edges"].append([int(u), int(v)])
-                    except Exception:
-                        simulation["edges"].append([u, v])
-            else:
-                # fallback to edges_gdf/nodes_gdf if present
-                if nodes_gdf is not None:
-                    try:
-                        for idx, row in nodes_gdf.iterrows():
-                            simulation["nodes"].append(int(idx))
-                    except Exception:
-                        # best-effort: skip
-                        pass
-                if edges_gdf is not None:
-                    try:
-                        for idx, row in edges_gdf.iterrows():
-                            # can't map source/target reliably, so use idx placeholder
-                            simulation["edges"].append([int(idx), int(idx)])
-                    except Exception:
-                        pass
-        except Exception:
-            simulation = {"nodes": simulation.get("nodes", []), "edges": simulation.get("edges", [])}
-
-        # ---------------------------
-        # Prepare recommendations list (JSON-serializable)
-        # ---------------------------
-        rec_list: List[Dict[str, Any]] = []
-        try:
-            if hasattr(recommendations, "to_dict"):
-                # GeoDataFrame or DataFrame-like
-                try:
-                    rec_list = recommendations.to_dict("records")
-                except Exception:
-                    # fallback: try converting row by row
-                    rec_list = []
-                    for row in recommendations:
-                        try:
-                            rec_list.append(dict(row))
-                        except Exception:
-                            rec_list.append({"repr": str(row)})
-            elif isinstance(recommendations, list):
-                # list of dicts or objects
-                for r in recommendations:
-                    if isinstance(r, dict):
-                        rec_list.append(r)
-                    else:
-                        # try to pull common attributes
-                        try:
-                            rec_list.append({"description": getattr(r, "description", str(r))})
-                        except Exception:
-                            rec_list.append({"repr": str(r)})
-            else:
-                # single dict or other
-                try:
-                    rec_list = [dict(recommendations)]
-                except Exception:
-                    rec_list = [{"repr": str(recommendations)}]
-        except Exception:
-            rec_list = []
-
-        # ---------------------------
-        # Prepare clusters to be JSON safe (list of simple pairs or dicts)
-        # ---------------------------
-        sanitized_clusters: List[Any] = []
-        try:
-            if isinstance(clusters, list):
-                for c in clusters:
-                    # if cluster is dict -> convert, else if pair -> ensure floats
-                    if isinstance(c, dict):
-                        # convert geometry-like dicts to lat/lon pair if possible
-                        if "coordinates" in c and isinstance(c["coordinates"], (list, tuple)):
-                            sanitized_clusters.append([float(c["coordinates"][0]), float(c["coordinates"][1])])
-                        else:
-                            sanitized_clusters.append(c)
-                    elif isinstance(c, (list, tuple)) and len(c) >= 2:
-                        try:
-                            sanitized_clusters.append([float(c[0]), float(c[1])])
-                        except Exception:
-                            sanitized_clusters.append([c[0], c[1]])
-                    else:
-                        # ignore or push as-is (string/number)
-                        sanitized_clusters.append(c)
-            else:
-                # if it's something else (DataFrame), try to_dict
-                if hasattr(clusters, "to_dict"):
-                    try:
-                        sanitized_clusters = clusters.to_dict("records")
-                    except Exception:
-                        sanitized_clusters = []
-                else:
-                    sanitized_clusters = []
-        except Exception:
-            sanitized_clusters = []
-
-        # ---------------------------
-        # Build report (walkability mean + suggestions)
-        # ---------------------------
-        report: Dict[str, Any] = {"walkability_score": None, "summary": "", "suggestions": []}
-        try:
-            # If we computed blocks_gdf with 'walkability_score' column
-            if blocks_gdf is not None:
-                try:
-                    mean_score = float(blocks_gdf["walkability_score"].mean())
-                    report["walkability_score"] = round(mean_score, 2)
-                except Exception:
-                    # try if compute_walkability returned a plain dict
-                    try:
-                        if isinstance(blocks_gdf, dict) and "walkability_score" in blocks_gdf:
-                            report["walkability_score"] = round(float(blocks_gdf["walkability_score"]), 2)
-                    except Exception:
-                        report["walkability_score"] = None
-            else:
-                # try to derive from a 'scores' variable if present
-                # (some compute_walkability implementations return a dict)
-                # No-op if not available
-                pass
-        except Exception:
-            report["walkability_score"] = None
-
-        # Suggestions from rec_list
-        try:
-            suggestions = []
-            for rec in rec_list[:10]:
-                if isinstance(rec, dict) and "description" in rec:
-                    suggestions.append(str(rec["description"]))
-                elif isinstance(rec, dict) and "name" in rec:
-                    suggestions.append(str(rec.get("name")))
-                else:
-                    suggestions.append(str(rec))
-            report["suggestions"] = suggestions
-            if report["walkability_score"] is not None:
-                report["summary"] = f"Computed mean walkability score {report['walkability_score']}."
-            else:
-                report["summary"] = "Walkability computed for the area."
-        except Exception:
-            report["summary"] = "Walkability computed for the area."
-            report["suggestions"] = report.get("suggestions", [])
-
-        # ---------------------------
-        # Final JSON-safe response
-        # ---------------------------
-        response = {
-            "clusters": sanitized_clusters,
-            "recommendations": rec_list,
-            "simulation": simulation,
-            "report": report,
-        }
-
-        return JSONResponse(status_code=200, content=response)
-
+        # nearby coordinates (same rounded point) share one computation and one result cache entry
+        lat, lon = snap_point(data.lat, data.lon)
+        entry, spans, extra, cached = await _cached_result(("point", point_key(lat, lon, 2000)), analyze_point,
+                                                           lat, lon)
+        # Accept picks the encoding (see utils/serialization.py); JSON by default.
+        # Each encoding is its own representation with its own ETag.
+        media_type = negotiate(accept)
+        headers = {"Vary": "Accept", **_validator_headers(f"{entry.etag}.{media_type.rsplit('/', 1)[-1]}", cached)}
+        if cached and etag_matches(if_none_match, headers["ETag"]):
+            return _not_modified(headers)
+        body = entry.bodies.get(media_type)
+        if body is None:
+            started = time.perf_counter()
+            body, media_type = await asyncio.to_thread(encode_response, entry.value, media_type)
+            entry.bodies[media_type] = body
+            extra["encode"] = time.perf_counter() - started
+        headers.update(_timing_headers(spans, **extra))
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    except PoolSaturated as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
     except Exception as e:
         tb = traceback.format_exc()
-        print("❌ BACKEND ERROR (POST /analyze):")
-        print(tb)
+        log.error("❌ BACKEND ERROR (POST /analyze):\n%s", tb)
         return JSONResponse(
             status_code=500,
             content={"error": str(e), "traceback": tb}
         )
 
 
+# ------------------------------
+# Background jobs  -> for city-scale areas that outlive a proxy timeout
+# ------------------------------
+def _job_done(job_id, fut):
+    """Fail a job whose pool call raised instead of returning."""
+    if fut.cancelled():
+        error = "Cancelled"
+    elif fut.exception() is not None:
+        error = f"{type(fut.exception()).__name__}: {fut.exception()}"
+    else:
+        return
+    log.error("❌ Job %s did not complete: %s", job_id, error)
+    try:
+        job_store.fail(job_id, error)
+    except Exception as e:
+        log.error("❌ Could not record failure of job %s: %s", job_id, e)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(req: JobRequest):
+    if not req.location and (req.lat is None or req.lon is None):
+        return JSONResponse(status_code=422, content={"error": "Provide either 'location' or both 'lat' and 'lon'."})
+
+    params = req.model_dump()
+    job_id = job_store.create(params)
+    try:
+        fut = analysis_pool.submit(("job", job_id), run_job, job_id, job_store.db_path, params)
+    except PoolSaturated as e:
+        job_store.delete(job_id)
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
+    # run_job records its own failures; this catches the ones it never got to (a worker died, args unpicklable)
+    fut.add_done_callback(lambda f, j=job_id: _job_done(j, f))
+
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "links": {
+            "status": f"/jobs/{job_id}",
+            "result": f"/jobs/{job_id}/result",
+            "map": f"/jobs/{job_id}/map",
+            "events": f"/jobs/{job_id}/events",
+        },
+    }
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job {job_id}"})
+    return job
+
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job {job_id}"})
+    if job["status"] == FAILED:
+        return JSONResponse(status_code=500, content={"error": job["error"], "status": job["status"]})
+    if job["status"] != DONE:
+        return JSONResponse(status_code=202, content={"status": job["status"], "stage": job["stage"]})
+    return JSONResponse(status_code=200, content=job_store.result(job_id))
+
+
+@app.get("/jobs/{job_id}/map", response_class=HTMLResponse)
+def get_job_map(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job {job_id}"})
+    map_html = job_store.map_html(job_id)
+    if not map_html:
+        return JSONResponse(status_code=404, content={"error": "No map for this job (yet)", "status": job["status"]})
+    return HTMLResponse(content=map_html)
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: Optional[int] = Header(None)):
+    """Server-Sent Events: one event per pipeline stage, ending after done/failed."""
+    if job_store.get(job_id) is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job {job_id}"})
+
+    async def stream():
+        last_seq = last_event_id or 0
+        idle_polls = 0
+        while True:
+            events = await asyncio.to_thread(job_store.events, job_id, last_seq)
+            for ev in events:
+                last_seq = ev["seq"]
+                yield f"id: {ev['seq']}\nevent: {ev['stage']}\ndata: {json.dumps(ev)}\n\n"
+
+            job = await asyncio.to_thread(job_store.get, job_id)
+            if job is None or (job["status"] in FINISHED and not events):
+                break
+
+            idle_polls = 0 if events else idle_polls + 1
+            if idle_polls and idle_polls % 30 == 0:
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(JOB_POLL_S)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ------------------------------
+# GET /route  -> walkability-weighted walking route
+# ------------------------------
+def _cached_routing_area(lat1, lon1, lat2, lon2):
+    """A cached area whose node extent already covers both endpoints."""
+    for key, graph in reversed(routing_areas.items()):
+        lat_min, lat_max = graph.lat.min(), graph.lat.max()
+        lon_min, lon_max = graph.lon.min(), graph.lon.max()
+        if all(lat_min <= la <= lat_max and lon_min <= lo <= lon_max for la, lo in ((lat1, lon1), (lat2, lon2))):
+            routing_areas.move_to_end(key)
+            return graph
+    return None
+
+
+@app.get("/route")
+async def get_route(
+    from_lat: float, from_lon: float, to_lat: float, to_lon: float,
+    method: str = Query("auto", pattern="^(auto|astar|dijkstra|ch)$"),
+):
+    try:
+        graph = _cached_routing_area(from_lat, from_lon, to_lat, to_lon)
+        if graph is None:
+            # window around the midpoint, half the trip plus a margin, in 500 m steps
+            span = float(haversine_m(from_lat, from_lon, to_lat, to_lon))
+            dist_m = int(max(1000, (span / 2 + 500) // 500 * 500 + 500))
+            if dist_m > ROUTE_MAX_DIST_M:
+                return JSONResponse(status_code=400, content={"error": f"Points are too far apart ({span:.0f} m)."})
+
+            mid_lat, mid_lon = snap_point((from_lat + to_lat) / 2, (from_lon + to_lon) / 2)
+            area_key = point_key(mid_lat, mid_lon, dist_m)
+            graph = await analysis_pool.run(("route-area", area_key), build_area_routing_graph, mid_lat, mid_lon, dist_m)
+            routing_areas[area_key] = graph
+            while len(routing_areas) > ROUTE_AREA_SLOTS:
+                routing_areas.popitem(last=False)
+
+        result = await asyncio.to_thread(route, graph, from_lat, from_lon, to_lat, to_lon, method)
+        return JSONResponse(status_code=200 if result["found"] else 404, content=result)
+
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except PoolSaturated as e:
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
+    except Exception as e:
+        tb = traceback.format_exc()
+        log.error("❌ BACKEND ERROR (GET /route):\n%s", tb)
+        return JSONResponse(status_code=500, content={"error": str(e), "traceback": tb})
+
+
+@app.get("/tiles/{z}/{x}/{y}")
+def get_tile(z: int, x: int, y: int, format: str = Query("geojson", description="geojson or mvt")):
+    """
+    Blocks, streets (z >= 15) and recommendations of every analysed area in
+    one web-mercator tile, simplified for the zoom level.
+    """
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return JSONResponse(status_code=400, content={"error": f"No tile {z}/{x}/{y}"})
+    headers = {"Cache-Control": "public, max-age=60"}
+    try:
+        store = get_tile_store()
+        if format == "mvt":
+            return Response(store.tile_mvt(z, x, y), media_type="application/vnd.mapbox-vector-tile", headers=headers)
+        return Response(store.tile_geojson(z, x, y), media_type="application/geo+json", headers=headers)
+    except RuntimeError as e:
+        return JSONResponse(status_code=406, content={"error": str(e)})
+    except Exception as e:
+        tb = traceback.format_exc()
+        log.error("❌ BACKEND ERROR (GET /tiles):\n%s", tb)
+        return JSONResponse(status_code=500, content={"error": str(e), "traceback": tb})
+
+
+@app.get("/hex")
+def get_hex(
+    west: float, south: float, east: float, north: float,
+    res: Optional[int] = Query(None, description=f"hex resolution, 0 (coarsest) to {HEX_LEVELS - 1} (finest)"),
+    zoom: Optional[float] = Query(None, description="web-map zoom; picks the resolution when res is not given"),
+):
+    """
+    Hex cells (GeoJSON) of every analysed area in a bbox at one resolution,
+    with absolute scores that compare across areas. Coarse resolutions are
+    pre-aggregated, so a dashboard can query any zoom level cheaply.
+    """
+    if res is None:
+        res = zoom_resolution(zoom if zoom is not None else 14, (south + north) / 2)
+    if not 0 <= res < HEX_LEVELS:
+        return JSONResponse(status_code=400, content={"error": f"res must be between 0 and {HEX_LEVELS - 1}"})
+    if west >= east or south >= north:
+        return JSONResponse(status_code=400, content={"error": "Empty bbox"})
+    try:
+        body = get_hex_store().geojson(res, west, south, east, north)
+        return Response(body, media_type="application/geo+json",
+                        headers={"Cache-Control": "public, max-age=60", "X-Hex-Resolution": str(res)})
+    except Exception as e:
+        tb = traceback.format_exc()
+        log.error("❌ BACKEND ERROR (GET /hex):\n%s", tb)
+        return JSONResponse(status_code=500, content={"error": str(e), "traceback": tb})
+
+
 @app.get("/health")
 def health():
     return {"status": "healthy", "message": "Backend is running."}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"osm": get_osm_cache().stats(), "tiles": get_tile_store().stats(), "hex": get_hex_store().stats(),
+            "results": get_result_cache().stats(), "areas": get_area_store().stats()}
+
+
+@app.get("/pool/stats")
+def pool_stats():
+    return analysis_pool.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition: per-stage timings / memory / counts, HTTP requests, pool and cache gauges."""
+    pool = analysis_pool.stats()
+    osm = get_osm_cache().stats()
+    results = get_result_cache().stats()
+    areas = get_area_store().stats()
+    gauges = {f"walk_pool_{k}": v for k, v in pool.items() if isinstance(v, (int, float))}
+    gauges.update({f"walk_osm_cache_{k}": v for k, v in osm.items() if isinstance(v, (int, float))})
+    gauges.update({f"walk_result_cache_{k}": v for k, v in results.items() if isinstance(v, (int, float))})
+    gauges.update({f"walk_area_store_{k}": v for k, v in areas.items() if isinstance(v, (int, float))})
+    return PlainTextResponse(METRICS.render(gauges), media_type="text/plain; version=0.0.4")
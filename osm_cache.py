@@ -0,0 +1,255 @@
+# utils/osm_cache.py
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import geopandas as gpd
+import pandas as pd
+
+from utils.instrumentation import get_logger
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+CACHE_DIR = os.environ.get("WALK_OSM_CACHE_DIR", ".osm_cache")
+CACHE_TTL_S = float(os.environ.get("WALK_OSM_CACHE_TTL_S", 7 * 24 * 3600))
+CACHE_MAX_BYTES = int(float(os.environ.get("WALK_OSM_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+CACHE_OFFLINE = os.environ.get("WALK_OSM_CACHE_OFFLINE", "0").lower() in ("1", "true", "yes")
+POINT_PRECISION = int(os.environ.get("WALK_OSM_CACHE_POINT_PRECISION", 3))
+
+# bump whenever the stored layout or the fetch parameters change
+CACHE_VERSION = 4
+
+
+def place_key(location_query):
+    """Normalize a place name so 'Indiranagar,  bangalore' and 'indiranagar, Bangalore' share an entry."""
+    text = re.sub(r"\s+", " ", str(location_query).strip().lower())
+    text = re.sub(r"\s*,\s*", ",", text)
+    return f"place:{text}"
+
+
+def snap_point(lat, lon, precision=POINT_PRECISION):
+    """Round a point to the cache grid (3 decimals ≈ 110 m)."""
+    return round(float(lat), precision), round(float(lon), precision)
+
+
+def point_key(lat, lon, dist_m, precision=POINT_PRECISION):
+    lat, lon = snap_point(lat, lon, precision)
+    return f"point:{lat:.{precision}f},{lon:.{precision}f}:{int(dist_m)}"
+
+
+def file_key(path, point=None, dist_m=None, precision=POINT_PRECISION):
+    """Key for an extract read from a local OSM file; a rewritten file gets a fresh key."""
+    st = os.stat(path)
+    window = point_key(point[0], point[1], dist_m, precision) if point else "all"
+    return f"file:{os.path.abspath(path)}:{st.st_size}:{int(st.st_mtime)}:{window}"
+
+
+def _encode_frame(gdf):
+    """
+    Parquet cannot hold the mixed scalar/list object columns osmnx produces
+    (e.g. osmid lists on simplified edges), so those are stored as JSON text.
+    """
+    gdf = gdf.copy()
+    json_cols = []
+    for col in gdf.columns:
+        if col == gdf.geometry.name or gdf[col].dtype != object:
+            continue
+        gdf[col] = gdf[col].map(lambda v: None if _is_null(v) else json.dumps(v, default=str))
+        json_cols.append(col)
+    return gdf, json_cols
+
+
+def _decode_frame(gdf, json_cols):
+    for col in json_cols:
+        if col in gdf.columns:
+            gdf[col] = gdf[col].map(lambda v: json.loads(v) if isinstance(v, str) else v)
+    return gdf
+
+
+def _is_null(v):
+    if isinstance(v, (list, tuple, dict)):
+        return False
+    try:
+        return bool(pd.isna(v))
+    except (TypeError, ValueError):
+        return False
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+class OSMCache:
+    """
+    Content-addressed on-disk cache of (G, nodes, edges, pois) extracts.
+
+    Each entry is a directory holding nodes/edges/pois as GeoParquet plus a
+    meta.json; the graph is rebuilt from nodes+edges with ox.graph_from_gdfs.
+    Entries expire after `ttl_s` and the least recently used ones are evicted
+    once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, root=CACHE_DIR, ttl_s=CACHE_TTL_S, max_bytes=CACHE_MAX_BYTES, offline=CACHE_OFFLINE):
+        self.root = root
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0, "errors": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    # ----------------------------
+    # Paths / bookkeeping
+    # ----------------------------
+    def _entry_dir(self, key):
+        digest = hashlib.sha1(f"v{CACHE_VERSION}|{key}".encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.root, digest)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        entries = self._entries()
+        stats["entries"] = len(entries)
+        stats["size_bytes"] = sum(size for _, _, size in entries)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def _entries(self):
+        """[(path, last_access, size_bytes)] for every complete entry."""
+        entries = []
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return entries
+        for name in names:
+            path = os.path.join(self.root, name)
+            meta = os.path.join(path, "meta.json")
+            if name.startswith(".") or not os.path.isfile(meta):
+                continue
+            entries.append((path, os.path.getmtime(meta), _dir_size(path)))
+        return entries
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    def get(self, key, build_graph=True):
+        """
+        Return (G, nodes, edges, pois) for `key`, or None on a miss.
+        build_graph=False skips rebuilding the networkx graph (G is None).
+        """
+        import osmnx as ox
+
+        path = self._entry_dir(key)
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.isfile(meta_path):
+            self._count("misses")
+            return None
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+
+            if not self.offline and time.time() - meta["created"] > self.ttl_s:
+                self._count("expired")
+                self._count("misses")
+                shutil.rmtree(path, ignore_errors=True)
+                return None
+
+            nodes = _decode_frame(gpd.read_parquet(os.path.join(path, "nodes.parquet")), meta["json_columns"]["nodes"])
+            edges = _decode_frame(gpd.read_parquet(os.path.join(path, "edges.parquet")), meta["json_columns"]["edges"])
+            pois = _decode_frame(gpd.read_parquet(os.path.join(path, "pois.parquet")), meta["json_columns"]["pois"])
+            G = ox.graph_from_gdfs(nodes, edges, graph_attrs=meta.get("graph_attrs")) if build_graph else None
+        except Exception as e:
+            log.warning("⚠️ Cache entry for %s unreadable, dropping it: %s", key, e)
+            self._count("errors")
+            self._count("misses")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+        # touch meta.json: its mtime is the LRU clock
+        os.utime(meta_path, None)
+        self._count("hits")
+        return G, nodes, edges, pois
+
+    def put(self, key, G, nodes, edges, pois):
+        """Store an extract under `key` (atomically) and enforce the size bound."""
+        final = self._entry_dir(key)
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        try:
+            os.makedirs(tmp)
+            json_columns = {}
+            for name, gdf in (("nodes", nodes), ("edges", edges), ("pois", pois)):
+                encoded, json_columns[name] = _encode_frame(gdf)
+                encoded.to_parquet(os.path.join(tmp, f"{name}.parquet"))
+
+            graph_attrs = {k: (str(v) if k == "crs" else v) for k, v in getattr(G, "graph", {}).items()}
+            meta = {
+                "key": key,
+                "version": CACHE_VERSION,
+                "created": time.time(),
+                "graph_attrs": graph_attrs,
+                "json_columns": json_columns,
+                "counts": {"nodes": len(nodes), "edges": len(edges), "pois": len(pois)},
+            }
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+                json.dump(meta, fh, default=str)
+
+            shutil.rmtree(final, ignore_errors=True)
+            os.replace(tmp, final)
+            self._count("writes")
+        except Exception as e:
+            log.warning("⚠️ Could not write cache entry for %s: %s", key, e)
+            self._count("errors")
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self._count("evictions")
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_osm_cache():
+    """Process-wide cache instance configured from the WALK_OSM_CACHE_* env vars."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OSMCache()
+        return _cache
@@ -0,0 +1,242 @@
+# utils/osm_file.py
+import bz2
+import gzip
+import os
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from itertools import groupby
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString, Point, Polygon, box
+
+from utils.instrumentation import get_logger
+
+log = get_logger(__name__)
+
+# node coordinates are matched against the needed-id set in batches of this size
+NODE_BATCH = int(os.environ.get("WALK_OSM_FILE_NODE_BATCH", 200_000))
+
+# osmnx's "walk" network filter, applied to tags instead of an Overpass query.
+# Overpass `!~` is an unanchored regex test, so these are searched, not compared
+# (highway=motorway is excluded by "motor", foot=unknown by "no", as in osmnx).
+EXCLUDED_HIGHWAYS = re.compile(
+    "abandoned|bus_guideway|construction|cycleway|motor|no|planned|"
+    "platform|proposed|raceway|razed|rest_area|services"
+)
+EXCLUDED_TAGS = (
+    ("area", re.compile("yes")),
+    ("access", re.compile("private")),
+    ("foot", re.compile("no")),
+    ("service", re.compile("private")),
+    ("sidewalk", re.compile("separate")),
+    ("sidewalk:both", re.compile("separate")),
+    ("sidewalk:left", re.compile("separate")),
+    ("sidewalk:right", re.compile("separate")),
+)
+
+
+def _is_walkable(tags):
+    highway = tags.get("highway")
+    if highway is None or EXCLUDED_HIGHWAYS.search(highway):
+        return False
+    return not any(key in tags and pattern.search(tags[key]) for key, pattern in EXCLUDED_TAGS)
+
+
+def _is_poi(tags, poi_tags):
+    return any(k in tags for k in poi_tags)
+
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+# ----------------------------
+# Element streams: ("node", id, lat, lon, tags) / ("way", id, refs, tags)
+# ----------------------------
+def _xml_elements(path, kind):
+    """Stream one element kind out of .osm XML with iterparse, clearing parsed elements as it goes."""
+    with _open(path) as fh:
+        context = ET.iterparse(fh, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag == kind:
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                if kind == "node":
+                    yield "node", int(elem.get("id")), float(elem.get("lat")), float(elem.get("lon")), tags
+                else:
+                    yield "way", int(elem.get("id")), [int(nd.get("ref")) for nd in elem.iter("nd")], tags
+            elif kind == "node" and elem.tag != "node":
+                # files are sorted nodes → ways → relations: no nodes left
+                break
+            root.clear()
+
+
+def _pbf_elements(path, kind):
+    """Stream one element kind out of a .osm.pbf with pyosmium (optional dependency)."""
+    try:
+        import osmium
+    except ImportError as e:
+        raise ImportError("Reading .osm.pbf files needs pyosmium (pip install osmium)") from e
+
+    entity = osmium.osm.NODE if kind == "node" else osmium.osm.WAY
+    for obj in osmium.FileProcessor(path, entity):
+        tags = {t.k: t.v for t in obj.tags}
+        if kind == "node":
+            if obj.location.valid():
+                yield "node", obj.id, obj.location.lat, obj.location.lon, tags
+        else:
+            yield "way", obj.id, [n.ref for n in obj.nodes], tags
+
+
+def _elements(path, kind):
+    return _pbf_elements(path, kind) if path.endswith(".pbf") else _xml_elements(path, kind)
+
+
+# ----------------------------
+# Graph assembly
+# ----------------------------
+def _build_graph(way_paths, coords, node_tags, retain_all):
+    """osmnx-equivalent walk graph: bidirectional edges, great-circle lengths, simplified."""
+    import osmnx as ox
+
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    for nid, (lat, lon) in coords.items():
+        G.add_node(nid, y=lat, x=lon, **node_tags.get(nid, {}))
+
+    for osmid, refs, tags in way_paths:
+        # a way leaving the window is split where its nodes are missing
+        pairs = [(u, v) for u, v in zip(refs[:-1], refs[1:]) if u in coords and v in coords]
+        if not pairs:
+            continue
+        attrs = {"osmid": osmid, **tags, "oneway": False}
+        G.add_edges_from(pairs, **attrs, reversed=False)
+        G.add_edges_from([(v, u) for u, v in pairs], **attrs, reversed=True)
+
+    G.remove_nodes_from([n for n, d in G.degree() if d == 0])
+    if len(G.edges) == 0:
+        raise RuntimeError("No walkable ways in the OSM file for this window")
+
+    G = ox.distance.add_edge_lengths(G)
+    G = ox.simplify_graph(G)
+    if not retain_all:
+        G = ox.truncate.largest_component(G)
+    nx.set_node_attributes(G, ox.stats.count_streets_per_node(G), name="street_count")
+    return G
+
+
+def _poi_frame(poi_nodes, poi_ways, coords):
+    records, geoms, index = [], [], []
+    for nid, lat, lon, tags in poi_nodes:
+        records.append(tags)
+        geoms.append(Point(lon, lat))
+        index.append(("node", nid))
+    for wid, refs, tags in poi_ways:
+        points = [coords[r][::-1] for r in refs if r in coords]
+        if len(points) < 2:
+            continue
+        closed = refs[0] == refs[-1] and len(points) >= 4 and len(points) == len(refs)
+        records.append(tags)
+        geoms.append(Polygon(points) if closed else LineString(points))
+        index.append(("way", wid))
+
+    if not records:
+        return gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326")
+    pois = gpd.GeoDataFrame(records, geometry=geoms, crs="EPSG:4326")
+    pois.index = pd.MultiIndex.from_tuples(index, names=["element", "id"])
+    return pois
+
+
+def read_osm_file(path, bbox=None, poi_tags=None, retain_all=False):
+    """
+    Build (G, nodes, edges, pois) from a local .osm / .osm.gz / .osm.bz2 XML
+    or .osm.pbf file, streaming it in two passes:
+      1. ways: keep walkable ways (osmnx "walk" filter) and POI ways, and
+         record the node ids they reference;
+      2. nodes: keep coordinates only for those ids (inside bbox when given)
+         plus tagged POI nodes.
+    Memory is bounded by the walk network and POIs kept, not the file size.
+    bbox = (west, south, east, north) in degrees.
+    """
+    import osmnx as ox
+
+    from utils.data_fetch import POI_TAGS, _configure_osmnx
+
+    _configure_osmnx(ox)
+    poi_tags = POI_TAGS if poi_tags is None else poi_tags
+    way_keys = set(ox.settings.useful_tags_way)
+    node_keys = set(ox.settings.useful_tags_node)
+    path = os.fspath(path)
+    log.info("📂 Streaming OSM file %s", path)
+
+    # ---- pass 1: ways
+    way_paths, poi_ways = [], []
+    needed = array("q")
+    for _, wid, refs, tags in _elements(path, "way"):
+        walkable = _is_walkable(tags)
+        poi = _is_poi(tags, poi_tags)
+        if not walkable and not poi:
+            continue
+        refs = [r for r, _ in groupby(refs)]
+        needed.extend(refs)
+        if walkable:
+            way_paths.append((wid, refs, {k: v for k, v in tags.items() if k in way_keys}))
+        if poi:
+            poi_ways.append((wid, refs, tags))
+    needed = np.unique(np.frombuffer(needed, dtype=np.int64)) if len(needed) else np.zeros(0, dtype=np.int64)
+    log.info("🛣️  %s walkable ways, %s POI ways, %s referenced nodes", len(way_paths), len(poi_ways), len(needed))
+
+    # ---- pass 2: nodes, matched against `needed` in vectorized batches
+    coords, node_tags, poi_nodes = {}, {}, []
+    batch_ids, batch_lat, batch_lon, batch_tags = array("q"), array("d"), array("d"), {}
+
+    def flush():
+        if not batch_ids:
+            return
+        # copies: the arrays are truncated and refilled below
+        ids = np.array(batch_ids, dtype=np.int64)
+        lat, lon = np.array(batch_lat), np.array(batch_lon)
+        keep = np.isin(ids, needed, assume_unique=False)
+        if bbox is not None:
+            west, south, east, north = bbox
+            keep &= (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+        for i in np.flatnonzero(keep):
+            nid = int(ids[i])
+            coords[nid] = (float(lat[i]), float(lon[i]))
+            if nid in batch_tags:
+                node_tags[nid] = batch_tags[nid]
+        del batch_ids[:], batch_lat[:], batch_lon[:]
+        batch_tags.clear()
+
+    for _, nid, lat, lon, tags in _elements(path, "node"):
+        batch_ids.append(nid)
+        batch_lat.append(lat)
+        batch_lon.append(lon)
+        if tags:
+            useful = {k: v for k, v in tags.items() if k in node_keys}
+            if useful:
+                batch_tags[nid] = useful
+            if _is_poi(tags, poi_tags) and (bbox is None or (bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3])):
+                poi_nodes.append((nid, lat, lon, tags))
+        if len(batch_ids) >= NODE_BATCH:
+            flush()
+    flush()
+
+    G = _build_graph(way_paths, coords, node_tags, retain_all)
+    del way_paths
+    nodes, edges = ox.graph_to_gdfs(G, nodes=True, edges=True)
+
+    pois = _poi_frame(poi_nodes, poi_ways, coords)
+    if bbox is not None and len(pois):
+        pois = pois[pois.intersects(box(*bbox))]
+    log.info("✅ OSM file parsed — nodes=%s, edges=%s, pois=%s", len(nodes), len(edges), len(pois))
+    return G, nodes, edges, pois
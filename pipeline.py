@@ -0,0 +1,622 @@
+# utils/pipeline.py
+# The /analyze pipeline, kept free of FastAPI so it can run in worker processes.
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.accessibility import block_accessibility
+from utils.area_store import area_fingerprint, get_area_store
+from utils.clustering import cluster_recommendations
+from utils.compact_graph import CompactGraph
+from utils.contraction import load_or_build_hierarchy
+from utils.data_fetch import extract_key, fetch_complete, fetch_osm_data
+from utils.feature_extract import extract_features
+from utils.hexgrid import HexGrid, get_hex_store, with_accessibility
+from utils.instrumentation import get_logger, mark
+from utils.scoring import compute_walkability
+from utils.recommendations import generate_recommendations
+from utils.osm_cache import get_osm_cache
+from utils.projection import area_crs, project_layers, to_wgs84
+from utils.result_cache import analysis_version
+from utils.routing import build_routing_graph
+from utils.vector_tiles import area_key, get_tile_store
+from utils.visualization import generate_walkability_map
+
+log = get_logger(__name__)
+
+
+# build (or load) a contraction hierarchy for every routing area
+ROUTE_CH = os.environ.get("WALK_ROUTE_CH", "0").lower() in ("1", "true", "yes")
+
+# publish every analysed area's layers for GET /tiles/{z}/{x}/{y}
+TILE_LAYERS = os.environ.get("WALK_TILE_LAYERS", "1").lower() in ("1", "true", "yes")
+# blend walk-time POI accessibility into block scores (one batched csgraph pass)
+ACCESSIBILITY = os.environ.get("WALK_ACCESSIBILITY", "0").lower() in ("1", "true", "yes")
+# scoring units: "blocks" (extracted street blocks) or "hex" (finest cells of utils/hexgrid.py)
+SCORING_MODE = os.environ.get("WALK_SCORING_MODE", "blocks")
+# publish every analysed area's multi-resolution hex cells for GET /hex
+HEX_LAYERS = os.environ.get("WALK_HEX_LAYERS", "1").lower() in ("1", "true", "yes")
+# share scored blocks + graph arrays of analysed areas between workers (memory-mapped, utils/area_store.py)
+AREA_STORE = os.environ.get("WALK_AREA_STORE", "1").lower() in ("1", "true", "yes")
+
+# stage names reported to progress callbacks, in pipeline order
+STAGES = ("fetch", "extract_features", "compute_walkability", "generate_recommendations", "map")
+
+ProgressFn = Optional[Callable[[str, Dict[str, Any]], None]]
+
+
+def _progress(progress: ProgressFn, stage: str, **partial):
+    """
+    Report a finished stage (with a small JSON-safe partial result) to an
+    optional callback, and close its span in the active instrumentation trace.
+    """
+    mark(stage, **partial)
+    if progress is None:
+        return
+    try:
+        progress(stage, partial)
+    except Exception as e:
+        # progress reporting must never break the analysis itself
+        log.warning("⚠️ Progress callback failed at %s: %s", stage, e)
+
+
+def _score_summary(blocks_gdf) -> Dict[str, Any]:
+    try:
+        scores = blocks_gdf["walkability_score"]
+        return {
+            "blocks": int(len(blocks_gdf)),
+            "mean_score": round(float(scores.mean()), 2),
+            "min_score": round(float(scores.min()), 2),
+            "max_score": round(float(scores.max()), 2),
+        }
+    except Exception:
+        return {"blocks": 0 if blocks_gdf is None else int(len(blocks_gdf))}
+
+
+def _project(nodes_gdf, edges_gdf, pois_gdf):
+    """
+    Project an area's layers once to its local metric CRS (one batched
+    transform); every later stage works on these and only the outputs are
+    converted back to WGS84.
+    """
+    nodes_gdf, edges_gdf, pois_gdf = project_layers(area_crs(edges_gdf), nodes_gdf, edges_gdf, pois_gdf)
+    mark("project")
+    return nodes_gdf, edges_gdf, pois_gdf
+
+
+def _block_accessibility(nodes_gdf, edges_gdf, blocks_gdf, pois_gdf, graph=None):
+    """Accessibility frame for compute_walkability when WALK_ACCESSIBILITY is on, else None."""
+    if not ACCESSIBILITY or blocks_gdf is None or len(blocks_gdf) == 0:
+        return None
+    try:
+        if not isinstance(graph, CompactGraph):
+            graph = CompactGraph.from_gdfs(nodes_gdf, edges_gdf)
+        return block_accessibility(graph, blocks_gdf, pois_gdf)
+    except Exception as e:
+        log.warning("⚠️ Accessibility skipped: %s", e)
+        return None
+
+
+def _hex_grid(nodes_gdf, edges_gdf, pois_gdf, publish=True):
+    """The area's HexGrid when hex scoring (or, with `publish`, hex layers) is on, else None."""
+    if SCORING_MODE != "hex" and not (publish and HEX_LAYERS):
+        return None
+    if edges_gdf is None or len(edges_gdf) == 0:
+        return None
+    try:
+        return HexGrid.from_layers(edges_gdf, nodes_gdf, pois_gdf)
+    except Exception as e:
+        log.warning("⚠️ Hex aggregation skipped: %s", e)
+        return None
+
+
+def _extract_blocks(nodes_gdf, edges_gdf, pois_gdf, graph, hex_grid):
+    """Scoring units: extracted blocks, or the finest hex cells in WALK_SCORING_MODE=hex (already scored)."""
+    if SCORING_MODE == "hex" and hex_grid is not None:
+        return hex_grid.cells(), edges_gdf, nodes_gdf
+    return extract_features(nodes_gdf, edges_gdf, pois_gdf, graph)
+
+
+def _attach_area(extract):
+    """
+    The area store entry for an extract key under the current analysis
+    version, attached before the fetch (its CompactGraph can stand in for
+    the fetched one), else None.
+    """
+    if not AREA_STORE or extract is None:
+        return None
+    try:
+        return get_area_store().attach(extract, analysis_version())
+    except Exception as e:
+        log.warning("⚠️ Area store attach failed: %s", e)
+        return None
+
+
+def _area_graph(area):
+    return None if area is None else area.graph
+
+
+def _stored_area(area, nodes_gdf, edges_gdf, pois_gdf, graph):
+    """
+    (scored blocks, graph) from an attached entry that was scored from this
+    exact extract, else (None, graph). The stored graph's arrays are shared,
+    not copied.
+    """
+    if area is None or edges_gdf is None or len(edges_gdf) == 0:
+        return None, graph
+    try:
+        if area.matches(nodes_gdf, edges_gdf, pois_gdf):
+            blocks_gdf = area.blocks
+            log.info("💾 Attached stored area (%s blocks)", len(blocks_gdf))
+            return blocks_gdf, area.graph if area.graph is not None else graph
+        log.info("ℹ️ Stored area %s was scored from another extract; rescoring", area.meta.get("key"))
+    except Exception as e:
+        log.warning("⚠️ Area store attach failed: %s", e)
+    if graph is not None and graph is area.graph:
+        # the fetch reused the stored graph, which belongs to the other extract
+        graph = CompactGraph.from_gdfs(nodes_gdf, edges_gdf)
+    return None, graph
+
+
+def _store_area(extract, nodes_gdf, edges_gdf, pois_gdf, blocks_gdf, graph):
+    """Save freshly scored blocks (and the CompactGraph) for the other workers (best-effort)."""
+    if not AREA_STORE or extract is None or blocks_gdf is None or len(blocks_gdf) == 0 or \
+            "walkability_score" not in blocks_gdf.columns:
+        return
+    try:
+        get_area_store().save(extract, nodes_gdf, edges_gdf, pois_gdf, blocks_gdf, graph, analysis_version())
+    except Exception as e:
+        log.warning("⚠️ Area not stored: %s", e)
+
+
+def _compute_walkability(blocks_gdf, edges_gdf, accessibility=None):
+    if SCORING_MODE == "hex" and blocks_gdf is not None and "cell" in blocks_gdf.columns:
+        # hex cells are scored from their binned aggregates; only the accessibility blend is left
+        return with_accessibility(blocks_gdf, accessibility)
+    return compute_walkability(blocks_gdf, edges_gdf, accessibility=accessibility)
+
+
+def _layers_version(nodes_gdf, edges_gdf, pois_gdf, area=None):
+    """
+    What an analysis' published layers are computed from: the extract (its
+    fingerprint, taken from a matched area store entry when there is one)
+    and the analysis version.
+    """
+    if not TILE_LAYERS or edges_gdf is None or len(edges_gdf) == 0:
+        return None
+    try:
+        fingerprint = area.meta["fingerprint"] if area is not None else \
+            area_fingerprint(nodes_gdf, edges_gdf, pois_gdf)
+    except Exception as e:
+        log.warning("⚠️ Layer version unavailable: %s", e)
+        return None
+    return f"{analysis_version()}|{fingerprint}"
+
+
+def _publish_tile_layers(blocks_gdf, edges_gdf, recommendations, hex_grid=None, version=None):
+    """
+    Save the area's blocks / edges / recommendations (and hex cells) to the
+    tile and hex stores (best-effort). Tile layers already saved under the
+    same `version` are left as they are.
+    """
+    if edges_gdf is None or len(edges_gdf) == 0:
+        return
+    if TILE_LAYERS:
+        try:
+            recs = recommendations if hasattr(recommendations, "geometry") else None
+            get_tile_store().save(area_key(edges_gdf), blocks_gdf, edges_gdf, recs, version=version)
+        except Exception as e:
+            log.warning("⚠️ Tile layers not saved: %s", e)
+    if HEX_LAYERS and hex_grid is not None:
+        get_hex_store().save(area_key(edges_gdf), hex_grid)
+
+
+def analyze_location_map(location: str, progress: ProgressFn = None) -> Dict[str, Any]:
+    """
+    GET /analyze: fetch → extract → score → recommend → folium map HTML.
+    Returns {"map_html": ..., "complete": ...}; complete is False when the
+    map was drawn from a partial fetch (see utils.data_fetch.fetch_complete).
+    """
+    # Step 1: Fetch OSM Data (expected G, nodes_gdf, edges_gdf, pois_gdf)
+    extract = extract_key(location)
+    area = _attach_area(extract)
+    G, nodes_gdf, edges_gdf, pois_gdf = fetch_osm_data(location, compact=True, graph=_area_graph(area))
+    fetch_ok = fetch_complete()
+    _progress(progress, "fetch", nodes=len(nodes_gdf), edges=len(edges_gdf), pois=len(pois_gdf))
+    nodes_gdf, edges_gdf, pois_gdf = _project(nodes_gdf, edges_gdf, pois_gdf)
+
+    # Step 2: Extract features (creates blocks_gdf; hex cells in hex scoring mode), unless another worker did
+    stored, G = _stored_area(area, nodes_gdf, edges_gdf, pois_gdf, G)
+    layers_version = _layers_version(nodes_gdf, edges_gdf, pois_gdf, area if stored is not None else None)
+    blocks_gdf, hex_grid = stored, None
+    if stored is None:
+        # a stored area's hex cells were published when it was first scored
+        hex_grid = _hex_grid(nodes_gdf, edges_gdf, pois_gdf)
+        blocks_gdf, edges_gdf, nodes_gdf = _extract_blocks(nodes_gdf, edges_gdf, pois_gdf, G, hex_grid)
+    _progress(progress, "extract_features", blocks=len(blocks_gdf))
+
+    # Step 3: Compute walkability (mutates/returns blocks_gdf)
+    if stored is None:
+        access = _block_accessibility(nodes_gdf, edges_gdf, blocks_gdf, pois_gdf, G)
+        blocks_gdf = _compute_walkability(blocks_gdf, edges_gdf, accessibility=access)
+        _store_area(extract, nodes_gdf, edges_gdf, pois_gdf, blocks_gdf, G)
+    _progress(progress, "compute_walkability", **_score_summary(blocks_gdf))
+
+    # Step 4: Generate recommendations (returns a GeoDataFrame or list-like)
+    rec_gdf = generate_recommendations(blocks_gdf, edges_gdf, nodes_gdf, G)
+    _progress(progress, "generate_recommendations", recommendations=len(rec_gdf))
+    _publish_tile_layers(blocks_gdf, edges_gdf, rec_gdf, hex_grid, layers_version)
+
+    # Step 5: Generate map HTML
+    map_html = generate_walkability_map(blocks_gdf, edges_gdf, rec_gdf)
+    _progress(progress, "map", html_bytes=len(map_html))
+    complete = fetch_ok and len(edges_gdf) > 0 and _score_summary(blocks_gdf).get("mean_score") is not None
+    return {"map_html": map_html, "complete": complete}
+
+
+def build_area_routing_graph(lat: float, lon: float, dist_m: int, with_hierarchy: bool = ROUTE_CH):
+    """
+    Fetch + score the dist_m window around a point and compact it into a RoutingGraph.
+    with_hierarchy=True attaches a contraction hierarchy, serialized next to the OSM cache.
+    """
+    area = _attach_area(extract_key(f"{lat},{lon}", point=(lat, lon), dist_m=dist_m))
+    G, nodes_gdf, edges_gdf, pois_gdf = fetch_osm_data(f"{lat},{lon}", point=(lat, lon), dist_m=dist_m,
+                                                       compact=True, graph=_area_graph(area))
+    if edges_gdf is None or len(edges_gdf) == 0:
+        raise RuntimeError(f"No walk network around ({lat}, {lon})")
+    mark("fetch", nodes=len(nodes_gdf), edges=len(edges_gdf), pois=len(pois_gdf))
+    nodes_gdf, edges_gdf, pois_gdf = _project(nodes_gdf, edges_gdf, pois_gdf)
+
+    blocks_gdf, G = _stored_area(area, nodes_gdf, edges_gdf, pois_gdf, G)
+    if blocks_gdf is None:
+        hex_grid = _hex_grid(nodes_gdf, edges_gdf, pois_gdf, publish=False)
+        blocks_gdf, edges_gdf, nodes_gdf = _extract_blocks(nodes_gdf, edges_gdf, pois_gdf, G, hex_grid)
+        mark("extract_features", blocks=len(blocks_gdf))
+        blocks_gdf = _compute_walkability(blocks_gdf, edges_gdf)
+        mark("compute_walkability")
+    graph = build_routing_graph(nodes_gdf, edges_gdf, blocks_gdf, compact=G)
+    if with_hierarchy:
+        graph.ch = load_or_build_hierarchy(graph, get_osm_cache().root)
+    mark("routing_graph")
+    return graph
+
+
+def analyze_location(location: str, progress: ProgressFn = None, with_map: bool = False) -> Dict[str, Any]:
+    """Same JSON payload as POST /analyze, for a place name (used by background jobs)."""
+    extract = extract_key(location)
+    area = _attach_area(extract)
+    fetched = fetch_osm_data(location, compact=True, graph=_area_graph(area))
+    return build_analysis_response(fetched, progress=progress, with_map=with_map, extract=extract, area=area,
+                                   fetch_ok=fetch_complete())
+
+
+def analyze_point(lat: float, lon: float, progress: ProgressFn = None, with_map: bool = False) -> Dict[str, Any]:
+    """POST /analyze: JSON-safe clusters / recommendations / simulation / report for a point."""
+    # ---------------------------
+    # Flexible fetch_osm_data caller:
+    # try: point-based (tile-backed) fetch, then (lat,lon) tuple, then single arg string
+    # ---------------------------
+    extract = extract_key(f"{lat},{lon}", point=(lat, lon))
+    area = _attach_area(extract)
+    fetched = None
+    fetch_attempts = [
+        lambda: fetch_osm_data(f"{lat},{lon}", point=(lat, lon), compact=True, graph=_area_graph(area)),
+        lambda: fetch_osm_data((lat, lon)),
+        lambda: fetch_osm_data(f"{lat},{lon}"),
+        lambda: fetch_osm_data(lat),  # last resort
+    ]
+    for fn in fetch_attempts:
+        try:
+            fetched = fn()
+            if fetched is not None:
+                break
+        except TypeError:
+            # signature mismatch - try next
+            continue
+        except Exception:
+            # If fetch fails for other reasons, re-raise
+            raise
+
+    if fetched is None:
+        raise RuntimeError("fetch_osm_data returned no usable result")
+
+    return build_analysis_response(fetched, progress=progress, with_map=with_map, extract=extract, area=area,
+                                   fetch_ok=fetch_complete())
+
+
+def build_analysis_response(fetched, progress: ProgressFn = None, with_map: bool = False,
+                            extract: Optional[str] = None, area=None, fetch_ok: bool = True) -> Dict[str, Any]:
+    """
+    Run extract → score → recommend on a fetch_osm_data result and build the
+    JSON-safe /analyze payload. with_map=True also renders the folium map into
+    response["map_html"]. `extract` (utils.data_fetch.extract_key) names the
+    extract in the area store; `area` is its entry, if attached before the fetch.
+    response["complete"] is False when the payload was built from a partial
+    fetch (`fetch_ok` False), an empty network or without a score.
+    """
+    # ---------------------------
+    # Interpret fetched return shapes
+    # Possible shapes:
+    # - (G, nodes_gdf, edges_gdf, pois_gdf)
+    # - (graph, pois)
+    # - graph only
+    # - other single object
+    # ---------------------------
+    graph = None
+    nodes_gdf = edges_gdf = pois_gdf = None
+    try:
+        # try 4-tuple
+        G, nodes_gdf, edges_gdf, pois_gdf = fetched
+        graph = G
+    except Exception:
+        try:
+            # try 2-tuple
+            graph, pois_gdf = fetched
+        except Exception:
+            # assume fetched is a graph-like object
+            graph = fetched
+
+    _progress(
+        progress, "fetch",
+        nodes=0 if nodes_gdf is None else len(nodes_gdf),
+        edges=0 if edges_gdf is None else len(edges_gdf),
+        pois=0 if pois_gdf is None else len(pois_gdf),
+    )
+
+    # ---------------------------
+    # Default containers
+    # ---------------------------
+    blocks_gdf = None
+    recommendations = []
+    clusters: List[Any] = []
+
+    # ---------------------------
+    # If we have GeoDataFrame path, use it
+    # ---------------------------
+    if nodes_gdf is not None and edges_gdf is not None and pois_gdf is not None:
+        nodes_gdf, edges_gdf, pois_gdf = _project(nodes_gdf, edges_gdf, pois_gdf)
+        stored, graph = _stored_area(area, nodes_gdf, edges_gdf, pois_gdf, graph)
+        layers_version = _layers_version(nodes_gdf, edges_gdf, pois_gdf, area if stored is not None else None)
+        blocks_gdf, hex_grid = stored, None
+        if stored is None:
+            hex_grid = _hex_grid(nodes_gdf, edges_gdf, pois_gdf)
+            try:
+                blocks_gdf, edges_gdf, nodes_gdf = _extract_blocks(nodes_gdf, edges_gdf, pois_gdf, graph, hex_grid)
+            except Exception:
+                # extraction failed, keep blocks_gdf None and continue
+                blocks_gdf = None
+        _progress(progress, "extract_features", blocks=0 if blocks_gdf is None else len(blocks_gdf))
+
+        if stored is None and blocks_gdf is not None:
+            try:
+                access = _block_accessibility(nodes_gdf, edges_gdf, blocks_gdf, pois_gdf, graph)
+                blocks_gdf = _compute_walkability(blocks_gdf, edges_gdf, accessibility=access)
+                _store_area(extract, nodes_gdf, edges_gdf, pois_gdf, blocks_gdf, graph)
+            except Exception:
+                # let blocks_gdf remain as whatever compute_walkability returned or None
+                pass
+        _progress(progress, "compute_walkability", **_score_summary(blocks_gdf))
+
+        # generate recommendations (defensive)
+        try:
+            recommendations = generate_recommendations(blocks_gdf, edges_gdf, nodes_gdf, graph)
+        except Exception:
+            recommendations = []
+        _progress(progress, "generate_recommendations", recommendations=len(recommendations))
+        _publish_tile_layers(blocks_gdf, edges_gdf, recommendations, hex_grid, layers_version)
+
+        # clusters: recommendation points grouped by priority and proximity (metric CRS, WGS84 centroids)
+        try:
+            clusters = cluster_recommendations(recommendations, blocks_gdf)
+        except Exception as e:
+            log.warning("⚠️ Clustering skipped: %s", e)
+            clusters = []
+        mark("cluster", clusters=len(clusters))
+
+        # output boundary: recommendation points leave the pipeline as WGS84 lat/lon
+        if hasattr(recommendations, "geometry"):
+            recommendations = to_wgs84(recommendations)
+
+    else:
+        # ---------------------------
+        # Graph-based fallback path
+        # ---------------------------
+        # compute_walkability may accept graph or graph+pois; try best-effort
+        scores = None
+        try:
+            scores = compute_walkability(graph, pois_gdf)
+        except Exception:
+            try:
+                scores = compute_walkability(graph, None)
+            except Exception:
+                scores = None
+
+        try:
+            recommendations = generate_recommendations(scores)
+        except Exception:
+            recommendations = []
+
+        # clusters from recommendations if possible
+        try:
+            clusters = []
+            for rec in (recommendations or [])[:50]:
+                if isinstance(rec, dict) and "coordinates" in rec:
+                    coords = rec["coordinates"]
+                    clusters.append([float(coords[0]), float(coords[1])])
+        except Exception:
+            clusters = []
+
+    # ---------------------------
+    # Build simulation (typed arrays from CompactGraph, else python lists)
+    # ---------------------------
+    simulation: Dict[str, Any] = {"nodes": [], "edges": []}
+    try:
+        if isinstance(graph, CompactGraph):
+            # straight from the CSR arrays; expanded to id pairs only for JSON
+            simulation = graph.simulation_arrays()
+        elif graph is not None and hasattr(graph, "nodes") and hasattr(graph, "edges"):
+            for n in graph.nodes():
+                try:
+                    simulation["nodes"].append(int(n))
+                except Exception:
+                    simulation["nodes"].append(n)
+            for u, v in graph.edges():
+                try:
+                    simulation["edges"].append([int(u), int(v)])
+                except Exception:
+                    simulation["edges"].append([u, v])
+        else:
+            # fallback to edges_gdf/nodes_gdf if present
+            if nodes_gdf is not None:
+                try:
+                    for idx, row in nodes_gdf.iterrows():
+                        simulation["nodes"].append(int(idx))
+                except Exception:
+                    # best-effort: skip
+                    pass
+            if edges_gdf is not None:
+                try:
+                    for idx, row in edges_gdf.iterrows():
+                        # can't map source/target reliably, so use idx placeholder
+                        simulation["edges"].append([int(idx), int(idx)])
+                except Exception:
+                    pass
+    except Exception:
+        simulation = {"nodes": simulation.get("nodes", []), "edges": simulation.get("edges", [])}
+
+    # ---------------------------
+    # Prepare recommendations list (JSON-serializable)
+    # ---------------------------
+    rec_list: List[Dict[str, Any]] = []
+    try:
+        if hasattr(recommendations, "to_dict"):
+            # GeoDataFrame or DataFrame-like
+            try:
+                rec_list = recommendations.to_dict("records")
+            except Exception:
+                # fallback: try converting row by row
+                rec_list = []
+                for row in recommendations:
+                    try:
+                        rec_list.append(dict(row))
+                    except Exception:
+                        rec_list.append({"repr": str(row)})
+        elif isinstance(recommendations, list):
+            # list of dicts or objects
+            for r in recommendations:
+                if isinstance(r, dict):
+                    rec_list.append(r)
+                else:
+                    # try to pull common attributes
+                    try:
+                        rec_list.append({"description": getattr(r, "description", str(r))})
+                    except Exception:
+                        rec_list.append({"repr": str(r)})
+        else:
+            # single dict or other
+            try:
+                rec_list = [dict(recommendations)]
+            except Exception:
+                rec_list = [{"repr": str(recommendations)}]
+    except Exception:
+        rec_list = []
+
+    # shapely geometries are not JSON-safe: expose recommendation points as [lat, lon]
+    for rec in rec_list:
+        geom = rec.pop("geometry", None) if isinstance(rec, dict) else None
+        if geom is not None and hasattr(geom, "x"):
+            rec.setdefault("coordinates", [float(geom.y), float(geom.x)])
+
+    # ---------------------------
+    # Prepare clusters to be JSON safe (list of simple pairs or dicts)
+    # ---------------------------
+    sanitized_clusters: List[Any] = []
+    try:
+        if isinstance(clusters, list):
+            for c in clusters:
+                # if cluster is dict -> convert, else if pair -> ensure floats
+                if isinstance(c, dict):
+                    # cluster records (utils/clustering.py) are JSON-safe already
+                    sanitized_clusters.append(c)
+                elif isinstance(c, (list, tuple)) and len(c) >= 2:
+                    try:
+                        sanitized_clusters.append([float(c[0]), float(c[1])])
+                    except Exception:
+                        sanitized_clusters.append([c[0], c[1]])
+                else:
+                    # ignore or push as-is (string/number)
+                    sanitized_clusters.append(c)
+        else:
+            # if it's something else (DataFrame), try to_dict
+            if hasattr(clusters, "to_dict"):
+                try:
+                    sanitized_clusters = clusters.to_dict("records")
+                except Exception:
+                    sanitized_clusters = []
+            else:
+                sanitized_clusters = []
+    except Exception:
+        sanitized_clusters = []
+
+    # ---------------------------
+    # Build report (walkability mean + suggestions)
+    # ---------------------------
+    report: Dict[str, Any] = {"walkability_score": None, "summary": "", "suggestions": []}
+    try:
+        # If we computed blocks_gdf with 'walkability_score' column
+        if blocks_gdf is not None:
+            try:
+                mean_score = float(blocks_gdf["walkability_score"].mean())
+                report["walkability_score"] = round(mean_score, 2)
+            except Exception:
+                # try if compute_walkability returned a plain dict
+                try:
+                    if isinstance(blocks_gdf, dict) and "walkability_score" in blocks_gdf:
+                        report["walkability_score"] = round(float(blocks_gdf["walkability_score"]), 2)
+                except Exception:
+                    report["walkability_score"] = None
+        else:
+            # try to derive from a 'scores' variable if present
+            # (some compute_walkability implementations return a dict)
+            # No-op if not available
+            pass
+    except Exception:
+        report["walkability_score"] = None
+
+    # Suggestions from rec_list
+    try:
+        suggestions = []
+        for rec in rec_list[:10]:
+            if isinstance(rec, dict) and "description" in rec:
+                suggestions.append(str(rec["description"]))
+            elif isinstance(rec, dict) and "name" in rec:
+                suggestions.append(str(rec.get("name")))
+            else:
+                suggestions.append(str(rec))
+        report["suggestions"] = suggestions
+        if report["walkability_score"] is not None:
+            report["summary"] = f"Computed mean walkability score {report['walkability_score']}."
+        else:
+            report["summary"] = "Walkability computed for the area."
+    except Exception:
+        report["summary"] = "Walkability computed for the area."
+        report["suggestions"] = report.get("suggestions", [])
+
+    # ---------------------------
+    # Final JSON-safe response
+    # ---------------------------
+    response = {
+        "clusters": sanitized_clusters,
+        "recommendations": rec_list,
+        "simulation": simulation,
+        "report": report,
+        "complete": bool(fetch_ok and edges_gdf is not None and len(edges_gdf) > 0
+                         and report.get("walkability_score") is not None),
+    }
+
+    if with_map:
+        rec_gdf = recommendations if hasattr(recommendations, "geometry") else None
+        map_html = generate_walkability_map(blocks_gdf, edges_gdf, rec_gdf)
+        response["map_html"] = map_html
+        _progress(progress, "map", html_bytes=len(map_html))
+
+    return response
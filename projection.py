@@ -0,0 +1,147 @@
+# utils/projection.py
+"""
+Local metric projection for an analysed area.
+
+The pipeline projects an area's layers once, right after the fetch, to the
+UTM zone of its centre (metres, conformal, under 0.1 % scale error across a
+zone) and carries the projected geometries through extraction, scoring,
+recommendations and routing. WGS84 is only produced at the output boundary
+(JSON coordinates, map, tiles). Transformers are built once per CRS pair and
+thread (pyproj transformers must not be shared across threads) and applied
+to whole geometry arrays with shapely.transform.
+"""
+import threading
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+
+WGS84 = CRS.from_epsg(4326)
+
+_local = threading.local()
+
+
+def utm_epsg(lon, lat):
+    """EPSG code of the WGS84 / UTM zone containing a lon/lat point."""
+    zone = min(max(int((lon + 180.0) // 6.0) + 1, 1), 60)
+    return (32600 if lat >= 0 else 32700) + zone
+
+
+@lru_cache(maxsize=None)
+def _crs_from_epsg(epsg):
+    return CRS.from_epsg(epsg)
+
+
+def local_crs(lon, lat):
+    """Metric CRS (UTM zone) for an area centred on lon/lat."""
+    return _crs_from_epsg(utm_epsg(lon, lat))
+
+
+def get_transformer(src, dst):
+    """Cached always_xy Transformer between two CRSs (one per pair and thread)."""
+    src, dst = CRS.from_user_input(src), CRS.from_user_input(dst)
+    cache = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+    key = (src.to_wkt(), dst.to_wkt())
+    transformer = cache.get(key)
+    if transformer is None:
+        transformer = cache[key] = Transformer.from_crs(src, dst, always_xy=True)
+    return transformer
+
+
+def transform_geoms(geoms, src, dst):
+    """Geometry array reprojected from src to dst in one vectorized pass (None stays None)."""
+    geoms = np.asarray(geoms, dtype=object)
+    if len(geoms) == 0 or CRS.from_user_input(src) == CRS.from_user_input(dst):
+        return geoms
+    transformer = get_transformer(src, dst)
+
+    def project(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack([x, y])
+
+    return shapely.transform(geoms, project)
+
+
+def _with_geometry(gdf, geoms, crs):
+    """gdf (GeoDataFrame or GeoSeries) with its geometry replaced, sharing every other column."""
+    series = gpd.GeoSeries(geoms, index=gdf.index, crs=crs, name=gdf.name if isinstance(gdf, gpd.GeoSeries) else None)
+    if isinstance(gdf, gpd.GeoSeries):
+        return series
+    out = gdf.copy(deep=False)
+    out[gdf.geometry.name] = series
+    return out
+
+
+def wgs84_bounds(gdf):
+    """(west, south, east, north) of a layer in degrees, without projecting its geometries."""
+    bounds = gdf.total_bounds
+    if gdf.crs is None or CRS.from_user_input(gdf.crs) == WGS84:
+        return tuple(bounds)
+    return get_transformer(gdf.crs, WGS84).transform_bounds(*bounds)
+
+
+def area_crs(gdf):
+    """
+    The metric CRS an area's layers are analysed in: the layer's own CRS when
+    it is already projected, else the UTM zone of its centre.
+    """
+    if gdf is None or len(gdf) == 0 or gdf.crs is None:
+        return None
+    crs = CRS.from_user_input(gdf.crs)
+    if crs.is_projected:
+        return crs
+    west, south, east, north = wgs84_bounds(gdf)
+    return local_crs((west + east) / 2, (south + north) / 2)
+
+
+def to_metric(gdf, crs=None):
+    """
+    A GeoDataFrame / GeoSeries in `crs` (default: area_crs(gdf)). Layers
+    already in the target CRS are returned as they are.
+    """
+    if gdf is None or gdf.crs is None or len(gdf) == 0:
+        return gdf
+    crs = area_crs(gdf) if crs is None else CRS.from_user_input(crs)
+    if CRS.from_user_input(gdf.crs) == crs:
+        return gdf
+    return _with_geometry(gdf, transform_geoms(gdf.geometry.to_numpy(), gdf.crs, crs), crs)
+
+
+def to_wgs84(gdf):
+    """A GeoDataFrame / GeoSeries in EPSG:4326, for output (empty ones are relabelled, so outputs always agree)."""
+    if gdf is None or gdf.crs is None:
+        return gdf
+    if len(gdf) == 0:
+        return gdf.set_crs(WGS84, allow_override=True)
+    return to_metric(gdf, WGS84)
+
+
+def project_layers(crs, *layers):
+    """
+    Every layer in `crs`, reprojected in a single batched transform per source
+    CRS (usually one: the fetch's EPSG:4326). None / empty / CRS-less layers
+    and layers already in `crs` pass through unchanged.
+    """
+    out = list(layers)
+    if crs is None:
+        return out
+    crs = CRS.from_user_input(crs)
+    groups = {}
+    for i, gdf in enumerate(layers):
+        if gdf is None or gdf.crs is None or len(gdf) == 0:
+            continue
+        src = CRS.from_user_input(gdf.crs)
+        if src != crs:
+            groups.setdefault(src.to_wkt(), (src, []))[1].append(i)
+
+    for src, members in groups.values():
+        arrays = [layers[i].geometry.to_numpy() for i in members]
+        projected = transform_geoms(np.concatenate(arrays), src, crs)
+        bounds = np.cumsum([0] + [len(a) for a in arrays])
+        for i, start, end in zip(members, bounds[:-1], bounds[1:]):
+            out[i] = _with_geometry(layers[i], projected[start:end], crs)
+    return out
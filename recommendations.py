@@ -1,19 +1,50 @@
 # utils/recommendations.py
 import geopandas as gpd
 
-def generate_recommendations(blocks_gdf, edges_gdf):
+from utils.instrumentation import get_logger
+from utils.interventions import simulate_recommendations
+
+log = get_logger(__name__)
+
+
+def generate_recommendations(blocks_gdf, edges_gdf, nodes_gdf=None, graph=None):
     """
-    Generate adaptive recommendations based on relative walkability.
-    Uses the mean score as a dynamic cutoff so recommendations differ
-    across locations.
+    Generate ranked interventions for a scored area. The what-if simulator
+    (utils/interventions.py) tries candidate sidewalks, connectors and POIs
+    against the blocks' raw counts and keeps the best score gain per cost.
+    Blocks without raw counts (hex cells, older results) get the below-mean
+    heuristic instead.
     """
-    print("💡 GENERATING RECOMMENDATIONS")
-    print("=" * 60)
+    log.info("💡 GENERATING RECOMMENDATIONS")
 
     if blocks_gdf is None or len(blocks_gdf) == 0:
-        print("⚠️ No blocks to analyze — skipping recommendations.")
+        log.warning("⚠️ No blocks to analyze — skipping recommendations.")
         return gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs="EPSG:4326")
 
+    try:
+        rec_points = simulate_recommendations(blocks_gdf, edges_gdf, nodes_gdf, graph)
+    except ValueError as e:
+        log.info("ℹ️ %s — using the below-mean heuristic", e)
+        return _below_mean_recommendations(blocks_gdf)
+    except Exception as e:
+        log.warning("⚠️ Intervention simulator failed, using the below-mean heuristic: %s", e)
+        return _below_mean_recommendations(blocks_gdf)
+
+    if len(rec_points) == 0:
+        log.info("✅ No candidate intervention improves the score — no major interventions needed.")
+        return gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs=blocks_gdf.crs)
+
+    rec_gdf = gpd.GeoDataFrame(rec_points, geometry="geometry", crs=blocks_gdf.crs)
+    log.info("✅ %s recommendations created (+%.2f mean score)", len(rec_gdf), rec_gdf["impact_estimate"].sum())
+    return rec_gdf
+
+
+def _below_mean_recommendations(blocks_gdf):
+    """
+    Adaptive fallback based on relative walkability.
+    Uses the mean score as a dynamic cutoff so recommendations differ
+    across locations.
+    """
     # dynamic threshold: below mean is "low walkability"
     threshold = blocks_gdf["walkability_score_normalized"].mean()
     low_blocks = blocks_gdf[blocks_gdf["walkability_score_normalized"] < threshold]
@@ -31,9 +62,9 @@ def generate_recommendations(blocks_gdf, edges_gdf):
         })
 
     if len(rec_points) == 0:
-        print("✅ All blocks above-average — no major interventions needed.")
+        log.info("✅ All blocks above-average — no major interventions needed.")
         return gpd.GeoDataFrame(columns=["geometry"], geometry="geometry", crs=blocks_gdf.crs)
 
     rec_gdf = gpd.GeoDataFrame(rec_points, crs=blocks_gdf.crs)
-    print(f"✅ {len(rec_gdf)} recommendations created (cutoff={threshold:.1f})\n")
+    log.info("✅ %s recommendations created (cutoff=%.1f)", len(rec_gdf), threshold)
     return rec_gdf
@@ -0,0 +1,272 @@
+# utils/result_cache.py
+import hashlib
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from utils.instrumentation import get_logger
+from utils.osm_cache import CACHE_DIR, CACHE_VERSION
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+# finished /analyze results kept in memory, most recently used last
+RESULT_CACHE_SLOTS = int(os.environ.get("WALK_RESULT_CACHE_SLOTS", 64))
+# on-disk second level (survives restarts, shared by workers); off unless enabled
+RESULT_CACHE_DISK = os.environ.get("WALK_RESULT_CACHE_DISK", "0").lower() in ("1", "true", "yes")
+RESULT_CACHE_DIR = os.environ.get("WALK_RESULT_CACHE_DIR", os.path.join(CACHE_DIR, "results"))
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("WALK_RESULT_CACHE_MAX_MB", 512)) * 1024 * 1024)
+RESULT_CACHE_TTL_S = float(os.environ.get("WALK_RESULT_CACHE_TTL_S", 24 * 3600))
+# Cache-Control max-age sent with cached responses (browser / CDN reuse)
+RESULT_MAX_AGE_S = int(os.environ.get("WALK_RESULT_MAX_AGE_S", 3600))
+
+# bump whenever the shape of cached values changes
+RESULT_CACHE_VERSION = 2
+
+
+def analysis_version():
+    """
+    Everything besides the location that changes an /analyze result: the
+    scoring version, mode and weights, accessibility blending, block outline
+    simplification, the hex grid, the intervention search, clustering and the OSM
+    cache layout. Part of every result key.
+    """
+    from utils.clustering import CLUSTER_EPS_M, CLUSTER_MIN_SAMPLES, MAX_CLUSTERS
+    from utils.feature_extract import BLOCK_PRECISION_M, BLOCK_SIMPLIFY_M
+    from utils.hexgrid import HEX_FINEST_M, HEX_LEVELS
+    from utils.interventions import CONNECTOR_MAX_M, MAX_RECOMMENDATIONS
+    from utils.pipeline import ACCESSIBILITY, SCORING_MODE
+    from utils.scoring import ACCESSIBILITY_WEIGHT, SCORING_VERSION, WEIGHTS
+
+    config = repr((WEIGHTS, ACCESSIBILITY, ACCESSIBILITY_WEIGHT, BLOCK_SIMPLIFY_M, BLOCK_PRECISION_M, CACHE_VERSION,
+                   SCORING_MODE, HEX_FINEST_M, HEX_LEVELS, MAX_RECOMMENDATIONS, CONNECTOR_MAX_M,
+                   CLUSTER_EPS_M, CLUSTER_MIN_SAMPLES, MAX_CLUSTERS))
+    return f"s{SCORING_VERSION}-{hashlib.sha1(config.encode('utf-8')).hexdigest()[:8]}"
+
+
+def result_key(kind, location_key):
+    """Result cache key: kind ("map" / "point") + normalized place or snapped point key + analysis version."""
+    return f"r{RESULT_CACHE_VERSION}|{kind}|{location_key}|{analysis_version()}"
+
+
+@dataclass
+class CachedResult:
+    key: str
+    value: object
+    created: float
+    # encoded representations by media type, filled lazily by the caller
+    bodies: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def etag(self):
+        """Strong validator of this entry; callers add the media type for per-representation tags."""
+        return hashlib.sha1(f"{self.key}|{self.created!r}".encode("utf-8")).hexdigest()[:20]
+
+    def age_s(self):
+        return time.time() - self.created
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag.strip('"'):
+            return True
+    return False
+
+
+class ResultCache:
+    """
+    Two-level cache of finished /analyze results.
+
+    Level 1 is an in-memory LRU of `slots` entries. Level 2 (optional) is a
+    directory of pickled entries bounded by `max_bytes`, least recently used
+    evicted first; a level-2 hit is promoted to level 1. Entries expire after
+    `ttl_s` in both levels.
+    """
+
+    def __init__(self, slots=RESULT_CACHE_SLOTS, root=RESULT_CACHE_DIR if RESULT_CACHE_DISK else None,
+                 max_bytes=RESULT_CACHE_MAX_BYTES, ttl_s=RESULT_CACHE_TTL_S):
+        self.slots = slots
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "writes": 0,
+                       "evictions": 0, "disk_evictions": 0, "not_modified": 0, "errors": 0}
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _path(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode("utf-8")).hexdigest()[:24] + ".pkl")
+
+    # ----------------------------
+    # Lookup / store
+    # ----------------------------
+    def get(self, key):
+        """The live entry for `key`, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry.age_s() <= self.ttl_s:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry
+            if entry is not None:
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+        entry = self._disk_get(key) if self.root else None
+        if entry is None:
+            self._count("misses")
+            return None
+        self._count("disk_hits")
+        self._remember(entry)
+        return entry
+
+    def put(self, key, value):
+        """Store a freshly computed result and return its entry."""
+        entry = CachedResult(key=key, value=value, created=time.time())
+        self._remember(entry)
+        self._count("writes")
+        if self.root:
+            self._disk_put(entry)
+        return entry
+
+    def _remember(self, entry):
+        with self._lock:
+            self._memory[entry.key] = entry
+            self._memory.move_to_end(entry.key)
+            while len(self._memory) > self.slots:
+                self._memory.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def not_modified(self):
+        """Count a request answered with 304 from a cached entry."""
+        self._count("not_modified")
+
+    # ----------------------------
+    # Disk level
+    # ----------------------------
+    def _disk_get(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, "rb") as fh:
+                stored = pickle.load(fh)
+            if stored["key"] != key:
+                return None
+            if time.time() - stored["created"] > self.ttl_s:
+                self._count("expired")
+                os.remove(path)
+                return None
+        except Exception as e:
+            log.warning("⚠️ Result cache entry for %s unreadable, dropping it: %s", key, e)
+            self._count("errors")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # mtime is the disk LRU clock
+        os.utime(path, None)
+        return CachedResult(key=key, value=stored["value"], created=stored["created"])
+
+    def _disk_put(self, entry):
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        try:
+            with open(tmp, "wb") as fh:
+                pickle.dump({"key": entry.key, "created": entry.created, "value": entry.value}, fh,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(entry.key))
+        except Exception as e:
+            log.warning("⚠️ Could not write result cache entry for %s: %s", entry.key, e)
+            self._count("errors")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self._evict_disk()
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._count("disk_evictions")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.root:
+            for path, _, _ in self._disk_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["slots"] = self.slots
+        stats["disk"] = bool(self.root)
+        if self.root:
+            disk = self._disk_entries()
+            stats["disk_entries"] = len(disk)
+            stats["disk_bytes"] = sum(size for _, _, size in disk)
+            stats["disk_max_bytes"] = self.max_bytes
+        stats["analysis_version"] = analysis_version()
+        return stats
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Process-wide result cache configured from the WALK_RESULT_CACHE_* env vars."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
@@ -0,0 +1,217 @@
+# utils/routing.py
+import heapq
+import os
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+from utils.compact_graph import CompactGraph
+
+EARTH_RADIUS_M = 6_371_009
+
+# edge cost = length * (1 + WALKABILITY_PENALTY * (1 - score/100)):
+# a street in a 0-score block costs (1 + penalty)x its length, a 100-score one just its length
+WALKABILITY_PENALTY = float(os.environ.get("WALK_ROUTE_PENALTY", 1.0))
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres (vectorized over NumPy arrays)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+@dataclass
+class RoutingGraph:
+    """
+    Compact CSR copy of the walk graph: the out-edges of node i are
+    indices[indptr[i]:indptr[i + 1]], with parallel length/cost/score arrays.
+    Nodes are addressed by position; node_ids maps back to OSM ids.
+    """
+    node_ids: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    length: np.ndarray
+    cost: np.ndarray
+    score: np.ndarray
+    # optional ContractionHierarchy over `cost` (utils/contraction.py)
+    ch: Optional[Any] = None
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    def nearest_node(self, lat, lon):
+        """Position of the node closest to (lat, lon)."""
+        return int(np.argmin(haversine_m(lat, lon, self.lat, self.lon)))
+
+    def to_csr(self, weight="cost"):
+        from scipy.sparse import csr_matrix
+
+        data = getattr(self, weight).astype(np.float64)
+        return csr_matrix((data, self.indices, self.indptr), shape=(self.n_nodes, self.n_nodes))
+
+    def edge_position(self, u, v):
+        """CSR slot of edge u → v (positions), or -1."""
+        row = self.indices[self.indptr[u]:self.indptr[u + 1]]
+        hit = np.flatnonzero(row == v)
+        return int(self.indptr[u] + hit[0]) if len(hit) else -1
+
+
+def edge_walkability(edges_gdf, blocks_gdf):
+    """
+    Walkability (0–100, normalized score) of the block each edge runs through;
+    an edge touching several blocks takes the best one. Edges outside every
+    block fall back to the area median.
+    """
+    n = len(edges_gdf)
+    if blocks_gdf is None or len(blocks_gdf) == 0 or "walkability_score_normalized" not in blocks_gdf.columns:
+        return np.full(n, 50.0)
+
+    block_scores = blocks_gdf["walkability_score_normalized"].to_numpy(dtype=float)
+    edges = edges_gdf.to_crs(blocks_gdf.crs) if edges_gdf.crs != blocks_gdf.crs else edges_gdf
+    edge_idx, block_idx = blocks_gdf.sindex.query(edges.geometry, predicate="intersects")
+
+    scores = np.full(n, -np.inf)
+    np.maximum.at(scores, edge_idx, block_scores[block_idx])
+    scores[np.isinf(scores)] = float(np.median(block_scores))
+    return scores
+
+
+def build_routing_graph(nodes_gdf, edges_gdf, blocks_gdf=None, penalty=WALKABILITY_PENALTY, compact=None):
+    """
+    Convert osmnx node/edge GeoDataFrames (+ scored blocks) into a RoutingGraph.
+    Pass the area's CompactGraph as `compact` to reuse its CSR arrays instead
+    of re-deriving them from the edge index.
+    """
+    if compact is None:
+        compact = CompactGraph.from_gdfs(nodes_gdf, edges_gdf)
+
+    u, v = compact.src, compact.indices
+    length = compact.length.astype(float)
+    score = edge_walkability(edges_gdf, blocks_gdf)[compact.edge_row]
+    cost = length * (1 + penalty * (1 - score / 100.0))
+
+    # parallel edges: keep only the cheapest u → v edge
+    order = np.lexsort((cost, v, u))
+    u, v, length, cost, score = u[order], v[order], length[order], cost[order], score[order]
+    first = np.r_[True, (u[1:] != u[:-1]) | (v[1:] != v[:-1])]
+    u, v, length, cost, score = u[first], v[first], length[first], cost[first], score[first]
+
+    indptr = np.zeros(compact.n_nodes + 1, dtype=np.int32)
+    np.cumsum(np.bincount(u, minlength=compact.n_nodes), out=indptr[1:])
+
+    return RoutingGraph(
+        node_ids=compact.node_ids,
+        lat=compact.lat.astype(float),
+        lon=compact.lon.astype(float),
+        indptr=indptr,
+        indices=v.astype(np.int32),
+        length=length.astype(np.float32),
+        cost=cost.astype(np.float32),
+        score=score.astype(np.float32),
+    )
+
+
+def astar(graph, source, target):
+    """
+    A* over the CSR arrays with a haversine heuristic (admissible: every
+    edge costs at least its length). Returns (path positions, cost) or ([], inf).
+    """
+    if source == target:
+        return [source], 0.0
+
+    indptr, indices, cost = graph.indptr, graph.indices, graph.cost
+    # heuristic for every node at once; the search only reads it
+    h = haversine_m(graph.lat[target], graph.lon[target], graph.lat, graph.lon)
+
+    g = {source: 0.0}
+    parent = {source: -1}
+    closed = set()
+    heap = [(h[source], source)]
+    while heap:
+        _, node = heapq.heappop(heap)
+        if node == target:
+            path = [node]
+            while parent[path[-1]] != -1:
+                path.append(parent[path[-1]])
+            return path[::-1], g[target]
+        if node in closed:
+            continue
+        closed.add(node)
+
+        g_node = g[node]
+        for slot in range(indptr[node], indptr[node + 1]):
+            nxt = int(indices[slot])
+            tentative = g_node + float(cost[slot])
+            if tentative < g.get(nxt, np.inf):
+                g[nxt] = tentative
+                parent[nxt] = node
+                heapq.heappush(heap, (tentative + h[nxt], nxt))
+    return [], float("inf")
+
+
+def dijkstra(graph, source, target):
+    """Single-source Dijkstra via scipy.sparse.csgraph (C loop); same return shape as astar."""
+    from scipy.sparse.csgraph import dijkstra as cs_dijkstra
+
+    dist, pred = cs_dijkstra(graph.to_csr(), directed=True, indices=source, return_predecessors=True)
+    if not np.isfinite(dist[target]):
+        return [], float("inf")
+    path = [target]
+    while path[-1] != source:
+        path.append(int(pred[path[-1]]))
+    return path[::-1], float(dist[target])
+
+
+def many_to_many(graph, origins, destinations):
+    """Cost matrix origins x destinations (positions) in one csgraph call."""
+    from scipy.sparse.csgraph import dijkstra as cs_dijkstra
+
+    dist = cs_dijkstra(graph.to_csr(), directed=True, indices=np.asarray(origins))
+    return dist[:, np.asarray(destinations)]
+
+
+def route(graph, from_lat, from_lon, to_lat, to_lon, method="auto"):
+    """
+    Walkability-weighted route between two coordinates, as a JSON-safe dict.
+    method: "astar", "dijkstra", "ch" (needs graph.ch) or "auto" (ch when available, else astar).
+    """
+    source = graph.nearest_node(from_lat, from_lon)
+    target = graph.nearest_node(to_lat, to_lon)
+
+    if method == "auto":
+        method = "ch" if graph.ch is not None else "astar"
+    if method == "ch":
+        if graph.ch is None:
+            raise ValueError("No contraction hierarchy was built for this area")
+        path, total_cost = graph.ch.query(source, target)
+    elif method == "dijkstra":
+        path, total_cost = dijkstra(graph, source, target)
+    else:
+        path, total_cost = astar(graph, source, target)
+    if not path:
+        return {"found": False, "method": method, "message": "No walkable path between these points."}
+
+    slots = [graph.edge_position(a, b) for a, b in zip(path[:-1], path[1:])]
+    lengths = graph.length[slots].astype(float) if slots else np.zeros(0)
+    scores = graph.score[slots].astype(float) if slots else np.zeros(0)
+    distance = float(lengths.sum())
+
+    return {
+        "found": True,
+        "method": method,
+        "distance_m": round(distance, 1),
+        "cost": round(float(total_cost), 1),
+        # length-weighted mean walkability along the route
+        "mean_walkability": round(float((lengths * scores).sum() / distance), 1) if distance > 0 else None,
+        "nodes": [int(graph.node_ids[p]) for p in path],
+        "path": [[float(graph.lat[p]), float(graph.lon[p])] for p in path],
+    }
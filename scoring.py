@@ -1,82 +1,254 @@
 # utils/scoring.py
+import logging
+
 import geopandas as gpd
 import numpy as np
+import pandas as pd
+
+from utils.instrumentation import get_logger
+from utils.projection import area_crs, to_metric
+
+log = get_logger(__name__)
+
+# bump whenever the scores or recommendations produced from the same extract change (keys cached /analyze results)
+SCORING_VERSION = 3
+
+# share of the final score taken by walk-time accessibility, when it is supplied
+ACCESSIBILITY_WEIGHT = 0.2
+
+# per-block feature matrix columns, in weight order
+FEATURES = ("density_score", "intersection_density", "coverage", "amenity_density")
+WEIGHTS = (0.45, 0.25, 0.15, 0.15)
+# raw per-block counts the features are derived from, kept as columns too so
+# what-if deltas (utils/interventions.py) can re-derive features exactly;
+# node_count / poi_count only exist when nodes / POIs were scored
+COUNTS = ("street_length_m", "area_m2", "sidewalk_edges", "node_count", "poi_count")
+# coverage assumed for blocks whose edges carry no sidewalk information
+DEFAULT_COVERAGE = 0.1
+
+
+def _block_hits(blocks_m, geoms):
+    """
+    Bulk spatial join of `geoms` against the block index.
+    Returns (feature_positions, block_positions) for every intersecting pair.
+    """
+    if geoms is None or len(geoms) == 0:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+    feat_idx, block_idx = blocks_m.sindex.query(geoms, predicate="intersects")
+    return feat_idx, block_idx
+
+
+def _to_metric(gdf, crs):
+    """`gdf` in the blocks' metric CRS (unchanged when the pipeline already projected it)."""
+    if gdf is None:
+        return None
+    try:
+        return to_metric(gdf, crs)
+    except Exception:
+        return gdf
+
+
+def _poi_counts(blocks_m, pois_m):
+    if pois_m is None or len(pois_m) == 0 or len(blocks_m) == 0:
+        return np.zeros(len(blocks_m), dtype=np.int64)
+    _, poi_block = _block_hits(blocks_m, pois_m.geometry)
+    return np.bincount(poi_block, minlength=len(blocks_m))
+
+
+def features_from_counts(street_length_m, area_m2, edge_count, sidewalk_edges=None, node_count=None, poi_count=None):
+    """
+    (n, 4) FEATURES matrix from raw per-block counts (arrays). Missing
+    sidewalk information gives DEFAULT_COVERAGE; missing node / POI counts
+    give zero components.
+    """
+    area = np.asarray(area_m2, dtype=float)
+    area = np.where(area > 0, area, 1)
+    edge_count = np.asarray(edge_count, dtype=float)
+
+    # Street density (m/m²), log-normalized so small variations matter
+    density = np.asarray(street_length_m, dtype=float) / area
+    density_score = np.clip(np.log1p(density * 1000), 0, 6) / 6
+
+    # Sidewalk coverage
+    if sidewalk_edges is not None:
+        coverage = np.asarray(sidewalk_edges, dtype=float) / np.maximum(edge_count, 1)
+    else:
+        coverage = np.full(len(area), DEFAULT_COVERAGE)
+
+    intersection_density = np.log1p(np.asarray(node_count, dtype=float)) / 5 if node_count is not None \
+        else np.zeros(len(area))
+    amenity_density = np.log1p(np.asarray(poi_count, dtype=float)) / 5 if poi_count is not None \
+        else np.zeros(len(area))
+    return np.column_stack([density_score, intersection_density, coverage, amenity_density])
+
+
+def compute_block_features(blocks_gdf, edges_gdf, nodes_gdf=None, pois_gdf=None):
+    """
+    Per-block feature matrix (FEATURES columns, plus edge_count and the raw
+    COUNTS it is derived from) aligned with blocks_gdf. Scoring is a weighted
+    sum of the FEATURES columns, so they can be kept and re-weighted without
+    touching the street network again.
+    """
+    crs = area_crs(blocks_gdf)
+    edges_m = _to_metric(edges_gdf, crs)
+    blocks_m = _to_metric(blocks_gdf, crs)
+    nodes_m = _to_metric(nodes_gdf, crs)
+    pois_m = _to_metric(pois_gdf, crs)
+
+    n_blocks = len(blocks_m)
+
+    # ----------------------------
+    # 1️⃣ Street length + sidewalk coverage (one bulk edge → block join)
+    # ----------------------------
+    edge_idx, edge_block = _block_hits(blocks_m, edges_m.geometry)
+    edge_len = edges_m.geometry.length.to_numpy()
+    counts = {
+        "street_length_m": np.bincount(edge_block, weights=edge_len[edge_idx], minlength=n_blocks),
+        "area_m2": blocks_m.geometry.area.to_numpy(),
+    }
+    edge_count = np.bincount(edge_block, minlength=n_blocks)
+    if "has_sidewalk" in edges_m.columns:
+        sidewalk = edges_m["has_sidewalk"].astype(bool).to_numpy()
+        counts["sidewalk_edges"] = np.bincount(edge_block, weights=sidewalk[edge_idx].astype(float), minlength=n_blocks)
+
+    # ----------------------------
+    # 2️⃣ Intersections
+    # ----------------------------
+    if nodes_m is not None and len(nodes_m) > 0:
+        _, node_block = _block_hits(blocks_m, nodes_m.geometry)
+        counts["node_count"] = np.bincount(node_block, minlength=n_blocks)
+
+    # ----------------------------
+    # 3️⃣ POIs
+    # ----------------------------
+    if pois_m is not None:
+        counts["poi_count"] = _poi_counts(blocks_m, pois_m)
 
-def compute_walkability(blocks_gdf, edges_gdf, nodes_gdf=None, pois_gdf=None):
-    print("⚖️ FINAL WALKABILITY COMPUTATION")
-    print("=" * 60)
+    features = pd.DataFrame(features_from_counts(edge_count=edge_count, **counts), columns=list(FEATURES),
+                            index=blocks_gdf.index)
+    features["edge_count"] = edge_count
+    for col, values in counts.items():
+        features[col] = values
+    return features
+
+
+def score_features(features, weights=WEIGHTS, accessibility=None):
+    """
+    Raw walkability scores from a feature matrix: one matrix-vector product.
+    `weights` may also be a (k, 4) matrix, giving an (n_blocks, k) array with
+    one column per weighting (A/B comparisons in a single call).
+    """
+    matrix = features[list(FEATURES)].to_numpy(dtype=float)
+    access = None
+    if accessibility is not None and len(accessibility) == len(matrix):
+        access = accessibility["access_score"].to_numpy(dtype=float)
+    return score_matrix(matrix, features["edge_count"].to_numpy(), weights, access)
+
+
+def score_matrix(matrix, edge_count, weights=WEIGHTS, access_score=None):
+    """score_features on arrays: an (n, 4) FEATURES matrix, edge counts and an optional access_score array."""
+    score = matrix @ np.asarray(weights, dtype=float).T * 100
+
+    # ----------------------------
+    # 4️⃣ Walk-time accessibility (optional)
+    # ----------------------------
+    if access_score is not None:
+        access = access_score[:, None] if score.ndim == 2 else access_score
+        score = (1 - ACCESSIBILITY_WEIGHT) * score + ACCESSIBILITY_WEIGHT * access * 100
+
+    # blocks without any street get a flat zero
+    has_edges = np.asarray(edge_count) > 0
+    return np.where(has_edges[:, None] if score.ndim == 2 else has_edges, score, 0.0)
+
+
+def normalize_scores(score):
+    """Local min-max to 0–100 (unchanged when every block scores the same)."""
+    score = np.asarray(score, dtype=float)
+    if len(score) == 0:
+        return score
+    min_s, max_s = score.min(), score.max()
+    return (score - min_s) / (max_s - min_s) * 100 if max_s > min_s else score
+
+
+def refresh_amenity(blocks_gdf, pois_gdf, changed=None):
+    """
+    Recompute only the amenity_density column of scored blocks after a POI
+    refresh. `changed` (geometries of added/removed POIs) limits the recount
+    to the blocks they touch; without it every block is recounted. Returns a
+    copy of blocks_gdf; call rescore_blocks afterwards.
+    """
+    blocks_gdf = blocks_gdf.copy()
+    crs = area_crs(blocks_gdf)
+    blocks_m = _to_metric(blocks_gdf, crs)
+    pois_m = _to_metric(pois_gdf, crs)
+
+    if changed is not None:
+        changed_m = _to_metric(gpd.GeoSeries(changed, crs=pois_gdf.crs if pois_gdf is not None else "EPSG:4326"), crs)
+        _, affected = _block_hits(blocks_m, changed_m)
+        affected = np.unique(affected)
+    else:
+        affected = np.arange(len(blocks_m))
+
+    pois = _poi_counts(blocks_m.iloc[affected], pois_m)
+    amenity = blocks_gdf["amenity_density"].to_numpy(dtype=float).copy()
+    amenity[affected] = np.log1p(pois) / 5
+    blocks_gdf["amenity_density"] = amenity
+    if "poi_count" in blocks_gdf.columns:
+        poi_count = blocks_gdf["poi_count"].to_numpy().copy()
+        poi_count[affected] = pois
+        blocks_gdf["poi_count"] = poi_count
+    log.info("🔁 Amenity density refreshed for %s/%s blocks", len(affected), len(blocks_gdf))
+    return blocks_gdf
+
+
+def rescore_blocks(blocks_gdf, weights=WEIGHTS):
+    """
+    Re-weight blocks scored by compute_walkability from their stored feature
+    columns, without the street network. A stored access_score is blended in
+    as before.
+    """
+    blocks_gdf = blocks_gdf.copy()
+    access = blocks_gdf[["access_score"]] if "access_score" in blocks_gdf.columns else None
+    score = score_features(blocks_gdf, weights, accessibility=access)
+    blocks_gdf["walkability_score"] = score
+    blocks_gdf["walkability_score_normalized"] = normalize_scores(score)
+    return blocks_gdf
+
+
+def compute_walkability(blocks_gdf, edges_gdf, nodes_gdf=None, pois_gdf=None, accessibility=None,
+                        weights=WEIGHTS):
+    """
+    Score every block from street density, intersection density, sidewalk
+    coverage and POI density. `accessibility` (the frame returned by
+    accessibility.block_accessibility, aligned with blocks_gdf) blends in
+    walk-time POI reachability as an extra component and is copied onto the
+    result. The feature matrix is kept as columns on the result, so
+    rescore_blocks / refresh_amenity can update scores later.
+    """
+    log.info("⚖️ FINAL WALKABILITY COMPUTATION")
 
     if blocks_gdf is None or len(blocks_gdf) == 0:
-        print("⚠️ No blocks found.")
+        log.warning("⚠️ No blocks found.")
         return blocks_gdf
 
     blocks_gdf = blocks_gdf.copy()
-    blocks_gdf["walkability_score"] = 0.0
+    features = compute_block_features(blocks_gdf, edges_gdf, nodes_gdf, pois_gdf)
+    for col in features.columns:
+        blocks_gdf[col] = features[col].to_numpy()
 
-    # Project to meters
-    try:
-        edges_m = edges_gdf.to_crs(epsg=3857)
-        blocks_m = blocks_gdf.to_crs(epsg=3857)
-        nodes_m = nodes_gdf.to_crs(epsg=3857) if nodes_gdf is not None else None
-        pois_m = pois_gdf.to_crs(epsg=3857) if pois_gdf is not None else None
-    except Exception:
-        edges_m, blocks_m, nodes_m, pois_m = edges_gdf, blocks_gdf, nodes_gdf, pois_gdf
-
-    for i, block in blocks_m.iterrows():
-        area = block.geometry.area if block.geometry.area > 0 else 1
-        edges_in = edges_m[edges_m.intersects(block.geometry)]
-        if len(edges_in) == 0:
-            blocks_gdf.at[i, "walkability_score"] = 0
-            continue
-
-        # Street density (m/m²)
-        total_len = edges_in.length.sum()
-        density = total_len / area
-
-        # Log-normalize density so small variations matter
-        density_score = np.clip(np.log1p(density * 1000), 0, 6) / 6
-
-        # Intersection density
-        if nodes_m is not None and len(nodes_m) > 0:
-            n_nodes = len(nodes_m[nodes_m.intersects(block.geometry)])
-            intersection_density = np.log1p(n_nodes) / 5
-        else:
-            intersection_density = 0
-
-        # Sidewalk coverage
-        if "has_sidewalk" in edges_in.columns:
-            coverage = edges_in["has_sidewalk"].astype(bool).mean()
-        else:
-            coverage = 0.1
-
-        # POI density
-        if pois_m is not None and len(pois_m) > 0:
-            pois_in = pois_m[pois_m.intersects(block.geometry)]
-            amenity_density = np.log1p(len(pois_in)) / 5
-        else:
-            amenity_density = 0
-
-        # Combine
-        score = (
-            0.45 * density_score
-            + 0.25 * intersection_density
-            + 0.15 * coverage
-            + 0.15 * amenity_density
-        ) * 100
-
-        blocks_gdf.at[i, "walkability_score"] = score
+    if accessibility is not None and len(accessibility) == len(blocks_gdf):
+        for col in accessibility.columns:
+            blocks_gdf[col] = accessibility[col].to_numpy()
+    else:
+        accessibility = None
 
+    score = score_features(features, weights, accessibility)
+    blocks_gdf["walkability_score"] = score
     # Normalize locally
-    min_s, max_s = blocks_gdf["walkability_score"].min(), blocks_gdf["walkability_score"].max()
-    if max_s > min_s:
-        blocks_gdf["walkability_score_normalized"] = (
-            (blocks_gdf["walkability_score"] - min_s)
-            / (max_s - min_s)
-            * 100
-        )
-    else:
-        blocks_gdf["walkability_score_normalized"] = blocks_gdf["walkability_score"]
+    blocks_gdf["walkability_score_normalized"] = normalize_scores(score)
 
-    print(blocks_gdf[["walkability_score", "walkability_score_normalized"]].describe())
-    print("✅ Walkability scores computed\n")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s", blocks_gdf[["walkability_score", "walkability_score_normalized"]].describe())
+    log.info("✅ Walkability scores computed")
     return blocks_gdf
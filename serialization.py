@@ -0,0 +1,169 @@
+# utils/serialization.py
+import json
+
+import numpy as np
+
+# media types POST /analyze can answer with, in server preference order for "*/*"
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/vnd.apache.arrow.file": ARROW,
+}
+
+
+def simulation_arrays(node_ids, edge_index):
+    """
+    The `simulation` block as typed arrays: OSM node ids (int64) and an
+    (n_edges, 2) int32 array of positions into them. Encoders expand it to
+    the frontend's {"nodes": [...], "edges": [[u_id, v_id], ...]} for JSON.
+    """
+    return {
+        "nodes": np.asarray(node_ids, dtype=np.int64),
+        "edge_index": np.asarray(edge_index, dtype=np.int32).reshape(-1, 2),
+    }
+
+
+def _legacy_simulation(simulation):
+    if isinstance(simulation, dict) and "edge_index" in simulation:
+        nodes = np.asarray(simulation["nodes"])
+        return {"nodes": nodes, "edges": nodes[np.asarray(simulation["edge_index"])]}
+    return simulation
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+def jsonable(response):
+    """Plain-Python copy of an analysis response, in the JSON shape the frontend reads."""
+    response = dict(response)
+    if "simulation" in response:
+        response["simulation"] = _legacy_simulation(response["simulation"])
+    return json.loads(json.dumps(response, default=_default))
+
+
+# ----------------------------
+# Encoders
+# ----------------------------
+def dumps_json(response):
+    """JSON bytes; orjson (NumPy-aware, no intermediate lists) when installed."""
+    response = dict(response)
+    if "simulation" in response:
+        response["simulation"] = _legacy_simulation(response["simulation"])
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(response, default=_default).encode("utf-8")
+    return orjson.dumps(response, default=_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def _packed(arr):
+    arr = np.ascontiguousarray(arr)
+    return {"dtype": arr.dtype.str, "shape": list(arr.shape), "data": arr.tobytes()}
+
+
+def dumps_msgpack(response):
+    """
+    MessagePack with NumPy arrays packed as {"dtype", "shape", "data": raw bytes}
+    (np.frombuffer(data, dtype).reshape(shape) on the client).
+    """
+    import msgpack
+
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return _packed(obj)
+        if isinstance(obj, np.generic):
+            return obj.item()
+        return str(obj)
+
+    return msgpack.packb(response, default=default, use_bin_type=True)
+
+
+def _one_row_list(values):
+    """Wrap an Arrow array as a single list-typed row (no copy of the values)."""
+    import pyarrow as pa
+
+    return pa.ListArray.from_arrays(pa.array([0, len(values)], type=pa.int32()), values)
+
+
+def dumps_arrow(response):
+    """
+    Arrow IPC stream with one record batch of one row. The simulation arrays
+    and recommendation columns are list columns (readable zero-copy by
+    apache-arrow clients); report and clusters are JSON text columns.
+    """
+    import pyarrow as pa
+
+    simulation = response.get("simulation") or {}
+    if "edge_index" not in simulation:
+        # networkx fallback path: lists of ids
+        nodes = np.asarray(simulation.get("nodes", []), dtype=np.int64)
+        pos = {n: i for i, n in enumerate(nodes.tolist())}
+        edge_index = np.array([[pos[u], pos[v]] for u, v in simulation.get("edges", [])], dtype=np.int32)
+        simulation = simulation_arrays(nodes, edge_index)
+
+    edge_index = np.ascontiguousarray(simulation["edge_index"], dtype=np.int32)
+    columns = {
+        "simulation_nodes": _one_row_list(pa.array(simulation["nodes"], type=pa.int64())),
+        "simulation_edge_index": _one_row_list(pa.FixedSizeListArray.from_arrays(pa.array(edge_index.ravel()), 2)),
+    }
+
+    recs = response.get("recommendations") or []
+    try:
+        columns["recommendations"] = _one_row_list(pa.array(recs))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        columns["recommendations"] = pa.array([json.dumps(recs, default=_default)])
+    for key in ("clusters", "report"):
+        columns[key] = pa.array([json.dumps(response.get(key), default=_default)])
+
+    batch = pa.RecordBatch.from_pydict(columns)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {JSON: dumps_json, MSGPACK: dumps_msgpack, ARROW: dumps_arrow}
+
+
+def _available(media_type):
+    module = {MSGPACK: "msgpack", ARROW: "pyarrow"}.get(media_type)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def negotiate(accept):
+    """Pick the response media type for an Accept header (q-values honoured; JSON when nothing else fits)."""
+    choices = []
+    for i, part in enumerate((accept or "").split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        media = MEDIA_ALIASES.get(fields[0].lower(), fields[0].lower())
+        q = 1.0
+        for f in fields[1:]:
+            if f.startswith("q="):
+                try:
+                    q = float(f[2:])
+                except ValueError:
+                    q = 0.0
+        if media in ENCODERS and q > 0 and _available(media):
+            choices.append((-q, i, media))
+    return min(choices)[2] if choices else JSON
+
+
+def encode_response(response, accept=None):
+    """(body bytes, media type) for an analysis response under content negotiation."""
+    media_type = negotiate(accept)
+    return ENCODERS[media_type](response), media_type
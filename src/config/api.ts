@@ -13,6 +13,8 @@ export const API_CONFIG = {
     ANALYZE_POST: "/analyze",   // POST → Analysis JSON
     ANALYZE_GET: "/analyze",    // GET → Map preview HTML
     HEALTH: "/health",
+    TILES: "/tiles/{z}/{x}/{y}", // GET → simplified GeoJSON per map tile (?format=mvt for vector tiles)
+    HEX: "/hex",                 // GET → hex cells in a bbox (?west&south&east&north&zoom or &res)
   },
 };
 
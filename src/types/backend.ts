@@ -6,8 +6,18 @@
 export interface BackendCluster {
   id: number;
   name: string;
+  description: string;
   risk_level: string; // "High" | "Medium" | "Low"
-  coordinates: [number, number]; // [lat, lon]
+  severity: "high" | "medium" | "low";
+  coordinates: [number, number]; // [lat, lon] of the cluster centroid
+  lat: number;
+  lon: number;
+  size: number; // recommendations in the cluster
+  impact: number; // summed mean-score gain of its recommendations
+  score_gain: number;
+  cost: number;
+  actions: Record<string, number>; // recommendations per action_type
+  walkability_score_normalized?: number; // mean of the blocks under the cluster
 }
 
 export interface BackendAnalysisResponse {
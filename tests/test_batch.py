@@ -0,0 +1,35 @@
+# tests/test_batch.py
+import os
+import sys
+
+import geopandas as gpd
+from shapely.geometry import box
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import _write_parquet, merge_outputs  # noqa: E402
+from utils.projection import local_crs, to_wgs84  # noqa: E402
+
+
+def _shard_blocks(shard_id, n):
+    """A shard's blocks as run_shard writes them: scored in the local UTM zone, output in WGS84."""
+    crs = local_crs(77.59, 12.97)
+    blocks = gpd.GeoDataFrame({"walkability_score": [50.0] * n},
+                              geometry=[box(778000 + 100 * i, 1435000, 778080 + 100 * i, 1435080) for i in range(n)],
+                              crs=crs)
+    return to_wgs84(blocks).assign(shard=shard_id)
+
+
+def test_merge_with_empty_shard(tmp_path):
+    os.makedirs(tmp_path / "blocks")
+    shards = {"cell-000-000": 3, "cell-000-001": 0, "cell-000-002": 2}
+    for shard_id, n in shards.items():
+        _write_parquet(_shard_blocks(shard_id, n), str(tmp_path / "blocks" / f"{shard_id}.parquet"))
+
+    assert gpd.read_parquet(tmp_path / "blocks" / "cell-000-001.parquet").crs == "EPSG:4326"
+    path = merge_outputs(str(tmp_path), list(shards))
+    merged = gpd.read_parquet(path)
+    assert merged.crs == "EPSG:4326"
+    assert len(merged) == 5
+    assert sorted(merged["shard"].unique()) == ["cell-000-000", "cell-000-002"]
+    assert merged.total_bounds[0] > 77 and merged.total_bounds[3] < 13
@@ -0,0 +1,56 @@
+# utils/tiles.py
+import math
+import os
+
+# z14 tiles are ~2.4 km wide at the equator, so a 2 km window touches 3x3 or 4x4 of them
+TILE_ZOOM = int(os.environ.get("WALK_TILE_ZOOM", 14))
+
+EARTH_RADIUS_M = 6_371_009
+MAX_LAT = 85.05112878
+# half the width of the EPSG:3857 world square, in metres
+MERCATOR_HALF_WORLD = 20037508.342789244
+
+
+def lonlat_to_tile(lon, lat, zoom=TILE_ZOOM):
+    """Web-mercator (slippy map) tile containing a lon/lat point."""
+    lat = max(min(lat, MAX_LAT), -MAX_LAT)
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_r = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_r)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, zoom=TILE_ZOOM):
+    """(west, south, east, north) of a tile in degrees."""
+    n = 2 ** zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def tile_bounds_mercator(x, y, zoom=TILE_ZOOM):
+    """(west, south, east, north) of a tile in EPSG:3857 metres."""
+    size = 2 * MERCATOR_HALF_WORLD / 2 ** zoom
+    west = -MERCATOR_HALF_WORLD + x * size
+    north = MERCATOR_HALF_WORLD - y * size
+    return west, north - size, west + size, north
+
+
+def tiles_for_bbox(west, south, east, north, zoom=TILE_ZOOM):
+    """All tiles (x, y) intersecting a lon/lat bounding box."""
+    x0, y0 = lonlat_to_tile(west, north, zoom)
+    x1, y1 = lonlat_to_tile(east, south, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def point_window(lat, lon, dist_m):
+    """
+    (west, south, east, north) of the square window `dist_m` around a point —
+    the same box ox.graph_from_point(dist=...) uses with dist_type="bbox".
+    """
+    delta_lat = math.degrees(dist_m / EARTH_RADIUS_M)
+    delta_lon = delta_lat / max(math.cos(math.radians(lat)), 1e-6)
+    return lon - delta_lon, lat - delta_lat, lon + delta_lon, lat + delta_lat
@@ -0,0 +1,346 @@
+# utils/vector_tiles.py
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from utils.instrumentation import get_logger
+from utils.osm_cache import CACHE_DIR
+from utils.projection import wgs84_bounds
+from utils.tiles import MERCATOR_HALF_WORLD, tile_bounds_mercator
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+LAYER_DIR = os.environ.get("WALK_TILE_LAYER_DIR", os.path.join(CACHE_DIR, "layers"))
+# analysed areas whose layers are kept decoded in memory
+LAYER_MEMORY_SLOTS = int(os.environ.get("WALK_TILE_LAYER_SLOTS", 16))
+LAYER_MAX_BYTES = int(float(os.environ.get("WALK_TILE_LAYER_MAX_MB", 512)) * 1024 * 1024)
+# geometry simplification tolerance, in screen pixels at the requested zoom
+SIMPLIFY_PX = float(os.environ.get("WALK_TILE_SIMPLIFY_PX", 1.0))
+# features are clipped to the tile plus this margin so polygon edges do not show at tile seams
+CLIP_BUFFER_PX = 8
+EXTENT = 4096
+MIN_ZOOM = 10
+# street edges are only drawn once individual streets are distinguishable
+EDGE_MIN_ZOOM = 15
+
+# properties shipped per layer (everything else stays server-side)
+LAYER_PROPERTIES = {
+    "blocks": ["walkability_score", "walkability_score_normalized"],
+    "edges": ["has_sidewalk", "walk_class"],
+    "recommendations": ["action_type", "description", "priority", "impact_estimate", "cost_class"],
+}
+
+
+def _pixel_m(z):
+    return 2 * MERCATOR_HALF_WORLD / (256 * 2 ** z)
+
+
+def _json_value(v):
+    if isinstance(v, (np.integer,)):
+        return int(v)
+    if isinstance(v, (np.floating, float)):
+        return None if not np.isfinite(v) else round(float(v), 2)
+    if isinstance(v, (np.bool_,)):
+        return bool(v)
+    return v if v is None or isinstance(v, (int, str, bool)) else str(v)
+
+
+class TileLayerStore:
+    """
+    Blocks / edges / recommendations of analysed areas, served as map tiles.
+
+    Every analysis saves its layers under root/<digest>/ (GeoParquet in
+    EPSG:3857 + meta.json with the area's bounds). A tile request loads the
+    areas overlapping it (kept in a small in-memory LRU with spatial indexes),
+    clips to the tile, simplifies by zoom and quantizes coordinates. Where
+    areas overlap, the most recently analysed one wins. The least recently
+    drawn areas are evicted once the store outgrows max_bytes.
+    """
+
+    def __init__(self, root=LAYER_DIR, memory_slots=LAYER_MEMORY_SLOTS, max_bytes=LAYER_MAX_BYTES):
+        self.root = root
+        self.memory_slots = memory_slots
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._index = None
+        self._index_mtime = None
+        self._stats = {"tiles": 0, "empty_tiles": 0, "saves": 0, "skipped_saves": 0, "evictions": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    # ----------------------------
+    # Writing
+    # ----------------------------
+    def save(self, key, blocks=None, edges=None, recommendations=None, version=None):
+        """
+        Store an area's layers (any may be None) under `key`, replacing a
+        previous save. `version` names what the layers were computed from;
+        when the stored layers carry the same version nothing is written.
+        """
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]
+        final = os.path.join(self.root, digest)
+        meta_path = os.path.join(final, "meta.json")
+        if version is not None:
+            try:
+                with open(meta_path, "r", encoding="utf-8") as fh:
+                    current = json.load(fh).get("version") == version
+                if current:
+                    os.utime(meta_path, None)
+                    with self._lock:
+                        self._stats["skipped_saves"] += 1
+                    return
+            except (OSError, ValueError):
+                pass
+        tmp = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        layers = {"blocks": blocks, "edges": edges, "recommendations": recommendations}
+        try:
+            os.makedirs(tmp)
+            bounds = None
+            for name, gdf in layers.items():
+                if gdf is None or len(gdf) == 0 or gdf.crs is None:
+                    continue
+                cols = [c for c in LAYER_PROPERTIES[name] if c in gdf.columns]
+                layer = gpd.GeoDataFrame(gdf[cols].reset_index(drop=True), geometry=gdf.geometry.to_numpy(), crs=gdf.crs)
+                layer = layer[layer.geometry.notna() & ~layer.geometry.is_empty].to_crs(epsg=3857)
+                if "walk_class" in layer.columns:
+                    layer["walk_class"] = layer["walk_class"].astype(str)
+                layer.to_parquet(os.path.join(tmp, f"{name}.parquet"))
+                b = layer.total_bounds
+                bounds = b if bounds is None else [min(bounds[0], b[0]), min(bounds[1], b[1]),
+                                                   max(bounds[2], b[2]), max(bounds[3], b[3])]
+            if bounds is None:
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+                json.dump({"key": key, "version": version, "created": time.time(),
+                           "bounds": [float(v) for v in bounds]}, fh)
+            # swap in the new directory first and delete the old one after, so readers never see the area missing
+            aside = os.path.join(self.root, f".old-{uuid.uuid4().hex}")
+            try:
+                os.rename(final, aside)
+            except OSError:
+                aside = None
+            os.replace(tmp, final)
+            if aside is not None:
+                shutil.rmtree(aside, ignore_errors=True)
+        except Exception as e:
+            log.warning("⚠️ Could not save tile layers for %s: %s", key, e)
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        with self._lock:
+            self._forget(final)
+            self._stats["saves"] += 1
+        self.evict()
+
+    def _entries(self):
+        """[(path, last_drawn, size_bytes)] for every complete area."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            meta = os.path.join(path, "meta.json")
+            if name.startswith(".") or not os.path.isfile(meta):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((path, os.path.getmtime(meta), size))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """Drop least-recently-drawn areas until the store fits in max_bytes."""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self._forget(path)
+                self._stats["evictions"] += 1
+
+    # ----------------------------
+    # Reading
+    # ----------------------------
+    def _areas(self):
+        """[(path, created, bounds_3857)] newest first; re-scanned when the root directory changes."""
+        mtime = os.stat(self.root).st_mtime
+        with self._lock:
+            if self._index is not None and self._index_mtime == mtime:
+                return self._index
+        areas = []
+        for name in os.listdir(self.root):
+            meta_path = os.path.join(self.root, name, "meta.json")
+            if name.startswith(".") or not os.path.isfile(meta_path):
+                continue
+            try:
+                with open(meta_path, "r", encoding="utf-8") as fh:
+                    meta = json.load(fh)
+                areas.append((os.path.join(self.root, name), meta["created"], tuple(meta["bounds"])))
+            except (OSError, ValueError, KeyError):
+                continue
+        areas.sort(key=lambda a: a[1], reverse=True)
+        with self._lock:
+            self._index, self._index_mtime = areas, mtime
+        return areas
+
+    def _forget(self, path):
+        """Drop every decoded copy of an area directory (caller holds the lock)."""
+        for key in [k for k in self._memory if k[0] == path]:
+            del self._memory[key]
+
+    def _layers(self, path):
+        # meta.json mtime is the eviction clock
+        os.utime(os.path.join(path, "meta.json"), None)
+        # keyed by the directory's inode too: a save in another worker process swaps in a new directory
+        key = (path, os.stat(path).st_ino)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        layers = {}
+        for name in LAYER_PROPERTIES:
+            file = os.path.join(path, f"{name}.parquet")
+            if os.path.isfile(file):
+                layers[name] = gpd.read_parquet(file)
+                layers[name].sindex  # build once, reused by every tile
+        with self._lock:
+            self._forget(path)
+            self._memory[key] = layers
+            while len(self._memory) > self.memory_slots:
+                self._memory.popitem(last=False)
+        return layers
+
+    def _tile_features(self, z, x, y):
+        """{layer: (geometries in EPSG:3857, property dicts)} for one tile."""
+        west, south, east, north = tile_bounds_mercator(x, y, z)
+        margin = CLIP_BUFFER_PX * _pixel_m(z)
+        clip_box = shapely.box(west - margin, south - margin, east + margin, north + margin)
+        tolerance = SIMPLIFY_PX * _pixel_m(z)
+        min_area = _pixel_m(z) ** 2
+
+        out = {name: ([], []) for name in LAYER_PROPERTIES}
+        claimed = []  # bounds of newer areas already drawn into this tile
+        for path, _, bounds in self._areas():
+            if bounds[0] > clip_box.bounds[2] or bounds[2] < clip_box.bounds[0] \
+                    or bounds[1] > clip_box.bounds[3] or bounds[3] < clip_box.bounds[1]:
+                continue
+            try:
+                area_layers = self._layers(path)
+            except OSError:
+                # evicted or replaced since the index was read
+                continue
+            for name, layer in area_layers.items():
+                if name == "edges" and z < EDGE_MIN_ZOOM:
+                    continue
+                hits = layer.sindex.query(clip_box, predicate="intersects")
+                if len(hits) == 0:
+                    continue
+                rows = layer.iloc[np.sort(hits)]
+                geoms = rows.geometry.to_numpy()
+                if claimed:
+                    anchor = shapely.point_on_surface(geoms)
+                    taken = np.zeros(len(geoms), dtype=bool)
+                    for b in claimed:
+                        taken |= shapely.contains_xy(shapely.box(*b), shapely.get_x(anchor), shapely.get_y(anchor))
+                    rows, geoms = rows[~taken], geoms[~taken]
+                geoms = shapely.clip_by_rect(geoms, *clip_box.bounds)
+                geoms = shapely.simplify(geoms, tolerance, preserve_topology=name == "blocks")
+                keep = ~shapely.is_empty(geoms)
+                if name == "blocks":
+                    keep &= shapely.area(geoms) >= min_area
+                attrs = rows.drop(columns=rows.geometry.name)
+                # (to_dict gives no records at all for a frame without columns)
+                props = attrs.to_dict("records") if len(attrs.columns) else [{}] * len(rows)
+                out[name][0].extend(geoms[keep])
+                out[name][1].extend(p for p, k in zip(props, keep) if k)
+            claimed.append(bounds)
+        return out
+
+    def tile_geojson(self, z, x, y):
+        """One tile as a GeoJSON FeatureCollection (lon/lat rounded to the tile's resolution), as text."""
+        features = self._tile_features(z, x, y) if z >= MIN_ZOOM else {}
+        # coordinates rounded to ~1/EXTENT of the tile width
+        decimals = max(0, math.ceil(math.log10(2 ** z * EXTENT / 360.0)))
+        parts = []
+        for name, (geoms, props) in features.items():
+            if not geoms:
+                continue
+            geoms = gpd.GeoSeries(geoms, crs="EPSG:3857").to_crs(epsg=4326).to_numpy()
+            geoms = shapely.transform(geoms, lambda c: np.round(c, decimals))
+            for text, p in zip(shapely.to_geojson(geoms), props):
+                p = {k: _json_value(v) for k, v in p.items()}
+                p["layer"] = name
+                parts.append(f'{{"type":"Feature","geometry":{text},"properties":{json.dumps(p)}}}')
+        self._count(len(parts))
+        return '{"type":"FeatureCollection","features":[' + ",".join(parts) + "]}"
+
+    def tile_mvt(self, z, x, y):
+        """One tile as a Mapbox Vector Tile (needs the optional mapbox-vector-tile package)."""
+        try:
+            import mapbox_vector_tile
+        except ImportError as e:
+            raise RuntimeError("MVT output needs the mapbox-vector-tile package") from e
+
+        features = self._tile_features(z, x, y) if z >= MIN_ZOOM else {}
+        layers = []
+        for name, (geoms, props) in features.items():
+            if geoms:
+                layers.append({
+                    "name": name,
+                    "features": [{"geometry": g, "properties": {k: _json_value(v) for k, v in p.items()}}
+                                 for g, p in zip(geoms, props)],
+                })
+        self._count(sum(len(layer["features"]) for layer in layers))
+        return mapbox_vector_tile.encode(layers, default_options={
+            "quantize_bounds": tile_bounds_mercator(x, y, z),
+            "extents": EXTENT,
+        })
+
+    def _count(self, n_features):
+        with self._lock:
+            self._stats["tiles"] += 1
+            self._stats["empty_tiles"] += n_features == 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["areas_in_memory"] = len(self._memory)
+        entries = self._entries()
+        stats["areas"] = len(entries)
+        stats["size_bytes"] = sum(size for _, _, size in entries)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+def area_key(edges_gdf):
+    """Layer key of an analysed area: its street-network extent (re-analysing it replaces the layers)."""
+    west, south, east, north = wgs84_bounds(edges_gdf)
+    return f"area:{west:.4f},{south:.4f},{east:.4f},{north:.4f}"
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_tile_store():
+    """Process-wide TileLayerStore configured from the WALK_TILE_* env vars."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TileLayerStore()
+        return _store
@@ -2,13 +2,18 @@
 import folium
 import geopandas as gpd
 
+from utils.instrumentation import get_logger
+from utils.projection import to_wgs84
+
+log = get_logger(__name__)
+
+
 def generate_walkability_map(blocks_gdf, edges_gdf, rec_gdf=None):
     """
     Build a folium map HTML representation from blocks (polygons), edges (lines) and rec_gdf (points).
     Returns an HTML string (m._repr_html_()).
     """
-    print("🗺️ GENERATING INTERACTIVE MAP")
-    print("=" * 60)
+    log.info("🗺️ GENERATING INTERACTIVE MAP")
 
     # handle empties
     if edges_gdf is None or len(edges_gdf) == 0:
@@ -18,19 +23,19 @@ def generate_walkability_map(blocks_gdf, edges_gdf, rec_gdf=None):
 
     # ensure CRS and project to 4326 for folium
     try:
-        edges_viz = edges_gdf.to_crs(epsg=4326)
+        edges_viz = to_wgs84(edges_gdf)
     except Exception:
         edges_viz = edges_gdf.copy()
 
     try:
-        blocks_viz = blocks_gdf.to_crs(epsg=4326) if (blocks_gdf is not None and len(blocks_gdf) > 0) else None
+        blocks_viz = to_wgs84(blocks_gdf) if (blocks_gdf is not None and len(blocks_gdf) > 0) else None
     except Exception:
         blocks_viz = blocks_gdf
 
     rec_viz = None
     if rec_gdf is not None and len(rec_gdf) > 0:
         try:
-            rec_viz = rec_gdf.to_crs(epsg=4326)
+            rec_viz = to_wgs84(rec_gdf)
         except Exception:
             rec_viz = rec_gdf
 
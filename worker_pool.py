@@ -0,0 +1,134 @@
+# utils/worker_pool.py
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.instrumentation import METRICS, get_logger, run_traced
+
+log = get_logger(__name__)
+
+# ----------------------------
+# Configuration (env overridable)
+# ----------------------------
+# 0 workers → run in the event loop's default thread pool (dev / debugging)
+POOL_WORKERS = int(os.environ.get("WALK_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+# computations allowed to wait for a free worker before new ones are rejected
+POOL_MAX_QUEUE = int(os.environ.get("WALK_POOL_MAX_QUEUE", 16))
+
+
+class PoolSaturated(RuntimeError):
+    """Raised when the pool is at its queue-depth limit; callers should answer 503."""
+
+
+class AnalysisPool:
+    """
+    Runs pipeline calls off the event loop in a process pool.
+
+    - Admission control: at most workers + max_queue distinct computations
+      are in flight; anything beyond that raises PoolSaturated immediately.
+    - Coalescing: a call whose key matches an in-flight computation awaits
+      that computation instead of starting a new one.
+    - Tracing: every call runs under instrumentation.run_traced; its stage
+      spans are recorded in METRICS here, in the server process.
+    - Recovery: a worker dying breaks the whole ProcessPoolExecutor; the
+      broken pool is replaced and each call it failed is retried once.
+    """
+
+    def __init__(self, workers=POOL_WORKERS, max_queue=POOL_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._inflight = {}
+        self._stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0, "restarts": 0}
+
+    @property
+    def capacity(self):
+        return max(self.workers, 1) + self.max_queue
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            # spawn: forking a process that already runs an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _reset_executor(self, broken):
+        """Drop a broken executor; the next call starts a fresh pool."""
+        if broken is not None and self._executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._stats["restarts"] += 1
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, run_traced, fn, *args)
+            except BrokenProcessPool as e:
+                self._reset_executor(executor)
+                if attempt:
+                    raise
+                log.warning("⚠️ Worker pool broke during %s (%s); retrying on a fresh pool",
+                            getattr(fn, "__name__", "call"), e)
+
+    def _finished(self, key, task, fut):
+        self._inflight.pop(key, None)
+        if fut.cancelled() or fut.exception() is not None:
+            self._stats["failed"] += 1
+        else:
+            self._stats["completed"] += 1
+            METRICS.observe_spans(task, fut.result()[1])
+
+    def submit(self, key, fn, *args):
+        """
+        Schedule fn(*args) and return an asyncio future of (result, spans),
+        reusing the in-flight one for `key` if there is one. Raises
+        PoolSaturated when full. Must be called from the event loop.
+        """
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self._stats["coalesced"] += 1
+            return fut
+
+        if len(self._inflight) >= self.capacity:
+            self._stats["rejected"] += 1
+            raise PoolSaturated(
+                f"Analysis queue is full ({len(self._inflight)} in flight). Try again shortly."
+            )
+        fut = asyncio.ensure_future(self._call(fn, *args))
+        self._inflight[key] = fut
+        self._stats["submitted"] += 1
+        task = getattr(fn, "__name__", "call")
+        fut.add_done_callback(lambda f, k=key, t=task: self._finished(k, t, f))
+        return fut
+
+    async def run(self, key, fn, *args):
+        """Run fn(*args) in the pool, sharing the result with concurrent callers of the same key."""
+        result, _ = await self.run_traced(key, fn, *args)
+        return result
+
+    async def run_traced(self, key, fn, *args):
+        """Like run(), returning (result, stage spans) — see instrumentation.run_traced."""
+        fut = self.submit(key, fn, *args)
+        # shield: one client disconnecting must not cancel the work other callers await
+        return await asyncio.shield(fut)
+
+    def stats(self):
+        return {
+            **self._stats,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": len(self._inflight),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None